@@ -6,6 +6,9 @@ module conv2d
 )(
     input logic [0:0] clk_i,
     input logic [0:0] rstn_i,
+    // line width in effect, at most DEPTH_P; change it only while no token is in flight, and
+    // at least a cycle before the next one comes in
+    input logic [$clog2(DEPTH_P+1)-1:0] depth_i,
     input logic [0:0] valid_i,
     input logic [0:0] ready_i,
     input logic [WIDTH_P-1:0] data_i,
@@ -18,14 +21,27 @@ module conv2d
     logic [0:0] line_valid;
     logic [0:0] sobel_ready;
 
+    // rows m-2*depth_i and m-depth_i of token m, out of a ram sized for DEPTH_P
+    localparam DELAY_W = $clog2(2*DEPTH_P);
+
+    logic [DELAY_W-1:0] line_delay;
+    logic [DELAY_W-1:0] row_delay;
+
+    // registered, so the line buffer's restart compare has no subtract in front of it
+    always_ff @(posedge clk_i) begin
+        line_delay <= {depth_i, 1'b0} - 1'b1;
+        row_delay <= depth_i - 1'b1;
+    end
+
     ramdelaybuffer #(
         .WIDTH_P(WIDTH_P),
-        .DELAY_P(2*DEPTH_P-1),
-        .DELAY_A_P(2*DEPTH_P-1),
-        .DELAY_B_P(DEPTH_P-1)
+        .DELAY_P(2*DEPTH_P-1)
     ) line_buffer (
         .clk_i(clk_i),
         .rstn_i(rstn_i),
+        .delay_i(line_delay),
+        .delay_a_i(line_delay),
+        .delay_b_i(row_delay),
         .valid_i(valid_i),
         .ready_i(sobel_ready),
         .valid_o(line_valid),
@@ -0,0 +1,72 @@
+`timescale 1ns/1ps
+
+// testbench only: conv2d_box between a stream_source and a stream_sink, so a whole stream runs
+// inside the simulator (make FAST=1); the sink records {gx_o, gy_o}
+module conv2d_box_fast
+#(
+    parameter WIDTH_P = 8,
+    parameter DEPTH_P = 16,
+    parameter TOKENS_P = 1 << 19
+)(
+    input logic [0:0] clk_i,
+    input logic [0:0] rstn_i,
+    input logic [$clog2(DEPTH_P+1)-1:0] depth_i,
+    input logic [0:0] load_i,
+    input logic [31:0] in_count_i,
+    input logic [31:0] out_count_i,
+    output logic [31:0] sent_o,
+    output logic [31:0] received_o,
+    output logic [0:0] done_o
+);
+    logic [0:0] valid_i;
+    logic [0:0] ready_o;
+    logic [WIDTH_P-1:0] data_i;
+    logic [0:0] valid_o;
+    logic [0:0] ready_i;
+    logic signed [(2*WIDTH_P)-1:0] gx_o;
+    logic signed [(2*WIDTH_P)-1:0] gy_o;
+
+    stream_source #(
+        .WIDTH_P(WIDTH_P),
+        .DEPTH_P(TOKENS_P)
+    ) source (
+        .clk_i(clk_i),
+        .load_i(load_i),
+        .count_i(in_count_i),
+        .valid_o(valid_i),
+        .ready_i(ready_o),
+        .data_o(data_i),
+        .sent_o(sent_o)
+    );
+
+    conv2d_box #(
+        .WIDTH_P(WIDTH_P),
+        .DEPTH_P(DEPTH_P)
+    ) dut (
+        .clk_i(clk_i),
+        .rstn_i(rstn_i),
+        .depth_i(depth_i),
+        .valid_i(valid_i),
+        .ready_i(ready_i),
+        .data_i(data_i),
+        .valid_o(valid_o),
+        .ready_o(ready_o),
+        .gx_o(gx_o),
+        .gy_o(gy_o)
+    );
+
+    stream_sink #(
+        .WIDTH_P(4*WIDTH_P),
+        .DEPTH_P(TOKENS_P)
+    ) sink (
+        .clk_i(clk_i),
+        .load_i(load_i),
+        .count_i(out_count_i),
+        .valid_i(valid_o),
+        .ready_o(ready_i),
+        .data_i({gx_o, gy_o}),
+        .received_o(received_o),
+        .done_o(done_o)
+    );
+
+endmodule
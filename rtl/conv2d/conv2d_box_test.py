@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 import cv2 as cv
@@ -7,133 +8,74 @@ import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import FallingEdge, Timer
 
+import sobel_model
+from handshake import Driver, Monitor, Replay, Scoreboard, run_until, stride
+
 CLOCK_PERIOD_NS = 10
+# 1: the expected outputs of a stream come from one vectorized correlation before it is sent,
+# 0: from a line buffer model fed as the tokens are accepted
+PRECOMPUTE = os.environ.get("PRECOMPUTE", "1") == "1"
+# 1: the top is conv2d_box_fast and whole streams run inside the simulator,
+# 0: python drives conv2d_box cycle by cycle
+FAST = os.environ.get("FAST", "0") == "1"
 
 
 class ModelManager:
-    kernel = np.array([[1, 2, 1], [2, 4, 2], [1, 2, 1]], dtype=np.int32)
-
-    def __init__(self, dut):
-        self.width = int(dut.DEPTH_P.value)
-        self.buffer = np.full((3, self.width), np.nan)
+    # gx_o is registered on the output handshake, so output n carries the blur of input n-1 on
+    # both gx_o and gy_o; None while that window still reaches before the stream
+    def __init__(self, width):
+        self.width = width
+        self.line = sobel_model.LineBuffer(width, sobel_model.BOX_KERNEL)
+        self.last = None
 
     def run(self, input_data):
-        flat = np.roll(self.buffer.flatten(), -1)
-        flat[-1] = int(input_data)
-        self.buffer = flat.reshape(self.buffer.shape)
-
-        window = self.buffer[:, -3:]
-        if np.isnan(window).any():
-            return None
-
-        return int(np.sum(window * self.kernel) // 16)
-
-
-class InputManager:
-    def __init__(self, stream):
-        self.data = list(np.asarray(stream).flatten())
-        self.index = 0
-        self.valid = False
-        self.current = None
-
-    def drive(self, handshake):
-        if not self.valid and self.index < len(self.data):
-            self.current = int(self.data[self.index])
-            self.valid = True
-        handshake.drive(self.valid, self.current if self.valid else 0)
-
-    def accept(self):
-        if self.valid:
-            self.index += 1
-            self.valid = False
-            return self.current
-        return None
+        last = self.last
+        total = self.line.push(input_data)
+        self.last = None if total is None else (total[0] >> 4,) * 2
+        return last
 
-
-class ScoreManager:
-    def __init__(self, model):
-        self.model = model
-        self.pending = []
-        self.outputs_received = 0
-        self.pipeline_delay = 0
-
-    def update_expected(self, input_data):
-        expected = self.model.run(input_data)
-        if expected is not None:
-            self.pending.append(expected)
-
-    def check_output(self, output):
-        if output is None:
-            return False
-
-        self.outputs_received += 1
-        if self.outputs_received <= self.pipeline_delay or not self.pending:
-            return False
-
-        gx_out, gy_out = output
-        expected = self.pending.pop(0)
-        assert int(gx_out) == int(expected), f"Mismatch gx: got {int(gx_out)} expected {int(expected)}"
-        assert int(gy_out) == int(expected), f"Mismatch gy: got {int(gy_out)} expected {int(expected)}"
-        return True
+    def expected(self, stream):
+        blur = sobel_model.correlate_frame(stream, self.width, sobel_model.BOX_KERNEL)
+        return [None] + [None if total is None else (total >> 4,) * 2 for total in blur[:-1]]
 
 
 class TestManager:
-    def __init__(self, dut, stream):
-        self.handshake = HandshakeManager(dut)
-        self.input = InputManager(stream)
-        self.scoreboard = ScoreManager(ModelManager(dut))
+    def __init__(self, dut, stream, in_stride=1, out_stride=1):
+        self.dut = dut
         height, width = np.asarray(stream).shape
-        self.expected_outputs = max(0, (height - 2) * (width - 2))
-        self.checked = 0
-        self.in_stride = 1
-        self.out_stride = 1
+        self.tokens = np.asarray(stream).ravel()
+        # the stream's width goes to depth_i, so any width up to DEPTH_P works
+        self.width = width
+        self.model = ModelManager(width)
+        # conv2d_box passes one token per token, so output n pairs with expected n
+        self.scoreboard = Scoreboard("(gx_o, gy_o)", self.model.expected(self.tokens) if PRECOMPUTE else ())
+        self.patterns = (stride(in_stride), stride(out_stride))
+        # every token comes out, so the line buffers are drained when run() returns
+        self.expected_outputs = height * width
+
+    def accept(self, token):
+        if not PRECOMPUTE:
+            self.scoreboard.expect(self.model.run(token))
 
     async def run(self):
-        try:
-            self.input.drive(self.handshake)
-            cycle = 0
-            while self.checked < self.expected_outputs:
-                await FallingEdge(self.handshake.dut.clk_i)
-                cycle += 1
-
-                self.handshake.dut.ready_i.value = 1 if (cycle % self.out_stride) == 0 else 0
-
-                if self.handshake.output_accepted():
-                    if self.scoreboard.check_output(self.handshake.output_value()):
-                        self.checked += 1
-
-                if (cycle % self.in_stride) == 0:
-                    if self.handshake.input_accepted():
-                        input_data = self.input.accept()
-                        if input_data is not None:
-                            self.scoreboard.update_expected(input_data)
-                    self.input.drive(self.handshake)
-                else:
-                    self.handshake.drive(False, 0)
-        finally:
-            self.handshake.dut.valid_i.value = 0
-            self.handshake.dut.ready_i.value = 0
-            self.handshake.dut.data_i.value = 0
-
-
-class HandshakeManager:
-    def __init__(self, dut):
-        self.dut = dut
-
-    def drive(self, valid, data):
-        self.dut.valid_i.value = 1 if valid else 0
-        self.dut.data_i.value = int(data)
-
-    def input_accepted(self):
-        return bool(self.dut.valid_i.value and self.dut.ready_o.value)
-
-    def output_accepted(self):
-        return bool(self.dut.valid_o.value and self.dut.ready_i.value)
-
-    def output_value(self):
-        if not self.dut.gx_o.value.is_resolvable or not self.dut.gy_o.value.is_resolvable:
-            return None
-        return self.dut.gx_o.value.to_signed(), self.dut.gy_o.value.to_signed()
+        dut = self.dut
+        dut.depth_i.value = self.width
+        await FallingEdge(dut.clk_i)
+        await FallingEdge(dut.clk_i)
+        in_pattern, out_pattern = self.patterns
+        if FAST:
+            width = int(dut.WIDTH_P.value)
+            outputs = await Replay(dut, self.tokens, self.expected_outputs, in_fields=(width,),
+                                   out_fields=((2 * width, True),) * 2, in_pattern=in_pattern,
+                                   out_pattern=out_pattern).run()
+            for token in self.tokens:
+                self.accept(token)
+        else:
+            input = Driver(dut, self.tokens, pattern=in_pattern, on_accept=self.accept)
+            output = Monitor(dut, data=("gx_o", "gy_o"), pattern=out_pattern, signed=True)
+            await run_until(dut.clk_i, [input], [output], lambda: len(output) >= self.expected_outputs)
+            outputs = output.values
+        self.scoreboard.check(outputs)
 
 
 async def clock_test(dut):
@@ -144,9 +86,13 @@ async def clock_test(dut):
 
 async def reset_test(dut):
     dut.rstn_i.value = 0
-    dut.valid_i.value = 0
-    dut.ready_i.value = 0
-    dut.data_i.value = 0
+    dut.depth_i.value = int(dut.DEPTH_P.value)
+    if FAST:
+        dut.load_i.value = 0
+    else:
+        dut.valid_i.value = 0
+        dut.ready_i.value = 0
+        dut.data_i.value = 0
     await Timer(10 * CLOCK_PERIOD_NS, unit="ns")
     await FallingEdge(dut.clk_i)
     dut.rstn_i.value = 1
@@ -211,3 +157,23 @@ async def single_image_test(dut):
     if img is None:
         raise FileNotFoundError(img_path)
     await TestManager(dut, img[:, : int(dut.DEPTH_P.value)]).run()
+
+
+@cocotb.test()
+async def runtime_width_test(dut):
+    # narrower lines back to back, the line buffer follows depth_i without a reset
+    await clock_test(dut)
+    await reset_test(dut)
+    depth = int(dut.DEPTH_P.value)
+    rng = np.random.default_rng(3)
+    for width in (depth, 5, depth // 2 + 1, 3, depth):
+        await TestManager(dut, rng.integers(0, 256, size=(8, width), dtype=np.uint8)).run()
+
+
+@cocotb.test()
+async def backpressure_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    width = int(dut.DEPTH_P.value)
+    rng = np.random.default_rng(4)
+    await TestManager(dut, rng.integers(0, 256, size=(6, width), dtype=np.uint8), in_stride=2, out_stride=3).run()
@@ -2,12 +2,13 @@
 
 module counter 
 #(
-    parameter WIDTH_P = 32,
-    parameter MAX_VAL_P = 128
+    parameter WIDTH_P = 32
 ) (
     input logic [0:0] clk_i,
     input logic [0:0] rstn_i,
     input logic [WIDTH_P-1:0] rstn_data_i,
+    // wrap point, change it together with a reset so count_o never sits above it
+    input logic [WIDTH_P-1:0] max_i,
     input logic [0:0] up_i,
     input logic [0:0] down_i,
     input logic [0:0] en_i,
@@ -43,14 +44,14 @@ module counter
             count_l <= rstn_data_i;
         end else if (en_i) begin
             if (up_i && !down_i) begin
-                if (count_l == MAX_VAL_P[WIDTH_P-1:0]) begin
+                if (count_l == max_i) begin
                     count_l <= '0;
                 end else begin
                     count_l <= count_w;
                 end
             end else if (down_i && !up_i) begin
                 if (count_l == '0) begin
-                    count_l <= MAX_VAL_P[WIDTH_P-1:0];
+                    count_l <= max_i;
                 end else begin
                     count_l <= count_w;
                 end
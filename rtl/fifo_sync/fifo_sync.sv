@@ -17,12 +17,11 @@ module fifo_sync
 
     logic [$clog2(DEPTH_P):0] wr_ptr_l, rd_ptr_l, rd_ptr_next_w;
     logic [WIDTH_P-1:0] data_o_bypass_l, data_o_l;
-    logic [0:0] bypass_w;
+    logic [0:0] bypass_l;
 
     // full empty and bypass logic
     assign ready_o = ~((wr_ptr_l[$clog2(DEPTH_P)] != rd_ptr_l[$clog2(DEPTH_P)]) && (wr_ptr_l[$clog2(DEPTH_P)-1:0] == rd_ptr_l[$clog2(DEPTH_P)-1:0])); // not full
     assign valid_o = (wr_ptr_l[$clog2(DEPTH_P):0] != rd_ptr_l[$clog2(DEPTH_P):0]); // not empty
-    assign bypass_w = (wr_ptr_l[$clog2(DEPTH_P):0] == rd_ptr_next_w[$clog2(DEPTH_P):0]);
 
     // next ptr logic
     always_comb begin
@@ -60,6 +59,16 @@ module fifo_sync
         end
     end
 
+    // the ram reads before it writes, so a word written to the address being read comes from
+    // the bypass register the cycle after; registered, so data_o never waits on ready_i
+    always_ff @(posedge clk_i) begin
+        if (!rstn_i) begin
+            bypass_l <= 1'b0;
+        end else begin
+            bypass_l <= valid_i & ready_o & (wr_ptr_l == rd_ptr_next_w);
+        end
+    end
+
     // sync ram
     sync_ram_block #(
         .WIDTH_P(WIDTH_P),
@@ -78,6 +87,6 @@ module fifo_sync
         .data_b_o()
     );
 
-    assign data_o = bypass_w ? data_o_bypass_l : data_o_l;
+    assign data_o = bypass_l ? data_o_bypass_l : data_o_l;
 
 endmodule
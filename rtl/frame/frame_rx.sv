@@ -0,0 +1,280 @@
+`timescale 1ns/1ps
+
+module frame_rx
+#(
+    parameter BPP_P = 3,
+    parameter SOF_P = 8'hA5,
+    // outside a frame, CFG_P and the byte after it set threshold_o
+    parameter CFG_P = 8'hC3,
+    // idle cycles inside a frame before the rest of it is padded, about 0.28 s at 30 MHz
+    parameter TIMEOUT_P = 1 << 23
+) (
+    input logic [0:0] clk_i,
+    input logic [0:0] rstn_i,
+    input logic [7:0] data_i,
+    input logic [0:0] valid_i,
+    output logic [0:0] ready_o,
+    output logic [7:0] data_o,
+    output logic [0:0] valid_o,
+    output logic [0:0] last_o,
+    input logic [0:0] ready_i,
+    output logic [15:0] width_o,
+    output logic [15:0] height_o,
+    output logic [0:0] hdr_valid_o,
+    input logic [0:0] hdr_ready_i,
+    input logic [0:0] overrun_i,
+    input logic [0:0] frame_error_i,
+    // {last bad row, first bad row, flags}, one per frame once its payload is in
+    output logic [39:0] status_o,
+    output logic [0:0] status_valid_o,
+    input logic [0:0] status_ready_i,
+    // one bit per row once its CRC is in, set when the row failed
+    output logic [0:0] row_bad_o,
+    output logic [0:0] row_valid_o,
+    input logic [0:0] row_ready_i,
+    output logic [7:0] threshold_o
+);
+
+    // SOF, width and height little endian, H rows of W*BPP_P payload bytes each followed
+    // by their CRC-16 low byte first, then 2W+3 zero pixels that push the last rows out of
+    // the line buffers. A line that goes quiet mid-frame has lost bytes, so after TIMEOUT_P
+    // idle cycles the rest of the frame is padded with zeros and every row from there on
+    // counts as failed; the frame still comes back and resync happens on the next SOF.
+    // Between frames a CFG_P byte loads the byte after it into threshold_o.
+    localparam [2:0] ST_SOF = 3'd0;
+    localparam [2:0] ST_HDR = 3'd1;
+    localparam [2:0] ST_PUSH = 3'd2;
+    localparam [2:0] ST_DATA = 3'd3;
+    localparam [2:0] ST_CRC = 3'd4;
+    localparam [2:0] ST_STAT = 3'd5;
+    localparam [2:0] ST_FLUSH = 3'd6;
+    localparam [2:0] ST_CFG = 3'd7;
+
+    localparam [7:0] CRC_ERROR = 8'h01;
+    localparam [7:0] TIMEOUT = 8'h02;
+    localparam [7:0] OVERRUN = 8'h04;
+    localparam [7:0] FRAMING = 8'h08;
+
+    // CRC-16/XMODEM, one byte per call
+    function automatic [15:0] crc16(input [15:0] crc, input [7:0] data);
+        integer i;
+        begin
+            crc16 = crc ^ {data, 8'h00};
+            for (i = 0; i < 8; i = i + 1) begin
+                crc16 = crc16[15] ? {crc16[14:0], 1'b0} ^ 16'h1021 : {crc16[14:0], 1'b0};
+            end
+        end
+    endfunction
+
+    logic [2:0] state_l;
+    logic [1:0] hdr_idx_l;
+    logic [$clog2(BPP_P+1)-1:0] byte_l;
+    logic [15:0] col_l;
+    logic [15:0] row_l;
+    logic [16:0] flush_l;
+    // the bounds the counters are compared with, set once the header is in so no compare
+    // has a subtract in front of it
+    logic [15:0] last_col_l;
+    logic [15:0] last_row_l;
+    logic [16:0] flush_end_l;
+    logic [15:0] crc_l;
+    logic [0:0] crc_idx_l;
+    logic [0:0] mismatch_l;
+    // the row whose CRC just closed failed; first_l and last_l take it a cycle later, out of
+    // the way of the handshake, and the status waits for them
+    logic [0:0] mark_l;
+    logic [15:0] first_l;
+    logic [15:0] last_l;
+    logic [7:0] errors_l;
+    logic [0:0] pad_l;
+    logic [$clog2(TIMEOUT_P+1)-1:0] idle_l;
+
+    logic [0:0] in_fire;
+    logic [0:0] out_fire;
+    logic [0:0] pixel_done;
+    logic [0:0] row_done;
+    logic [0:0] crc_fire;
+    logic [0:0] crc_open;
+    logic [0:0] row_bad;
+    logic [7:0] errors;
+
+    assign in_fire = valid_i & ready_o;
+    assign out_fire = valid_o & ready_i;
+    assign pixel_done = (byte_l == BPP_P - 1);
+    assign row_done = pixel_done & (col_l == last_col_l);
+    // CRC bytes are taken from the line, or made up while padding; the second one waits
+    // until the row's bit can go out
+    assign crc_open = ~crc_idx_l | row_ready_i;
+    assign crc_fire = (state_l == ST_CRC) & (in_fire | (pad_l & crc_open));
+    assign row_bad = pad_l | mismatch_l | (data_i != crc_l[15:8]);
+    assign row_bad_o = row_bad;
+    assign row_valid_o = (state_l == ST_CRC) & crc_idx_l & (valid_i | pad_l);
+    assign errors = errors_l | (overrun_i ? OVERRUN : 8'h00) | (frame_error_i ? FRAMING : 8'h00);
+
+    always_comb begin
+        ready_o = 1'b0;
+        valid_o = 1'b0;
+        data_o = data_i;
+        hdr_valid_o = 1'b0;
+        status_valid_o = 1'b0;
+        case (state_l)
+            ST_SOF, ST_HDR, ST_CFG: ready_o = 1'b1;
+            ST_PUSH: hdr_valid_o = 1'b1;
+            ST_DATA: begin
+                valid_o = valid_i | pad_l;
+                ready_o = ready_i & ~pad_l;
+                if (pad_l) begin
+                    data_o = '0;
+                end
+            end
+            ST_CRC: ready_o = ~pad_l & crc_open;
+            ST_STAT: status_valid_o = ~mark_l;
+            ST_FLUSH: begin
+                valid_o = 1'b1;
+                data_o = '0;
+            end
+            default: ;
+        endcase
+    end
+
+    assign status_o = {last_l, first_l, errors_l | (first_l != 16'hFFFF ? CRC_ERROR : 8'h00) | (pad_l ? TIMEOUT : 8'h00)};
+    assign last_o = (state_l == ST_FLUSH) & pixel_done & (flush_l == flush_end_l);
+
+    always_ff @(posedge clk_i) begin
+        if (!rstn_i) begin
+            state_l <= ST_SOF;
+            hdr_idx_l <= '0;
+            byte_l <= '0;
+            col_l <= '0;
+            row_l <= '0;
+            flush_l <= '0;
+            last_col_l <= '0;
+            last_row_l <= '0;
+            flush_end_l <= '0;
+            width_o <= '0;
+            height_o <= '0;
+            crc_l <= '0;
+            crc_idx_l <= '0;
+            mismatch_l <= '0;
+            mark_l <= '0;
+            first_l <= 16'hFFFF;
+            last_l <= '0;
+            errors_l <= '0;
+            pad_l <= '0;
+            idle_l <= '0;
+            threshold_o <= '0;
+        end else begin
+            // uart errors count towards the frame whose payload ends next
+            errors_l <= errors;
+
+            mark_l <= 1'b0;
+            if (mark_l) begin
+                if (first_l == 16'hFFFF) begin
+                    first_l <= row_l - 1'b1;
+                end
+                last_l <= row_l - 1'b1;
+            end
+
+            if ((state_l == ST_DATA || state_l == ST_CRC) && !valid_i && !pad_l) begin
+                idle_l <= idle_l + 1'b1;
+                if (idle_l == TIMEOUT_P - 1) begin
+                    pad_l <= 1'b1;
+                end
+            end else begin
+                idle_l <= '0;
+            end
+
+            case (state_l)
+                ST_SOF: begin
+                    if (in_fire && data_i == SOF_P) begin
+                        state_l <= ST_HDR;
+                        hdr_idx_l <= '0;
+                    end else if (in_fire && data_i == CFG_P) begin
+                        state_l <= ST_CFG;
+                    end
+                end
+                ST_CFG: begin
+                    if (in_fire) begin
+                        threshold_o <= data_i;
+                        state_l <= ST_SOF;
+                    end
+                end
+                ST_HDR: begin
+                    if (in_fire) begin
+                        case (hdr_idx_l)
+                            2'd0: width_o[7:0] <= data_i;
+                            2'd1: width_o[15:8] <= data_i;
+                            2'd2: height_o[7:0] <= data_i;
+                            default: height_o[15:8] <= data_i;
+                        endcase
+                        hdr_idx_l <= hdr_idx_l + 1'b1;
+                        if (hdr_idx_l == 2'd3) begin
+                            state_l <= ST_PUSH;
+                        end
+                    end
+                end
+                ST_PUSH: begin
+                    if (hdr_ready_i) begin
+                        byte_l <= '0;
+                        col_l <= '0;
+                        row_l <= '0;
+                        flush_l <= '0;
+                        last_col_l <= width_o - 1'b1;
+                        last_row_l <= height_o - 1'b1;
+                        flush_end_l <= {width_o, 1'b0} + 17'd2;
+                        crc_l <= '0;
+                        first_l <= 16'hFFFF;
+                        last_l <= '0;
+                        state_l <= (width_o == '0 || height_o == '0) ? ST_STAT : ST_DATA;
+                    end
+                end
+                ST_DATA: begin
+                    if (out_fire) begin
+                        crc_l <= crc16(crc_l, data_o);
+                        byte_l <= pixel_done ? '0 : byte_l + 1'b1;
+                        if (pixel_done) begin
+                            col_l <= row_done ? '0 : col_l + 1'b1;
+                        end
+                        if (row_done) begin
+                            crc_idx_l <= '0;
+                            state_l <= ST_CRC;
+                        end
+                    end
+                end
+                ST_CRC: begin
+                    if (crc_fire) begin
+                        crc_idx_l <= 1'b1;
+                        if (!crc_idx_l) begin
+                            mismatch_l <= (data_i != crc_l[7:0]);
+                        end else begin
+                            mark_l <= row_bad;
+                            crc_l <= '0;
+                            row_l <= row_l + 1'b1;
+                            state_l <= (row_l == last_row_l) ? ST_STAT : ST_DATA;
+                        end
+                    end
+                end
+                ST_STAT: begin
+                    if (status_valid_o & status_ready_i) begin
+                        errors_l <= (overrun_i ? OVERRUN : 8'h00) | (frame_error_i ? FRAMING : 8'h00);
+                        pad_l <= 1'b0;
+                        state_l <= ST_FLUSH;
+                    end
+                end
+                ST_FLUSH: begin
+                    if (out_fire) begin
+                        byte_l <= pixel_done ? '0 : byte_l + 1'b1;
+                        if (pixel_done) begin
+                            flush_l <= flush_l + 1'b1;
+                        end
+                        if (last_o) begin
+                            state_l <= ST_SOF;
+                        end
+                    end
+                end
+                default: state_l <= ST_SOF;
+            endcase
+        end
+    end
+
+endmodule
@@ -0,0 +1,167 @@
+import random
+
+import numpy as np
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import FallingEdge, Timer
+
+import sobel_model
+from handshake import Driver, Monitor, Scoreboard, rate, run_until
+
+CLOCK_PERIOD_NS = 10
+
+
+def status_word(flags, first, last):
+    return (last << 24) | (first << 8) | flags
+
+
+class ModelManager:
+    def __init__(self, dut):
+        self.bpp = int(dut.BPP_P.value)
+        self.data = []
+        self.headers = []
+        self.statuses = []
+        self.rows = []
+
+    def run(self, width, height, payload, bad=()):
+        # payload bytes without their row CRCs, then 2W+3 zero pixels with last on the final byte
+        self.headers.append((width, height))
+        self.rows.extend(int(row in bad) for row in range(height))
+        if bad:
+            self.statuses.append(status_word(sobel_model.CRC_ERROR, min(bad), max(bad)))
+        else:
+            self.statuses.append(status_word(0, sobel_model.NO_ROW, 0))
+        flush = sobel_model.flush_len(width) * self.bpp
+        self.data.extend((int(byte), 0) for byte in payload)
+        self.data.extend((0, int(index == flush - 1)) for index in range(flush))
+
+
+class TestManager:
+    def __init__(self, dut, frames, junk=b"", corrupt=(), in_rate=1.0, out_rate=1.0, hdr_rate=1.0):
+        # corrupt holds (frame, row) pairs whose CRC goes out with its low bit flipped
+        self.dut = dut
+        self.model = ModelManager(dut)
+        stream = bytearray(junk)
+        for index, (width, height, payload) in enumerate(frames):
+            bad = [row for frame, row in corrupt if frame == index]
+            rows = np.frombuffer(bytes(payload), dtype=np.uint8).reshape(height, width * self.model.bpp)
+            stream += sobel_model.header(width, height)
+            for row, crc in enumerate(sobel_model.rows_crc(rows)):
+                stream += rows[row].tobytes() + (int(crc) ^ (row in bad)).to_bytes(sobel_model.CRC_LEN, "little")
+            self.model.run(width, height, payload, bad)
+        rng = random.Random(7)
+        self.input = Driver(dut, stream, pattern=rate(in_rate, rng))
+        self.outputs = [
+            Monitor(dut, data=("data_o", "last_o"), pattern=rate(out_rate, rng)),
+            Monitor(dut, data=("width_o", "height_o"), valid="hdr_valid_o", ready="hdr_ready_i",
+                    pattern=rate(hdr_rate, rng)),
+            Monitor(dut, data="status_o", valid="status_valid_o", ready="status_ready_i", pattern=rate(hdr_rate, rng)),
+            Monitor(dut, data="row_bad_o", valid="row_valid_o", ready="row_ready_i", pattern=rate(hdr_rate, rng)),
+        ]
+        self.scoreboards = [
+            Scoreboard("(data_o, last_o)", self.model.data),
+            Scoreboard("(width_o, height_o)", self.model.headers),
+            Scoreboard("status_o", self.model.statuses),
+            Scoreboard("row_bad_o", self.model.rows),
+        ]
+
+    def done(self):
+        return all(len(output) >= len(scoreboard) for output, scoreboard in zip(self.outputs, self.scoreboards))
+
+    async def run(self):
+        timeout = 100 * len(self.model.data) + 1000
+        await run_until(self.dut.clk_i, [self.input], self.outputs, self.done, timeout)
+        for output, scoreboard in zip(self.outputs, self.scoreboards):
+            scoreboard.check(output.values)
+
+
+async def clock_test(dut):
+    await Timer(100, unit="ns")
+    cocotb.start_soon(Clock(dut.clk_i, CLOCK_PERIOD_NS, unit="ns").start())
+    await Timer(10, unit="ns")
+
+
+async def reset_test(dut):
+    dut.rstn_i.value = 0
+    dut.valid_i.value = 0
+    dut.data_i.value = 0
+    dut.ready_i.value = 0
+    dut.hdr_ready_i.value = 0
+    dut.status_ready_i.value = 0
+    dut.row_ready_i.value = 0
+    dut.overrun_i.value = 0
+    dut.frame_error_i.value = 0
+    await Timer(10 * CLOCK_PERIOD_NS, unit="ns")
+    await FallingEdge(dut.clk_i)
+    dut.rstn_i.value = 1
+    await Timer(10 * CLOCK_PERIOD_NS, unit="ns")
+    await FallingEdge(dut.clk_i)
+
+
+def random_frame(width, height, bpp, seed):
+    return width, height, np.random.default_rng(seed).integers(0, 256, width * height * bpp, dtype=np.uint8)
+
+
+@cocotb.test()
+async def single_frame_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    bpp = int(dut.BPP_P.value)
+    await TestManager(dut, [random_frame(8, 6, bpp, 1)]).run()
+
+
+@cocotb.test()
+async def back_to_back_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    bpp = int(dut.BPP_P.value)
+    frames = [random_frame(8, 6, bpp, seed) for seed in range(3)] + [random_frame(5, 3, bpp, 3)]
+    await TestManager(dut, frames).run()
+
+
+@cocotb.test()
+async def resync_test(dut):
+    # bytes before a SOF, such as the tail of a frame cut short, are dropped
+    await clock_test(dut)
+    await reset_test(dut)
+    bpp = int(dut.BPP_P.value)
+    await TestManager(dut, [random_frame(8, 6, bpp, 4)], junk=b"\x00\x12\x34").run()
+
+
+@cocotb.test()
+async def empty_frame_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    bpp = int(dut.BPP_P.value)
+    await TestManager(dut, [(8, 0, b""), random_frame(8, 2, bpp, 5)]).run()
+
+
+@cocotb.test()
+async def crc_error_test(dut):
+    # a row that fails its CRC is still passed on, and reported in the status of its frame
+    await clock_test(dut)
+    await reset_test(dut)
+    bpp = int(dut.BPP_P.value)
+    frames = [random_frame(8, 6, bpp, seed) for seed in range(3)]
+    await TestManager(dut, frames, corrupt=[(0, 2), (2, 1), (2, 4)]).run()
+
+
+@cocotb.test()
+async def backpressure_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    bpp = int(dut.BPP_P.value)
+    frames = [random_frame(8, 6, bpp, seed) for seed in range(2)]
+    await TestManager(dut, frames, corrupt=[(1, 5)], in_rate=0.6, out_rate=0.5, hdr_rate=0.3).run()
+
+
+@cocotb.test()
+async def config_test(dut):
+    # CFG between frames sets the threshold, even to a value that looks like a SOF
+    await clock_test(dut)
+    await reset_test(dut)
+    bpp = int(dut.BPP_P.value)
+    for seed, level in enumerate((77, sobel_model.SOF, sobel_model.CFG, 0)):
+        await TestManager(dut, [random_frame(8, 3, bpp, seed)], junk=sobel_model.config(level)).run()
+        assert int(dut.threshold_o.value) == level, f"Mismatch threshold got {int(dut.threshold_o.value)} exp {level}"
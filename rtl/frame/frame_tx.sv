@@ -0,0 +1,332 @@
+`timescale 1ns/1ps
+
+module frame_tx
+#(
+    parameter WIDTH_P = 8,
+    parameter BPP_P = 3,
+    parameter SOF_P = 8'hA5,
+    parameter EOF_P = 8'h5A,
+    // edge pixels whose window wraps across lines or frames are sent as 0
+    parameter BORDER_P = 2,
+    // 1: one bit per pixel, set when data_i is nonzero, eight to a byte MSB first
+    parameter PACK_P = 0
+) (
+    input logic [0:0] clk_i,
+    input logic [0:0] rstn_i,
+    input logic [WIDTH_P-1:0] data_i,
+    input logic [0:0] valid_i,
+    output logic [0:0] ready_o,
+    input logic [15:0] width_i,
+    input logic [15:0] height_i,
+    input logic [0:0] hdr_valid_i,
+    output logic [0:0] hdr_ready_o,
+    // {last bad row, first bad row, flags} from frame_rx
+    input logic [39:0] status_i,
+    input logic [0:0] status_valid_i,
+    output logic [0:0] status_ready_o,
+    // frame_rx's pass or fail of every input row, in order
+    input logic [0:0] row_bad_i,
+    input logic [0:0] row_valid_i,
+    output logic [0:0] row_ready_o,
+    output logic [7:0] data_o,
+    output logic [0:0] valid_o,
+    input logic [0:0] ready_i
+);
+
+    // every stage between frame_rx and here is one token in, one token out, so the
+    // segment boundaries are recovered by counting: drop the 2W+3 tokens that still
+    // belong to the line buffer fill, send W*H pixels BPP_P times each with a CRC-16 after
+    // every row, then the five status bytes and EOF. An output row depends on the input rows
+    // up to BORDER_P away, so its CRC goes out inverted when any of them failed; by the end of
+    // output row r input row r+BORDER_P+1 is coming in, so the bits it needs are already there.
+    // With PACK_P a row is ceil(W/8) bytes instead, the last one padded with zeros.
+    localparam [2:0] ST_IDLE = 3'd0;
+    localparam [2:0] ST_HDR = 3'd1;
+    localparam [2:0] ST_SKIP = 3'd2;
+    localparam [2:0] ST_PIX = 3'd3;
+    localparam [2:0] ST_CRC = 3'd4;
+    localparam [2:0] ST_STAT = 3'd5;
+    localparam [2:0] ST_EOF = 3'd6;
+
+    // CRC-16/XMODEM, one byte per call
+    function automatic [15:0] crc16(input [15:0] crc, input [7:0] data);
+        integer i;
+        begin
+            crc16 = crc ^ {data, 8'h00};
+            for (i = 0; i < 8; i = i + 1) begin
+                crc16 = crc16[15] ? {crc16[14:0], 1'b0} ^ 16'h1021 : {crc16[14:0], 1'b0};
+            end
+        end
+    endfunction
+
+    logic [2:0] state_l;
+    logic [2:0] hdr_idx_l;
+    logic [15:0] width_l;
+    logic [15:0] height_l;
+    // the bounds the counters are compared with, taken from the header once so no compare
+    // has a subtract in front of it
+    logic [15:0] last_col_l;
+    logic [15:0] last_row_l;
+    // the last column and row inside the border, wrapped when there is none
+    logic [15:0] col_hi_l;
+    logic [15:0] row_hi_l;
+    logic [16:0] skip_end_l;
+    logic [$clog2(BPP_P+1)-1:0] copy_l;
+    logic [15:0] col_l;
+    logic [15:0] row_l;
+    // row_l + BORDER_P, the last input row output row row_l depends on
+    logic [16:0] row_ahead_l;
+    logic [16:0] skip_l;
+    logic [15:0] crc_l;
+    logic [0:0] crc_idx_l;
+    logic [15:0] rows_in_l;
+    logic [0:0] bad_l;
+    logic [15:0] bad_until_l;
+    logic [6:0] pack_l;
+    logic [2:0] pack_idx_l;
+    // the frame's status, taken whole at the start of ST_STAT so the bytes go out of a register
+    logic [39:0] status_l;
+    logic [0:0] status_in_l;
+
+    logic [0:0] out_fire;
+    logic [0:0] copy_done;
+    logic [0:0] row_done;
+    logic [0:0] in_frame;
+    // whether col_l and row_l are past the leading border and short of the trailing one, kept
+    // up as they count so in_frame is never a compare in front of data_o
+    logic [0:0] col_lo_l;
+    logic [0:0] col_hi_in_l;
+    logic [0:0] row_lo_l;
+    logic [0:0] row_hi_in_l;
+    logic [0:0] row_fire;
+    // row_ready_o, registered so the row fifo's handshake never waits on the compares
+    logic [0:0] row_open_l;
+    logic [0:0] rows_known_l;
+    logic [0:0] row_marked_l;
+    logic [0:0] pix_fire;
+    logic [0:0] pack_done;
+    logic [7:0] pack_next;
+    logic [7:0] pix_data;
+
+    assign out_fire = valid_o & ready_i;
+    assign copy_done = PACK_P || (copy_l == BPP_P - 1);
+    assign row_done = (col_l == last_col_l);
+    assign in_frame = row_lo_l & row_hi_in_l & col_lo_l & col_hi_in_l;
+    // a pixel is taken once its last copy or the byte it closes goes out
+    assign pix_fire = (state_l == ST_PIX) & valid_i & ready_o;
+    assign pack_done = !PACK_P || (pack_idx_l == 3'd7) || row_done;
+    assign pack_next = {pack_l, in_frame & (data_i != '0)};
+    assign hdr_ready_o = (state_l == ST_IDLE);
+    assign status_ready_o = (state_l == ST_STAT) & ~status_in_l;
+    // while on output row r the bits up to input row r+BORDER_P are taken, and its CRC waits for them
+    assign row_ready_o = row_open_l;
+    assign row_fire = row_valid_i & row_ready_o;
+    assign pix_data = PACK_P ? pack_next << (3'd7 - pack_idx_l) : (in_frame ? data_i[7:0] : '0);
+
+    always_comb begin
+        ready_o = 1'b0;
+        valid_o = 1'b0;
+        data_o = '0;
+        case (state_l)
+            ST_HDR: begin
+                valid_o = 1'b1;
+                case (hdr_idx_l)
+                    3'd0: data_o = SOF_P;
+                    3'd1: data_o = width_l[7:0];
+                    3'd2: data_o = width_l[15:8];
+                    3'd3: data_o = height_l[7:0];
+                    default: data_o = height_l[15:8];
+                endcase
+            end
+            ST_SKIP: ready_o = 1'b1;
+            ST_PIX: begin
+                valid_o = valid_i & pack_done;
+                data_o = pix_data;
+                ready_o = pack_done ? ready_i & copy_done : 1'b1;
+            end
+            ST_CRC: begin
+                valid_o = rows_known_l;
+                data_o = (crc_idx_l ? crc_l[15:8] : crc_l[7:0]) ^ {8{row_marked_l}};
+            end
+            ST_STAT: begin
+                valid_o = status_in_l;
+                case (hdr_idx_l)
+                    3'd0: data_o = status_l[7:0];
+                    3'd1: data_o = status_l[15:8];
+                    3'd2: data_o = status_l[23:16];
+                    3'd3: data_o = status_l[31:24];
+                    default: data_o = status_l[39:32];
+                endcase
+            end
+            ST_EOF: begin
+                valid_o = 1'b1;
+                data_o = EOF_P;
+            end
+            default: ;
+        endcase
+    end
+
+    always_ff @(posedge clk_i) begin
+        if (!rstn_i) begin
+            state_l <= ST_IDLE;
+            hdr_idx_l <= '0;
+            width_l <= '0;
+            height_l <= '0;
+            last_col_l <= '0;
+            last_row_l <= '0;
+            col_hi_l <= '0;
+            row_hi_l <= '0;
+            col_lo_l <= '0;
+            col_hi_in_l <= '0;
+            row_lo_l <= '0;
+            row_hi_in_l <= '0;
+            skip_end_l <= '0;
+            copy_l <= '0;
+            col_l <= '0;
+            row_l <= '0;
+            row_ahead_l <= '0;
+            skip_l <= '0;
+            crc_l <= '0;
+            crc_idx_l <= '0;
+            rows_in_l <= '0;
+            bad_l <= '0;
+            bad_until_l <= '0;
+            pack_l <= '0;
+            pack_idx_l <= '0;
+            status_l <= '0;
+            status_in_l <= '0;
+            row_open_l <= '0;
+            rows_known_l <= '0;
+            row_marked_l <= '0;
+        end else begin
+            // rows_in_l never passes height_l or row_ahead_l + 1 and only moves on through
+            // row_fire, and row_ahead_l only grows, so what holds for the counters after this
+            // cycle's row_fire still holds when the flag is used
+            row_open_l <= (state_l == ST_SKIP || state_l == ST_PIX || state_l == ST_CRC) &&
+                          (row_fire ? (rows_in_l != last_row_l) && ({1'b0, rows_in_l} < row_ahead_l)
+                                    : (rows_in_l != height_l) && ({1'b0, rows_in_l} <= row_ahead_l));
+            // a cycle behind the counters; rows_in_l only moves on while the rows are unknown,
+            // and row_ahead_l only after the CRC is out and a pixel has gone by
+            rows_known_l <= (rows_in_l == height_l) || ({1'b0, rows_in_l} > row_ahead_l);
+            row_marked_l <= bad_l && ({1'b0, bad_until_l} >= {1'b0, row_l});
+
+            if (row_fire) begin
+                rows_in_l <= rows_in_l + 1'b1;
+                if (row_bad_i) begin
+                    bad_l <= 1'b1;
+                    bad_until_l <= rows_in_l + BORDER_P;
+                end
+            end
+
+            case (state_l)
+                ST_IDLE: begin
+                    if (hdr_valid_i) begin
+                        width_l <= width_i;
+                        height_l <= height_i;
+                        last_col_l <= width_i - 1'b1;
+                        last_row_l <= height_i - 1'b1;
+                        col_hi_l <= width_i - BORDER_P - 1'b1;
+                        row_hi_l <= height_i - BORDER_P - 1'b1;
+                        col_lo_l <= (BORDER_P == 0);
+                        col_hi_in_l <= (width_i > BORDER_P);
+                        row_lo_l <= (BORDER_P == 0);
+                        row_hi_in_l <= (height_i > BORDER_P);
+                        skip_end_l <= {width_i, 1'b0} + 17'd2;
+                        hdr_idx_l <= '0;
+                        skip_l <= '0;
+                        copy_l <= '0;
+                        col_l <= '0;
+                        row_l <= '0;
+                        row_ahead_l <= BORDER_P;
+                        crc_l <= '0;
+                        pack_idx_l <= '0;
+                        rows_in_l <= '0;
+                        bad_l <= '0;
+                        state_l <= ST_HDR;
+                    end
+                end
+                ST_HDR: begin
+                    if (out_fire) begin
+                        hdr_idx_l <= hdr_idx_l + 1'b1;
+                        if (hdr_idx_l == 3'd4) begin
+                            state_l <= ST_SKIP;
+                        end
+                    end
+                end
+                ST_SKIP: begin
+                    if (valid_i) begin
+                        skip_l <= skip_l + 1'b1;
+                        if (skip_l == skip_end_l) begin
+                            hdr_idx_l <= '0;
+                            state_l <= (width_l == '0 || height_l == '0) ? ST_STAT : ST_PIX;
+                        end
+                    end
+                end
+                ST_PIX: begin
+                    if (out_fire) begin
+                        crc_l <= crc16(crc_l, pix_data);
+                        copy_l <= copy_done ? '0 : copy_l + 1'b1;
+                    end
+                    if (pix_fire) begin
+                        pack_l <= pack_next[6:0];
+                        pack_idx_l <= pack_done ? '0 : pack_idx_l + 1'b1;
+                        col_l <= row_done ? '0 : col_l + 1'b1;
+                        if (row_done) begin
+                            col_lo_l <= (BORDER_P == 0);
+                            col_hi_in_l <= (width_l > BORDER_P);
+                        end else begin
+                            if (col_l == BORDER_P - 1) begin
+                                col_lo_l <= 1'b1;
+                            end
+                            if (col_l == col_hi_l) begin
+                                col_hi_in_l <= 1'b0;
+                            end
+                        end
+                        if (row_done) begin
+                            crc_idx_l <= '0;
+                            state_l <= ST_CRC;
+                        end
+                    end
+                end
+                ST_CRC: begin
+                    if (out_fire) begin
+                        crc_idx_l <= 1'b1;
+                        if (crc_idx_l) begin
+                            crc_l <= '0;
+                            row_l <= row_l + 1'b1;
+                            if (row_l == BORDER_P - 1) begin
+                                row_lo_l <= 1'b1;
+                            end
+                            if (row_l == row_hi_l) begin
+                                row_hi_in_l <= 1'b0;
+                            end
+                            row_ahead_l <= row_ahead_l + 1'b1;
+                            hdr_idx_l <= '0;
+                            state_l <= (row_l == last_row_l) ? ST_STAT : ST_PIX;
+                        end
+                    end
+                end
+                ST_STAT: begin
+                    if (status_valid_i & status_ready_o) begin
+                        status_l <= status_i;
+                        status_in_l <= 1'b1;
+                    end
+                    if (out_fire) begin
+                        hdr_idx_l <= hdr_idx_l + 1'b1;
+                        if (hdr_idx_l == 3'd4) begin
+                            status_in_l <= 1'b0;
+                            state_l <= ST_EOF;
+                        end
+                    end
+                end
+                ST_EOF: begin
+                    if (out_fire) begin
+                        state_l <= ST_IDLE;
+                    end
+                end
+                default: state_l <= ST_IDLE;
+            endcase
+        end
+    end
+
+endmodule
@@ -0,0 +1,161 @@
+import random
+
+import numpy as np
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import FallingEdge, Timer
+
+import sobel_model
+from handshake import Driver, Monitor, Scoreboard, rate, run_until
+
+CLOCK_PERIOD_NS = 10
+
+
+def status_word(flags, first, last):
+    return (last << 24) | (first << 8) | flags
+
+
+class ModelManager:
+    def __init__(self, dut):
+        self.bpp = int(dut.BPP_P.value)
+        self.border = int(dut.BORDER_P.value)
+        self.pack = int(dut.PACK_P.value)
+        self.data = []
+
+    def run(self, width, height, tokens, status, bad):
+        # the first 2W+3 tokens are dropped, the rest go out bpp times with a zero border and a
+        # CRC after every row, inverted within BORDER rows of a bad input row, then the status and EOF;
+        # packed, each row is its nonzero pixels as bits instead
+        pixels = np.asarray(tokens[sobel_model.flush_len(width):]).reshape(height, width)
+        mask = np.zeros((height, width), dtype=bool)
+        mask[self.border:height - self.border, self.border:width - self.border] = True
+        if self.pack:
+            edge = np.packbits(mask & (pixels != 0), axis=1)
+        else:
+            edge = np.repeat(np.where(mask, pixels, 0), self.bpp, axis=1).astype(np.uint8)
+        self.data.extend(sobel_model.header(width, height))
+        for index, (row, crc) in enumerate(zip(edge, sobel_model.rows_crc(edge))):
+            if any(abs(index - other) <= self.border for other in bad):
+                crc ^= 0xFFFF
+            self.data.extend(row.tobytes() + int(crc).to_bytes(sobel_model.CRC_LEN, "little"))
+        self.data.extend(sobel_model.trailer(*status) + bytes([sobel_model.EOF]))
+
+
+class TestManager:
+    def __init__(self, dut, frames, in_rate=1.0, out_rate=1.0, hdr_rate=1.0):
+        self.dut = dut
+        self.model = ModelManager(dut)
+        stream = []
+        rows = []
+        for width, height, tokens, status, bad in frames:
+            stream.extend(int(token) for token in tokens)
+            rows.extend(int(row in bad) for row in range(height))
+            self.model.run(width, height, tokens, status, bad)
+        rng = random.Random(11)
+        self.input = Driver(dut, stream, pattern=rate(in_rate, rng))
+        self.sideband = [
+            Driver(dut, [(width, height) for width, height, _, _, _ in frames], data=("width_i", "height_i"),
+                   valid="hdr_valid_i", ready="hdr_ready_o", pattern=rate(hdr_rate, rng)),
+            Driver(dut, [status_word(*status) for _, _, _, status, _ in frames], data="status_i",
+                   valid="status_valid_i", ready="status_ready_o", pattern=rate(hdr_rate, rng)),
+            Driver(dut, rows, data="row_bad_i", valid="row_valid_i", ready="row_ready_o", pattern=rate(in_rate, rng)),
+        ]
+        self.output = Monitor(dut, pattern=rate(out_rate, rng))
+        self.scoreboard = Scoreboard("data_o", self.model.data)
+
+    async def run(self):
+        timeout = 100 * len(self.scoreboard) + 1000
+        await run_until(self.dut.clk_i, [self.input] + self.sideband, [self.output],
+                        lambda: len(self.output) >= len(self.scoreboard), timeout)
+        self.scoreboard.check(self.output.values)
+        assert self.input.done(), "Tokens left over"
+
+
+async def clock_test(dut):
+    await Timer(100, unit="ns")
+    cocotb.start_soon(Clock(dut.clk_i, CLOCK_PERIOD_NS, unit="ns").start())
+    await Timer(10, unit="ns")
+
+
+async def reset_test(dut):
+    dut.rstn_i.value = 0
+    dut.valid_i.value = 0
+    dut.data_i.value = 0
+    dut.hdr_valid_i.value = 0
+    dut.width_i.value = 0
+    dut.height_i.value = 0
+    dut.status_valid_i.value = 0
+    dut.status_i.value = 0
+    dut.row_valid_i.value = 0
+    dut.row_bad_i.value = 0
+    dut.ready_i.value = 0
+    await Timer(10 * CLOCK_PERIOD_NS, unit="ns")
+    await FallingEdge(dut.clk_i)
+    dut.rstn_i.value = 1
+    await Timer(10 * CLOCK_PERIOD_NS, unit="ns")
+    await FallingEdge(dut.clk_i)
+
+
+def random_segment(width, height, seed, bad=(), flags=0, density=1.0):
+    # bad input rows show up in the status and invert the CRCs of the output rows they feed;
+    # density is the share of nonzero tokens
+    rng = np.random.default_rng(seed)
+    tokens = rng.integers(1, 256, sobel_model.flush_len(width) + width * height)
+    tokens = np.where(rng.random(tokens.size) < density, tokens, 0)
+    if bad:
+        status = (flags | sobel_model.CRC_ERROR, min(bad), max(bad))
+    else:
+        status = (flags, sobel_model.NO_ROW, 0)
+    return width, height, tokens, status, set(bad)
+
+
+@cocotb.test()
+async def single_frame_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    await TestManager(dut, [random_segment(8, 6, 1)]).run()
+
+
+@cocotb.test()
+async def back_to_back_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    frames = [random_segment(8, 6, seed) for seed in range(3)] + [random_segment(5, 3, 3)]
+    await TestManager(dut, frames).run()
+
+
+@cocotb.test()
+async def empty_frame_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    await TestManager(dut, [random_segment(8, 0, 4), random_segment(8, 5, 5)]).run()
+
+
+@cocotb.test()
+async def status_test(dut):
+    # the status frame_rx settled for each frame goes out between its last row and EOF
+    await clock_test(dut)
+    await reset_test(dut)
+    frames = [random_segment(8, 6, 6, bad=[1, 3]),
+              random_segment(8, 4, 7, bad=[2, 3], flags=sobel_model.TIMEOUT),
+              random_segment(8, 3, 8, flags=sobel_model.OVERRUN),
+              random_segment(8, 12, 9, bad=[8])]
+    await TestManager(dut, frames).run()
+
+
+@cocotb.test()
+async def backpressure_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    frames = [random_segment(8, 6, 0), random_segment(8, 9, 1, bad=[0, 6])]
+    await TestManager(dut, frames, in_rate=0.6, out_rate=0.5, hdr_rate=0.3).run()
+
+
+@cocotb.test()
+async def sparse_test(dut):
+    # mostly zero pixels, in rows that do not fill whole bytes when packed
+    await clock_test(dut)
+    await reset_test(dut)
+    frames = [random_segment(width, 7, seed, density=0.4) for seed, width in enumerate((13, 8, 9, 21))]
+    await TestManager(dut, frames, in_rate=0.7, out_rate=0.6).run()
@@ -0,0 +1,67 @@
+`timescale 1ns/1ps
+
+// testbench only: magnitude between a stream_source and a stream_sink, so a whole stream runs
+// inside the simulator (make FAST=1); the source plays {gx, gy}
+module magnitude_fast
+#(
+    parameter WIDTH_P = 8,
+    parameter TOKENS_P = 1 << 19
+) (
+    input logic [0:0] clk_i,
+    input logic [0:0] rstn_i,
+    input logic [0:0] load_i,
+    input logic [31:0] in_count_i,
+    input logic [31:0] out_count_i,
+    output logic [31:0] sent_o,
+    output logic [31:0] received_o,
+    output logic [0:0] done_o
+);
+    logic [0:0] valid_i;
+    logic [0:0] ready_o;
+    logic [2*WIDTH_P-1:0] stream_i;
+    logic [0:0] valid_o;
+    logic [0:0] ready_i;
+    logic [WIDTH_P-1:0] mag_o;
+
+    stream_source #(
+        .WIDTH_P(2*WIDTH_P),
+        .DEPTH_P(TOKENS_P)
+    ) source (
+        .clk_i(clk_i),
+        .load_i(load_i),
+        .count_i(in_count_i),
+        .valid_o(valid_i),
+        .ready_i(ready_o),
+        .data_o(stream_i),
+        .sent_o(sent_o)
+    );
+
+    magnitude #(
+        .WIDTH_P(WIDTH_P)
+    ) dut (
+        .clk_i(clk_i),
+        .rstn_i(rstn_i),
+        .valid_i(valid_i),
+        .ready_i(ready_i),
+        .gx_i(stream_i[WIDTH_P +: WIDTH_P]),
+        .gy_i(stream_i[0 +: WIDTH_P]),
+        .valid_o(valid_o),
+        .ready_o(ready_o),
+        .mag_o(mag_o)
+    );
+
+    stream_sink #(
+        .WIDTH_P(WIDTH_P),
+        .DEPTH_P(TOKENS_P)
+    ) sink (
+        .clk_i(clk_i),
+        .load_i(load_i),
+        .count_i(out_count_i),
+        .valid_i(valid_o),
+        .ready_o(ready_i),
+        .data_i(mag_o),
+        .received_o(received_o),
+        .done_o(done_o)
+    );
+
+endmodule
@@ -3,13 +3,17 @@
 module ramdelaybuffer 
 #(
     parameter WIDTH_P = 8,
-    parameter DELAY_P = 12,
-    // obviously will fail same delay test
-    parameter DELAY_A_P = 4,
-    parameter DELAY_B_P = 5
+    // longest delay, the ram holds DELAY_P+1 entries
+    parameter DELAY_P = 12
 ) (
     input logic [0:0] clk_i,
     input logic [0:0] rstn_i,
+    // delays in effect, delay_a_i and delay_b_i at most delay_i and delay_i at most DELAY_P;
+    // a new delay_i restarts the pointers, holding ready_o low for a cycle, so change all
+    // three together between lines
+    input logic [$clog2(DELAY_P+1)-1:0] delay_i,
+    input logic [$clog2(DELAY_P+1)-1:0] delay_a_i,
+    input logic [$clog2(DELAY_P+1)-1:0] delay_b_i,
     input logic [0:0] valid_i,
     input logic [0:0] ready_i,
     output logic [0:0] valid_o,
@@ -18,55 +22,66 @@ module ramdelaybuffer
     output logic [WIDTH_P-1:0] data_a_o,
     output logic [WIDTH_P-1:0] data_b_o
 );
-    initial begin
-        if (DELAY_A_P > DELAY_P) begin
-            $fatal(1, "DELAY_A_P (%0d) must be <= DELAY_P (%0d)", DELAY_A_P, DELAY_P);
-        end
-        if (DELAY_B_P > DELAY_P) begin
-            $fatal(1, "DELAY_B_P (%0d) must be <= DELAY_P (%0d)", DELAY_B_P, DELAY_P);
-        end
+    localparam ADDR_W = $clog2(DELAY_P+1);
+
+    logic [ADDR_W-1:0] wr_addr;
+    logic [ADDR_W-1:0] rd_addr_a;
+    logic [ADDR_W-1:0] rd_addr_b;
+
+    // the pointers wrap at delay_i and the reads trail the write by delay_a_i and delay_b_i
+    logic [ADDR_W-1:0] delay_l;
+    logic [0:0] ptr_rstn;
+    logic [0:0] ptr_ready;
+    logic [0:0] pipe_ready;
+    logic [ADDR_W-1:0] rd_start_a;
+    logic [ADDR_W-1:0] rd_start_b;
+
+    always_ff @(posedge clk_i) begin
+        delay_l <= delay_i;
     end
 
-    logic [$clog2(DELAY_P+1)-1:0] wr_addr;
-    logic [$clog2(DELAY_P+1)-1:0] rd_addr_a;
-    logic [$clog2(DELAY_P+1)-1:0] rd_addr_b;
+    assign ptr_ready = (delay_l == delay_i);
+    assign ptr_rstn = rstn_i & ptr_ready;
+    assign ready_o = pipe_ready & ptr_ready;
+    assign rd_start_a = (delay_a_i == '0) ? '0 : delay_i + 1'b1 - delay_a_i;
+    assign rd_start_b = (delay_b_i == '0) ? '0 : delay_i + 1'b1 - delay_b_i;
 
     counter #(
-        .WIDTH_P($clog2(DELAY_P+1)),
-        .MAX_VAL_P(DELAY_P)
+        .WIDTH_P(ADDR_W)
     ) wr_ptr_counter (
         .clk_i(clk_i),
-        .rstn_i(rstn_i),
-        .rstn_data_i(0),
-        .up_i(valid_i & ready_o),
+        .rstn_i(ptr_rstn),
+        .rstn_data_i('0),
+        .max_i(delay_i),
+        .up_i(1'b1),
         .down_i(1'b0),
-        .en_i(1'b1),
+        .en_i(valid_i & ready_o),
         .count_o(wr_addr)
     );
 
     counter #(
-        .WIDTH_P($clog2(DELAY_P+1)),
-        .MAX_VAL_P(DELAY_P)
+        .WIDTH_P(ADDR_W)
     ) rd_ptr_counter_a (
         .clk_i(clk_i),
-        .rstn_i(rstn_i),
-        .rstn_data_i((DELAY_A_P == 0) ? '0 : (DELAY_P+1-DELAY_A_P)),
-        .up_i(valid_i & ready_o),
+        .rstn_i(ptr_rstn),
+        .rstn_data_i(rd_start_a),
+        .max_i(delay_i),
+        .up_i(1'b1),
         .down_i(1'b0),
-        .en_i(1'b1),
+        .en_i(valid_i & ready_o),
         .count_o(rd_addr_a)
     );
 
     counter #(
-        .WIDTH_P($clog2(DELAY_P+1)),
-        .MAX_VAL_P(DELAY_P)
+        .WIDTH_P(ADDR_W)
     ) rd_ptr_counter_b (
         .clk_i(clk_i),
-        .rstn_i(rstn_i),
-        .rstn_data_i((DELAY_B_P == 0) ? '0 : (DELAY_P+1-DELAY_B_P)),
-        .up_i(valid_i & ready_o),
+        .rstn_i(ptr_rstn),
+        .rstn_data_i(rd_start_b),
+        .max_i(delay_i),
+        .up_i(1'b1),
         .down_i(1'b0),
-        .en_i(1'b1),
+        .en_i(valid_i & ready_o),
         .count_o(rd_addr_b)
     );
 
@@ -93,8 +108,8 @@ module ramdelaybuffer
         .clk_i(clk_i),
         .rstn_i(rstn_i),
         .data_i({WIDTH_P{1'b0}}),
-        .valid_i(valid_i),
-        .ready_o(ready_o),
+        .valid_i(valid_i & ptr_ready),
+        .ready_o(pipe_ready),
         .valid_o(valid_o),
         .data_o(),
         .ready_i(ready_i)
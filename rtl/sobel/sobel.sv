@@ -3,9 +3,18 @@
 module sobel
 #(
     parameter WIDTH_P = 8,
+    // widest frame, the line buffers hold two of its lines; narrower frames set their own width
     parameter LINE_W_P = 640,
-    parameter FIFO_DEPTH_P = 256,
-    parameter UART_PRESCALE_P = 16'd17
+    // must match RX_FIFO in sobel.py, which sizes the host's credit window
+    parameter FIFO_DEPTH_P = 2048,
+    // line rate, any value the host's bridge can produce (sobel.py --baud)
+    parameter BAUD_P = 3000000,
+    // 1: send one byte per edge pixel instead of three identical ones
+    parameter GRAY_OUT_P = 0,
+    // 1: host sends one gray byte per pixel straight into conv2d_box
+    parameter GRAY_IN_P = 0,
+    // 1: threshold the magnitudes and send eight edge pixels per byte (sobel.py --binary)
+    parameter BINARY_OUT_P = 0
 ) (
     input logic [0:0] mclk_i,
     input logic [0:0] rstn_i,
@@ -13,6 +22,11 @@ module sobel
     output logic [0:0] uart_txd_o
 );
 
+    // 12 MHz * 10 / 4 out of the PLL
+    localparam [47:0] CORE_HZ = 30000000;
+    localparam [47:0] BAUD_W = BAUD_P;
+    localparam [47:0] UART_STEP = ((BAUD_W << 16) + CORE_HZ / 2) / CORE_HZ;
+
     logic [0:0] core_clk;
 
     SB_PLL40_PAD #(
@@ -56,24 +70,25 @@ module sobel
     logic [0:0] uart_tx_valid;
     logic [0:0] uart_tx_ready;
 
-    uart #(
-        .DATA_WIDTH(8)
+    logic [0:0] uart_rx_overrun;
+    logic [0:0] uart_rx_frame_error;
+
+    uart_nco #(
+        .ACC_W_P(16)
     ) uart_inst (
-        .clk(core_clk),
-        .rst(~rstn_sync),
-        .s_axis_tdata(uart_tx_data),
-        .s_axis_tvalid(uart_tx_valid),
-        .s_axis_tready(uart_tx_ready),
-        .m_axis_tdata(uart_rx_data),
-        .m_axis_tvalid(uart_rx_valid),
-        .m_axis_tready(uart_rx_ready),
-        .rxd(uart_rxd_i),
-        .txd(uart_txd_o),
-        .tx_busy(),
-        .rx_busy(),
-        .rx_overrun_error(),
-        .rx_frame_error(),
-        .prescale(UART_PRESCALE_P)
+        .clk_i(core_clk),
+        .rstn_i(rstn_sync),
+        .step_i(UART_STEP[15:0]),
+        .data_i(uart_tx_data),
+        .valid_i(uart_tx_valid),
+        .ready_o(uart_tx_ready),
+        .data_o(uart_rx_data),
+        .valid_o(uart_rx_valid),
+        .ready_i(uart_rx_ready),
+        .overrun_o(uart_rx_overrun),
+        .frame_error_o(uart_rx_frame_error),
+        .rxd_i(uart_rxd_i),
+        .txd_o(uart_txd_o)
     );
 
     logic [7:0] rx_fifo_data;
@@ -94,54 +109,240 @@ module sobel
         .data_o(rx_fifo_data)
     );
 
-    logic [23:0] rgb_data;
-    logic [0:0] rgb_valid;
-    logic [0:0] rgb_ready;
-
-    axis_adapter #(
-        .S_DATA_WIDTH(8),
-        .M_DATA_WIDTH(24),
-        .ID_ENABLE(0),
-        .DEST_ENABLE(0),
-        .USER_ENABLE(0)
-    ) rgb_pack (
-        .clk(core_clk),
-        .rst(~rstn_sync),
-        .s_axis_tdata(rx_fifo_data),
-        .s_axis_tkeep(1'b1),
-        .s_axis_tvalid(rx_fifo_valid),
-        .s_axis_tready(rx_fifo_ready),
-        .s_axis_tlast(1'b0),
-        .s_axis_tid('0),
-        .s_axis_tdest('0),
-        .s_axis_tuser('0),
-        .m_axis_tdata(rgb_data),
-        .m_axis_tkeep(),
-        .m_axis_tvalid(rgb_valid),
-        .m_axis_tready(rgb_ready),
-        .m_axis_tlast(),
-        .m_axis_tid(),
-        .m_axis_tdest(),
-        .m_axis_tuser()
+    // registers the fifo's read, so neither its pointer compares nor the bypass mux are in
+    // front of frame_rx's CRC check
+    logic [7:0] rx_data;
+    logic [0:0] rx_valid;
+    logic [0:0] rx_ready;
+
+    elastic #(
+        .WIDTH_P(8)
+    ) rx_elastic (
+        .clk_i(core_clk),
+        .rstn_i(rstn_sync),
+        .data_i(rx_fifo_data),
+        .valid_i(rx_fifo_valid),
+        .ready_o(rx_fifo_ready),
+        .valid_o(rx_valid),
+        .data_o(rx_data),
+        .ready_i(rx_ready)
+    );
+
+    logic [7:0] frame_data;
+    logic [0:0] frame_valid;
+    logic [0:0] frame_ready;
+    logic [0:0] frame_last;
+
+    logic [15:0] rx_hdr_width;
+    logic [15:0] rx_hdr_height;
+    logic [0:0] rx_hdr_valid;
+    logic [0:0] rx_hdr_ready;
+
+    logic [39:0] rx_status;
+    logic [0:0] rx_status_valid;
+    logic [0:0] rx_status_ready;
+    logic [0:0] rx_row_bad;
+    logic [0:0] rx_row_valid;
+    logic [0:0] rx_row_ready;
+    logic [7:0] rx_threshold;
+
+    frame_rx #(
+        .BPP_P(GRAY_IN_P ? 1 : 3)
+    ) frame_rx_inst (
+        .clk_i(core_clk),
+        .rstn_i(rstn_sync),
+        .data_i(rx_data),
+        .valid_i(rx_valid),
+        .ready_o(rx_ready),
+        .data_o(frame_data),
+        .valid_o(frame_valid),
+        .last_o(frame_last),
+        .ready_i(frame_ready),
+        .width_o(rx_hdr_width),
+        .height_o(rx_hdr_height),
+        .hdr_valid_o(rx_hdr_valid),
+        .hdr_ready_i(rx_hdr_ready),
+        .overrun_i(uart_rx_overrun),
+        .frame_error_i(uart_rx_frame_error),
+        .status_o(rx_status),
+        .status_valid_o(rx_status_valid),
+        .status_ready_i(rx_status_ready),
+        .row_bad_o(rx_row_bad),
+        .row_valid_o(rx_row_valid),
+        .row_ready_i(rx_row_ready),
+        .threshold_o(rx_threshold)
+    );
+
+    // frame sizes wait here until frame_tx has sent the previous frame
+    logic [15:0] tx_hdr_width;
+    logic [15:0] tx_hdr_height;
+    logic [0:0] tx_hdr_valid;
+    logic [0:0] tx_hdr_ready;
+
+    logic [0:0] hdr_fifo_ready;
+
+    fifo_sync #(
+        .WIDTH_P(32),
+        .DEPTH_P(4)
+    ) hdr_fifo (
+        .clk_i(core_clk),
+        .rstn_i(rstn_sync),
+        .data_i({rx_hdr_height, rx_hdr_width}),
+        .valid_i(rx_hdr_valid & rx_hdr_ready),
+        .ready_i(tx_hdr_ready),
+        .valid_o(tx_hdr_valid),
+        .ready_o(hdr_fifo_ready),
+        .data_o({tx_hdr_height, tx_hdr_width})
+    );
+
+    // line width register for the line buffers, loaded from each frame header and capped at
+    // LINE_W_P, and the threshold frame_rx last took, loaded along with it. A frame that
+    // changes either waits until frame_tx has taken every token of the frames before it, so
+    // no token sees the line buffers or its threshold change under it. Both load a cycle
+    // before the header is taken, as the line buffers follow line_w a cycle late
+    localparam LINE_W_W = $clog2(LINE_W_P+1);
+
+    logic [LINE_W_W-1:0] line_w;
+    logic [LINE_W_W-1:0] hdr_line_w;
+    logic [0:0] line_w_change;
+    logic [7:0] threshold;
+    logic [0:0] threshold_change;
+    logic [0:0] pipe_empty;
+
+    assign hdr_line_w = (rx_hdr_width > LINE_W_P) ? LINE_W_P[LINE_W_W-1:0] : rx_hdr_width[LINE_W_W-1:0];
+    assign line_w_change = (rx_hdr_width != '0) & (hdr_line_w != line_w);
+    assign threshold_change = BINARY_OUT_P && (rx_threshold != threshold);
+    assign pipe_empty = tx_hdr_ready & ~tx_hdr_valid;
+    assign rx_hdr_ready = hdr_fifo_ready & ~(line_w_change | threshold_change);
+
+    always_ff @(posedge core_clk) begin
+        if (!rstn_sync) begin
+            line_w <= LINE_W_P[LINE_W_W-1:0];
+            threshold <= '0;
+        end else if (rx_hdr_valid & (line_w_change | threshold_change) & pipe_empty) begin
+            if (line_w_change) begin
+                line_w <= hdr_line_w;
+            end
+            threshold <= rx_threshold;
+        end
+    end
+
+    // and so does each frame's status, pushed once its payload is in
+    logic [39:0] tx_status;
+    logic [0:0] tx_status_valid;
+    logic [0:0] tx_status_ready;
+
+    fifo_sync #(
+        .WIDTH_P(40),
+        .DEPTH_P(4)
+    ) status_fifo (
+        .clk_i(core_clk),
+        .rstn_i(rstn_sync),
+        .data_i(rx_status),
+        .valid_i(rx_status_valid),
+        .ready_i(tx_status_ready),
+        .valid_o(tx_status_valid),
+        .ready_o(rx_status_ready),
+        .data_o(tx_status)
+    );
+
+    // and the pass or fail of each input row, until frame_tx closes the output rows it feeds
+    logic [0:0] tx_row_bad;
+    logic [0:0] tx_row_valid;
+    logic [0:0] tx_row_ready;
+
+    fifo_sync #(
+        .WIDTH_P(1),
+        .DEPTH_P(4)
+    ) row_fifo (
+        .clk_i(core_clk),
+        .rstn_i(rstn_sync),
+        .data_i(rx_row_bad),
+        .valid_i(rx_row_valid),
+        .ready_i(tx_row_ready),
+        .valid_o(tx_row_valid),
+        .ready_o(rx_row_ready),
+        .data_o(tx_row_bad)
     );
 
     logic [0:0] gray_valid;
     logic [7:0] gray_data;
     logic [0:0] gray_ready;
 
-    rgb2gray #(
-        .WIDTH_P(WIDTH_P)
-    ) rgb2gray_inst (
+    generate
+        if (GRAY_IN_P) begin : gen_gray_in
+            assign gray_data = frame_data;
+            assign gray_valid = frame_valid;
+            assign frame_ready = gray_ready;
+        end else begin : gen_rgb_in
+            logic [23:0] rgb_data;
+            logic [0:0] rgb_valid;
+            logic [0:0] rgb_ready;
+
+            axis_adapter #(
+                .S_DATA_WIDTH(8),
+                .M_DATA_WIDTH(24),
+                .ID_ENABLE(0),
+                .DEST_ENABLE(0),
+                .USER_ENABLE(0)
+            ) rgb_pack (
+                .clk(core_clk),
+                .rst(~rstn_sync),
+                .s_axis_tdata(frame_data),
+                .s_axis_tkeep(1'b1),
+                .s_axis_tvalid(frame_valid),
+                .s_axis_tready(frame_ready),
+                // a frame always ends on a whole pixel, so the byte lanes restart aligned
+                .s_axis_tlast(frame_last),
+                .s_axis_tid('0),
+                .s_axis_tdest('0),
+                .s_axis_tuser('0),
+                .m_axis_tdata(rgb_data),
+                .m_axis_tkeep(),
+                .m_axis_tvalid(rgb_valid),
+                .m_axis_tready(rgb_ready),
+                .m_axis_tlast(),
+                .m_axis_tid(),
+                .m_axis_tdest(),
+                .m_axis_tuser()
+            );
+
+            rgb2gray #(
+                .WIDTH_P(WIDTH_P)
+            ) rgb2gray_inst (
+                .clk_i(core_clk),
+                .rstn_i(rstn_sync),
+                .valid_i(rgb_valid),
+                .ready_i(gray_ready),
+                .valid_o(gray_valid),
+                .ready_o(rgb_ready),
+                .red_i(rgb_data[7:0]),
+                .blue_i(rgb_data[23:16]),
+                .green_i(rgb_data[15:8]),
+                .gray_o(gray_data)
+            );
+        end
+    endgenerate
+
+    // the ready of every elastic stage is combinational, so on their own the line buffers'
+    // pointer compares would run back through every stage to rx_fifo and forward from
+    // tx_fifo; these fifos' readies come from their pointers and split the chain in three
+    logic [WIDTH_P-1:0] line_data;
+    logic [0:0] line_valid;
+    logic [0:0] line_ready;
+
+    fifo_sync #(
+        .WIDTH_P(WIDTH_P),
+        .DEPTH_P(4)
+    ) gray_fifo (
         .clk_i(core_clk),
         .rstn_i(rstn_sync),
-        .valid_i(rgb_valid),
-        .ready_i(gray_ready),
-        .valid_o(gray_valid),
-        .ready_o(rgb_ready),
-        .red_i(rgb_data[7:0]),
-        .blue_i(rgb_data[23:16]),
-        .green_i(rgb_data[15:8]),
-        .gray_o(gray_data)
+        .data_i(gray_data),
+        .valid_i(gray_valid),
+        .ready_i(line_ready),
+        .valid_o(line_valid),
+        .ready_o(gray_ready),
+        .data_o(line_data)
     );
 
     logic [0:0] box1_valid;
@@ -155,11 +356,12 @@ module sobel
     ) sobel_box_1 (
         .clk_i(core_clk),
         .rstn_i(rstn_sync),
-        .valid_i(gray_valid),
+        .depth_i(line_w),
+        .valid_i(line_valid),
         .ready_i(box1_ready),
-        .data_i(gray_data),
+        .data_i(line_data),
         .valid_o(box1_valid),
-        .ready_o(gray_ready),
+        .ready_o(line_ready),
         .gx_o(box1_gx),
         .gy_o(box1_gy)
     );
@@ -175,6 +377,7 @@ module sobel
     ) sobel_conv2d (
         .clk_i(core_clk),
         .rstn_i(rstn_sync),
+        .depth_i(line_w),
         .valid_i(box1_valid),
         .ready_i(conv_ready),
         .data_i(box1_gx[WIDTH_P-1:0]),
@@ -190,6 +393,25 @@ module sobel
     assign gx_abs = conv_gx[2*WIDTH_P-1] ? -conv_gx : conv_gx;
     assign gy_abs = conv_gy[2*WIDTH_P-1] ? -conv_gy : conv_gy;
 
+    logic [WIDTH_P-1:0] grad_gx;
+    logic [WIDTH_P-1:0] grad_gy;
+    logic [0:0] grad_valid;
+    logic [0:0] grad_ready;
+
+    fifo_sync #(
+        .WIDTH_P(2*WIDTH_P),
+        .DEPTH_P(4)
+    ) grad_fifo (
+        .clk_i(core_clk),
+        .rstn_i(rstn_sync),
+        .data_i({gx_abs, gy_abs}),
+        .valid_i(conv_valid),
+        .ready_i(grad_ready),
+        .valid_o(grad_valid),
+        .ready_o(conv_ready),
+        .data_o({grad_gx, grad_gy})
+    );
+
     logic [0:0] mag_valid;
     logic [0:0] mag_ready;
     logic [2*WIDTH_P-1:0] mag_data;
@@ -199,40 +421,85 @@ module sobel
     ) magnitude_inst (
         .clk_i(core_clk),
         .rstn_i(rstn_sync),
-        .valid_i(conv_valid),
+        .valid_i(grad_valid),
         .ready_i(mag_ready),
-        .gx_i(gx_abs),
-        .gy_i(gy_abs),
+        .gx_i(grad_gx),
+        .gy_i(grad_gy),
         .valid_o(mag_valid),
-        .ready_o(conv_ready),
+        .ready_o(grad_ready),
         .mag_o(mag_data)
     );
 
-    axis_adapter #(
-        .S_DATA_WIDTH(24),
-        .M_DATA_WIDTH(8),
-        .ID_ENABLE(0),
-        .DEST_ENABLE(0),
-        .USER_ENABLE(0)
-    ) rgb_unpack (
-        .clk(core_clk),
-        .rst(~rstn_sync),
-        .s_axis_tdata({3{mag_data[WIDTH_P-1:0]}}),
-        .s_axis_tkeep(3'b111),
-        .s_axis_tvalid(mag_valid),
-        .s_axis_tready(mag_ready),
-        .s_axis_tlast(1'b0),
-        .s_axis_tid('0),
-        .s_axis_tdest('0),
-        .s_axis_tuser('0),
-        .m_axis_tdata(uart_tx_data),
-        .m_axis_tkeep(),
-        .m_axis_tvalid(uart_tx_valid),
-        .m_axis_tready(uart_tx_ready),
-        .m_axis_tlast(),
-        .m_axis_tid(),
-        .m_axis_tdest(),
-        .m_axis_tuser()
+    logic [0:0] edge_valid;
+    logic [0:0] edge_ready;
+    logic [WIDTH_P-1:0] edge_data;
+
+    generate
+        if (BINARY_OUT_P) begin : gen_binary_out
+            threshold #(
+                .WIDTH_P(WIDTH_P)
+            ) threshold_inst (
+                .clk_i(core_clk),
+                .rstn_i(rstn_sync),
+                .valid_i(mag_valid),
+                .ready_i(edge_ready),
+                .data_i(mag_data[WIDTH_P-1:0]),
+                .threshold_i(threshold),
+                .valid_o(edge_valid),
+                .ready_o(mag_ready),
+                .data_o(edge_data)
+            );
+        end else begin : gen_mag_out
+            assign edge_data = mag_data[WIDTH_P-1:0];
+            assign edge_valid = mag_valid;
+            assign mag_ready = edge_ready;
+        end
+    endgenerate
+
+    logic [7:0] tx_data;
+    logic [0:0] tx_valid;
+    logic [0:0] tx_ready;
+
+    frame_tx #(
+        .WIDTH_P(WIDTH_P),
+        .BPP_P(GRAY_OUT_P ? 1 : 3),
+        .PACK_P(BINARY_OUT_P)
+    ) frame_tx_inst (
+        .clk_i(core_clk),
+        .rstn_i(rstn_sync),
+        .data_i(edge_data),
+        .valid_i(edge_valid),
+        .ready_o(edge_ready),
+        .width_i(tx_hdr_width),
+        .height_i(tx_hdr_height),
+        .hdr_valid_i(tx_hdr_valid),
+        .hdr_ready_o(tx_hdr_ready),
+        .status_i(tx_status),
+        .status_valid_i(tx_status_valid),
+        .status_ready_o(tx_status_ready),
+        .row_bad_i(tx_row_bad),
+        .row_valid_i(tx_row_valid),
+        .row_ready_o(tx_row_ready),
+        .data_o(tx_data),
+        .valid_o(tx_valid),
+        .ready_i(tx_ready)
+    );
+
+    // the uart takes a byte combinationally on the tick that ends a stop bit, so its ready
+    // would run back through frame_tx and every stage's handshake; the fifo's comes from its
+    // pointers
+    fifo_sync #(
+        .WIDTH_P(8),
+        .DEPTH_P(4)
+    ) tx_fifo (
+        .clk_i(core_clk),
+        .rstn_i(rstn_sync),
+        .data_i(tx_data),
+        .valid_i(tx_valid),
+        .ready_i(uart_tx_ready),
+        .valid_o(uart_tx_valid),
+        .ready_o(tx_ready),
+        .data_o(uart_tx_data)
     );
 
 endmodule
@@ -0,0 +1,85 @@
+`timescale 1ns/1ps
+
+// testbench only: the sobel top with a stream_source forced onto the input of rx_fifo and a
+// stream_sink onto the output of frame_tx, so whole frames run inside the simulator without
+// the serial bit timing (make FAST=1). The line stays idle and the uart's own handshakes
+// are overridden
+module sobel_fast
+#(
+    parameter WIDTH_P = 8,
+    parameter LINE_W_P = 640,
+    parameter FIFO_DEPTH_P = 2048,
+    parameter BAUD_P = 3000000,
+    parameter GRAY_OUT_P = 0,
+    parameter GRAY_IN_P = 0,
+    parameter BINARY_OUT_P = 0,
+    parameter TOKENS_P = 1 << 19
+)(
+    input logic [0:0] mclk_i,
+    input logic [0:0] rstn_i,
+    // the PLL output the source, the sink and the whole pipeline run on
+    output logic [0:0] core_clk_o,
+    input logic [0:0] load_i,
+    input logic [31:0] in_count_i,
+    input logic [31:0] out_count_i,
+    output logic [31:0] sent_o,
+    output logic [31:0] received_o,
+    output logic [0:0] done_o
+);
+    logic [0:0] rx_valid;
+    logic [7:0] rx_data;
+    logic [0:0] tx_ready;
+
+    sobel #(
+        .WIDTH_P(WIDTH_P),
+        .LINE_W_P(LINE_W_P),
+        .FIFO_DEPTH_P(FIFO_DEPTH_P),
+        .BAUD_P(BAUD_P),
+        .GRAY_OUT_P(GRAY_OUT_P),
+        .GRAY_IN_P(GRAY_IN_P),
+        .BINARY_OUT_P(BINARY_OUT_P)
+    ) dut (
+        .mclk_i(mclk_i),
+        .rstn_i(rstn_i),
+        .uart_rxd_i(1'b1),
+        .uart_txd_o()
+    );
+
+    assign core_clk_o = dut.core_clk;
+
+    // forced again on every change, verilator only evaluates the right hand side of a force
+    // when it executes
+    always @(rx_valid, rx_data, tx_ready) begin
+        force dut.uart_rx_valid = rx_valid;
+        force dut.uart_rx_data = rx_data;
+        force dut.uart_tx_ready = tx_ready;
+    end
+
+    stream_source #(
+        .WIDTH_P(8),
+        .DEPTH_P(TOKENS_P)
+    ) source (
+        .clk_i(core_clk_o),
+        .load_i(load_i),
+        .count_i(in_count_i),
+        .valid_o(rx_valid),
+        .ready_i(dut.uart_rx_ready),
+        .data_o(rx_data),
+        .sent_o(sent_o)
+    );
+
+    stream_sink #(
+        .WIDTH_P(8),
+        .DEPTH_P(TOKENS_P)
+    ) sink (
+        .clk_i(core_clk_o),
+        .load_i(load_i),
+        .count_i(out_count_i),
+        .valid_i(dut.uart_tx_valid),
+        .ready_o(tx_ready),
+        .data_i(dut.uart_tx_data),
+        .received_o(received_o),
+        .done_o(done_o)
+    );
+
+endmodule
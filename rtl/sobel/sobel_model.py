@@ -0,0 +1,430 @@
+"""Bit-exact NumPy model of the sobel top level.
+
+Every stage works on whole arrays instead of one pixel at a time, so a
+640x480 frame runs in a few milliseconds. The model reproduces the RTL
+arithmetic exactly: the shift-approximated rgb2gray, the [1 2 1] / 16 box
+blur, the one-token output register of conv2d_box, the Sobel correlation on
+the low byte of the blur, the WIDTH_P-bit truncation of |gx| and |gy| and the
+saturating add in magnitude. Line buffer contents before the first pixel are
+taken as zero, which is what the block RAMs hold after configuration.
+
+``FramedDevice`` adds the frame_rx / frame_tx byte protocol on top of the
+pipeline: every frame is ``SOF, W, H`` (16-bit little endian) followed by
+its rows, each closed by the CRC-16 of its bytes. The device flushes each
+frame out of the line buffers with flush_len() zero pixels and answers with
+the same header, the rows of the edge map with a two pixel zero border, each
+again closed by its CRC, a trailer() with the error flags and the range of
+input rows that failed their CRC, and ``EOF``. The CRC of an output row goes
+out inverted when an input row it depends on failed, so the host finds every
+row it has to send again by checking CRCs alone.
+
+A device built with BINARY_OUT_P=1 thresholds the magnitudes and packs the
+edge map eight pixels to a byte, MSB first, each row padded to whole bytes
+(``out_bpp`` PACKED). Between frames the host sets the threshold with
+config(); a pixel is an edge when its magnitude is strictly above it.
+"""
+
+import binascii
+from collections import deque
+
+import numpy as np
+
+BOX_KERNEL = np.array([[1, 2, 1], [2, 4, 2], [1, 2, 1]], dtype=np.int32)
+X_KERNEL = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]], dtype=np.int32)
+Y_KERNEL = np.array([[-1, -2, -1], [0, 0, 0], [1, 2, 1]], dtype=np.int32)
+
+SOF, EOF = 0xA5, 0x5A
+# outside a frame, CFG and the byte after it set the threshold of the frames that follow
+CFG = 0xC3
+# out_bpp of a BINARY_OUT_P=1 device, one bit per pixel
+PACKED = 0
+HEADER_LEN = 5
+CRC_LEN = 2
+TRAILER_LEN = 5
+# trailer flags: an input row failed its CRC, the line went idle mid-frame and frame_rx
+# padded the rest, uart_rx lost a byte to a full rx_fifo, or saw a bad stop bit
+CRC_ERROR, TIMEOUT, OVERRUN, FRAMING = 0x01, 0x02, 0x04, 0x08
+NO_ROW = 0xFFFF
+# outside this border the 5x5 support of blur + sobel wraps across lines or frames
+BORDER = 2
+
+
+def rgb2gray(rgb, width_p=8):
+    """rgb2gray on an (..., 3) array of red, green, blue samples."""
+    rgb = np.asarray(rgb, dtype=np.int32)
+    red, green, blue = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    mask = (1 << width_p) - 1
+    red_term = ((red >> 2) + (red >> 5)) & mask
+    green_term = ((green >> 1) + (green >> 4)) & mask
+    blue_term = ((blue >> 4) + (blue >> 5)) & mask
+    return ((red_term + green_term + blue_term) & mask).astype(np.uint8 if width_p <= 8 else np.uint32)
+
+
+def magnitude(gx, gy, width_p=8):
+    """magnitude on already truncated |gx| and |gy|."""
+    total = np.asarray(gx, dtype=np.int32) + np.asarray(gy, dtype=np.int32)
+    return np.minimum(total, (1 << width_p) - 1)
+
+
+def threshold(mag, level, width_p=8):
+    """threshold: all ones where the magnitude is strictly above ``level``, else zero."""
+    return np.where(np.asarray(mag) > level, (1 << width_p) - 1, 0)
+
+
+def correlate_stream(stream, history, depth, kernel):
+    """3x3 correlation of the line buffer window seen by each token of a flat stream.
+
+    ``history`` holds the 2*depth+2 tokens accepted before ``stream``. Token m
+    sees rows m-2*depth, m-depth and m, each with columns m-2, m-1 and m, which
+    is how ramdelaybuffer and the conv_window shift register line up.
+    """
+    padded = np.concatenate((history, stream))
+    count = len(stream)
+    span = 2 * depth + 2
+    total = np.zeros(count, dtype=np.int32)
+    for r in range(3):
+        for c in range(3):
+            if kernel[r, c]:
+                offset = span - (2 - r) * depth - (2 - c)
+                total += kernel[r, c] * padded[offset:offset + count]
+    return total
+
+
+class LineBuffer:
+    """Token at a time model of the ramdelaybuffer line buffer and its 3x3 window.
+
+    ``push`` takes one token and returns one correlation per kernel for the
+    window it completes, the same window correlate_stream() sees, or None
+    until 2*width+3 tokens are in. The last 2*width+3 tokens sit in a ring,
+    so each token costs a fixed number of lookups whatever the width.
+    """
+
+    def __init__(self, width, *kernels):
+        self.size = 2 * width + 3
+        self.ring = [0] * self.size
+        self.count = 0
+        # ring offset from the oldest token of the window and weight of every nonzero tap
+        self.taps = [[(r * width + c, int(kernel[r, c])) for r in range(3) for c in range(3) if kernel[r, c]]
+                     for kernel in kernels]
+
+    def push(self, token):
+        self.ring[self.count % self.size] = int(token)
+        self.count += 1
+        if self.count < self.size:
+            return None
+        ring, size, oldest = self.ring, self.size, self.count % self.size
+        return tuple(sum(weight * ring[(oldest + offset) % size] for offset, weight in taps) for taps in self.taps)
+
+
+def correlate_frame(tokens, width, kernel):
+    """correlate_stream() over a whole stream sent into empty line buffers, None for the first 2*width+2 tokens."""
+    tokens = np.asarray(tokens, dtype=np.int32).ravel()
+    warmup = min(2 * width + 2, len(tokens))
+    total = correlate_stream(tokens, np.zeros(2 * width + 2, dtype=np.int32), width, kernel)
+    return [None] * warmup + total[warmup:].tolist()
+
+
+class PipelineModel:
+    """Streaming model of the sobel top with the same state the device carries.
+
+    ``push_gray`` takes gray pixels in the order they enter conv2d_box and
+    returns one magnitude per pixel, exactly as the device emits them. The
+    output lags the input by warmup() pixels, so frames sent back to back
+    see the previous frame in their top rows, just like the hardware.
+    """
+
+    def __init__(self, line_w=640, width_p=8):
+        self.line_w = line_w
+        self.width_p = width_p
+        self.reset()
+
+    def resize(self, line_w):
+        """Switch the line buffers to another width, as the device does between frames."""
+        if line_w != self.line_w:
+            self.line_w = line_w
+            self.reset()
+
+    def reset(self):
+        span = 2 * self.line_w + 2
+        self.gray_history = np.zeros(span, dtype=np.int32)
+        self.blur_history = np.zeros(span, dtype=np.int32)
+        self.blur_last = 0
+        self.rgb_partial = b""
+
+    def warmup(self):
+        return 2 * self.line_w + 2
+
+    def push_gray(self, gray):
+        gray = np.asarray(gray, dtype=np.int32).ravel()
+        if gray.size == 0:
+            return np.zeros(0, dtype=np.uint8)
+        mask = (1 << self.width_p) - 1
+        span = 2 * self.line_w + 2
+
+        blur = (correlate_stream(gray, self.gray_history, self.line_w, BOX_KERNEL) >> 4) & mask
+        self.gray_history = np.concatenate((self.gray_history, gray))[-span:]
+
+        # conv2d_box registers gx_o on the output handshake, so conv2d sees the previous blur
+        lagged = np.concatenate(([self.blur_last], blur[:-1])).astype(np.int32)
+        self.blur_last = int(blur[-1])
+
+        gx = correlate_stream(lagged, self.blur_history, self.line_w, X_KERNEL)
+        gy = correlate_stream(lagged, self.blur_history, self.line_w, Y_KERNEL)
+        self.blur_history = np.concatenate((self.blur_history, lagged))[-span:]
+
+        mag = magnitude(np.abs(gx) & mask, np.abs(gy) & mask, self.width_p)
+        return mag.astype(np.uint8 if self.width_p <= 8 else np.uint32)
+
+    def push_rgb(self, data):
+        """Feed raw R, G, B bytes as they arrive over the UART, return one byte per pixel."""
+        data = self.rgb_partial + bytes(data)
+        whole = len(data) - len(data) % 3
+        self.rgb_partial = data[whole:]
+        pixels = np.frombuffer(data[:whole], dtype=np.uint8).reshape(-1, 3)
+        return self.push_gray(rgb2gray(pixels, self.width_p))
+
+
+def header(width, height):
+    return bytes([SOF]) + width.to_bytes(2, "little") + height.to_bytes(2, "little")
+
+
+def row_crc(data, crc=0):
+    """CRC-16/XMODEM of a row's bytes, which can be fed in pieces by passing the last value."""
+    return binascii.crc_hqx(data, crc)
+
+
+def rows_crc(rows):
+    """CRC-16 of every row of a (height, n) uint8 array."""
+    return np.array([binascii.crc_hqx(row, 0) for row in rows], dtype=np.uint16)
+
+
+def config(level):
+    """Bytes that set the threshold of a BINARY_OUT_P=1 device, sent before a header."""
+    return bytes([CFG, level])
+
+
+def row_len(width, out_bpp):
+    """Bytes of an output row without its CRC."""
+    return (width + 7) // 8 if out_bpp == PACKED else width * out_bpp
+
+
+def unpack(rows, width, out_bpp):
+    """(n, width * channels) edge map bytes of (n, row_len()) output rows, packed bits as 0 or 255."""
+    if out_bpp != PACKED:
+        return rows
+    return np.unpackbits(rows, axis=1, count=width) * np.uint8(255)
+
+
+def trailer(flags=0, first=NO_ROW, last=0):
+    """Status the device sends before EOF: flags, first and last input row that failed its CRC."""
+    return bytes([flags]) + first.to_bytes(2, "little") + last.to_bytes(2, "little")
+
+
+def flush_len(width):
+    """Zero pixels frame_rx appends to a frame, and tokens frame_tx skips at its start.
+
+    An output token lags the pixel its window is centred on by two lines and
+    three tokens, one of them the conv2d_box output register.
+    """
+    return 2 * width + 3
+
+
+def border_mask(height, width):
+    mask = np.zeros((height, width), dtype=bool)
+    mask[BORDER:height - BORDER, BORDER:width - BORDER] = True
+    return mask
+
+
+class FramedDevice:
+    """Byte level model of the framed sobel top: frame_rx, the pipeline and frame_tx.
+
+    ``feed`` takes bytes as they leave rx_fifo and returns the bytes the
+    device sends back for them. Bytes outside a frame are skipped until the
+    next SOF. The line buffers take the width of each header, capped at
+    ``line_w`` (LINE_W_P); what they held before only reaches the border
+    frame_tx zeroes, so the edge map of a frame up to ``line_w`` wide
+    depends on that frame alone. Each header also takes the threshold the
+    last config() set, 0 after reset. ``timeout`` and
+    ``error`` stand in for the idle timer in frame_rx and the uart_rx error
+    outputs.
+    """
+
+    def __init__(self, line_w=640, in_bpp=3, out_bpp=3, width_p=8):
+        self.line_w = line_w
+        self.pipe = PipelineModel(line_w, width_p)
+        self.in_bpp = in_bpp
+        self.out_bpp = out_bpp
+        self.state = "sof"
+        self.header = bytearray()
+        self.check = bytearray()
+        self.left = 0
+        self.row = 0
+        self.crc = 0
+        self.padding = False
+        # uart errors count towards the frame whose payload ends next
+        self.flags = 0
+        self.segments = deque()
+        self.token = 0
+        self.out_crc = 0
+        self.threshold = 0
+        # packed bits of a row that do not fill a byte yet
+        self.bits = np.zeros(0, dtype=bool)
+
+    def feed(self, data):
+        data = memoryview(bytes(data))
+        out = []
+        while len(data):
+            if self.state == "pixels":
+                take = min(self.left, len(data))
+                self.crc = row_crc(data[:take], self.crc)
+                out.append(self.pixels(data[:take]))
+                self.left -= take
+                data = data[take:]
+                if not self.left:
+                    self.state = "crc"
+            elif self.state == "crc":
+                take = min(CRC_LEN - len(self.check), len(data))
+                self.check += data[:take]
+                data = data[take:]
+                if len(self.check) == CRC_LEN:
+                    out.append(self.end_row(int.from_bytes(self.check, "little") == self.crc))
+            elif self.state == "header":
+                take = min(HEADER_LEN - len(self.header), len(data))
+                self.header += data[:take]
+                data = data[take:]
+                if len(self.header) == HEADER_LEN:
+                    width = int.from_bytes(self.header[1:3], "little")
+                    height = int.from_bytes(self.header[3:5], "little")
+                    self.segments.append((width, height, [0, NO_ROW, 0], set(), self.threshold))
+                    if width:
+                        # sobel.sv holds a new width back until the pipeline is empty
+                        self.pipe.resize(min(width, self.line_w))
+                    self.row = 0
+                    out.append(header(width, height))
+                    out.append(self.start_row())
+            elif self.state == "cfg":
+                self.threshold = data[0]
+                self.state = "sof"
+                data = data[1:]
+            else:
+                marks = np.flatnonzero(np.isin(np.frombuffer(data, dtype=np.uint8), (SOF, CFG)))
+                if not len(marks):
+                    break
+                start = marks[0]
+                if data[start] == CFG:
+                    self.state = "cfg"
+                else:
+                    self.state = "header"
+                    self.header = bytearray(data[start:start + 1])
+                data = data[start + 1:]
+        return b"".join(out)
+
+    def timeout(self):
+        """Pad the rest of a frame the line stopped sending, every row from here on fails its CRC."""
+        out = []
+        if self.state in ("pixels", "crc"):
+            self.padding = True
+            self.flags |= TIMEOUT
+        while self.state in ("pixels", "crc"):
+            out.append(self.feed(bytes(self.left if self.state == "pixels" else CRC_LEN - len(self.check))))
+        return b"".join(out)
+
+    def error(self, flag):
+        self.flags |= flag
+
+    def start_row(self):
+        width, height, status, bad = self.segments[-1][:4]
+        if width and self.row < height:
+            self.state = "pixels"
+            self.left = width * self.in_bpp
+            self.crc = 0
+            self.check = bytearray()
+            return b""
+        # the payload is over: settle the status and push the flush
+        status[0] |= self.flags
+        self.flags = 0
+        self.padding = False
+        self.state = "sof"
+        return self.tokens(self.pipe.push_gray(np.zeros(flush_len(width), dtype=np.int32)))
+
+    def end_row(self, ok):
+        status, bad = self.segments[-1][2:4]
+        if not ok or self.padding:
+            bad.add(self.row)
+            status[0] |= CRC_ERROR
+            status[1] = min(status[1], self.row)
+            status[2] = self.row
+        self.row += 1
+        return self.start_row()
+
+    def pixels(self, data):
+        if self.in_bpp == 1:
+            return self.tokens(self.pipe.push_gray(np.frombuffer(data, dtype=np.uint8)))
+        return self.tokens(self.pipe.push_rgb(data))
+
+    def tokens(self, mag):
+        # frame_tx drops the first flush_len() tokens of a segment, zeroes the border of the
+        # next W*H, closes every row with its CRC, inverted when an input row within BORDER
+        # failed, and the frame with the trailer and EOF once the flush has gone through
+        out = []
+        while len(mag):
+            width, height, status, bad, level = self.segments[0]
+            skip = flush_len(width)
+            total = skip + width * height
+            take = min(len(mag), total - self.token)
+            index = np.arange(self.token, self.token + take) - skip
+            keep = index >= 0
+            pixel = index[keep]
+            inside = ((pixel // width >= BORDER) & (pixel // width < height - BORDER) &
+                      (pixel % width >= BORDER) & (pixel % width < width - BORDER))
+            edge = np.where(inside, mag[:take][keep], 0)
+            if self.out_bpp == PACKED:
+                edge = edge > level
+            start = 0
+            for last in np.flatnonzero(pixel % width == width - 1):
+                data = self.encode(edge[start:last + 1], True)
+                row = pixel[last] // width
+                self.out_crc = row_crc(data, self.out_crc)
+                if bad.intersection(range(row - BORDER, row + BORDER + 1)):
+                    self.out_crc ^= 0xFFFF
+                out.append(data + self.out_crc.to_bytes(CRC_LEN, "little"))
+                self.out_crc = 0
+                start = last + 1
+            data = self.encode(edge[start:], False)
+            self.out_crc = row_crc(data, self.out_crc)
+            out.append(data)
+            self.token += take
+            mag = mag[take:]
+            if self.token == total:
+                out.append(trailer(*status) + bytes([EOF]))
+                self.segments.popleft()
+                self.token = 0
+        return b"".join(out)
+
+    def encode(self, edge, row_end):
+        # the bytes frame_tx sends for these pixels of a row; packed, a byte goes out once it
+        # has eight of them or the row ends
+        if self.out_bpp != PACKED:
+            return np.repeat(edge.astype(np.uint8), self.out_bpp).tobytes()
+        bits = np.concatenate((self.bits, edge))
+        whole = len(bits) if row_end else len(bits) - len(bits) % 8
+        self.bits = bits[whole:]
+        return np.packbits(bits[:whole]).tobytes()
+
+
+def stream(gray, line_w=640, width_p=8):
+    """Device output for a flat gray stream sent right after configuration."""
+    return PipelineModel(line_w, width_p).push_gray(gray)
+
+
+def frame(rgb, width_p=8):
+    """Edge map the framed device returns for one (H, W, 3) frame."""
+    rgb = np.asarray(rgb)
+    height, width = rgb.shape[:2]
+    model = PipelineModel(width, width_p)
+    skip = flush_len(width)
+    out = np.concatenate((
+        model.push_gray(rgb2gray(rgb, width_p).ravel()),
+        model.push_gray(np.zeros(skip, dtype=np.int32)),
+    ))
+    return np.where(border_mask(height, width), out[skip:].reshape(height, width), 0).astype(out.dtype)
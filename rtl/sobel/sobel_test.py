@@ -0,0 +1,157 @@
+import os
+from pathlib import Path
+
+import cv2 as cv
+import numpy as np
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import RisingEdge, Timer
+from cocotb.utils import get_sim_time
+
+import sobel_model
+from handshake import Replay, Scoreboard, UartLine
+
+# the iCEBreaker's 12 MHz oscillator, the PLL makes the 30 MHz core clock from it
+MCLK_PERIOD_PS = 83_334
+# 1: the top is sobel_fast and whole frames go into rx_fifo and come out of frame_tx inside the
+# simulator, 0: a host uart line at BAUD_P sends every bit and samples the replies
+FAST = os.environ.get("FAST", "0") == "1"
+
+
+def core(dut):
+    # the sobel instance and its core clock
+    return (dut.dut, dut.core_clk_o) if FAST else (dut, dut.core_clk)
+
+
+class ModelManager:
+    def __init__(self, dut):
+        self.in_bpp = 1 if int(dut.GRAY_IN_P.value) else 3
+        if int(dut.BINARY_OUT_P.value):
+            out_bpp = sobel_model.PACKED
+        else:
+            out_bpp = 1 if int(dut.GRAY_OUT_P.value) else 3
+        self.device = sobel_model.FramedDevice(int(dut.LINE_W_P.value), self.in_bpp, out_bpp,
+                                               int(dut.WIDTH_P.value))
+
+    def expected(self, stream):
+        return list(self.device.feed(stream))
+
+
+class TestManager:
+    def __init__(self, dut, frames):
+        # frames holds (pixels, level) pairs, pixels a (height, width * bpp) array and level the
+        # threshold sent ahead of the header, or None for no config
+        self.dut = dut
+        self.model = ModelManager(dut)
+        stream = bytearray()
+        for pixels, level in frames:
+            if level is not None:
+                stream += sobel_model.config(level)
+            height, row_len = pixels.shape
+            stream += sobel_model.header(row_len // self.model.in_bpp, height)
+            for row, crc in zip(pixels, sobel_model.rows_crc(pixels)):
+                stream += row.tobytes() + int(crc).to_bytes(sobel_model.CRC_LEN, "little")
+        self.stream = bytes(stream)
+        self.scoreboard = Scoreboard("uart_tx_data" if FAST else "uart_txd_o", self.model.expected(self.stream))
+
+    async def receive(self, line):
+        # until every expected byte is in and the line has been quiet for three more characters
+        character = Timer(10 * line.bit_ps, unit="ps")
+        quiet = 0
+        for _ in range(20 * len(self.scoreboard) + 1000):
+            count = len(line.received)
+            await character
+            quiet = quiet + 1 if len(line.received) == count else 0
+            if len(line.received) >= len(self.scoreboard) and quiet >= 3:
+                return
+        raise AssertionError(f"Timed out with {len(line.received)} of {len(self.scoreboard)} bytes received")
+
+    async def run(self):
+        dut = self.dut
+        _, clk = core(dut)
+        await RisingEdge(clk)
+        start = get_sim_time()
+        await RisingEdge(clk)
+        period = get_sim_time() - start
+        start = get_sim_time()
+        if FAST:
+            outputs = await Replay(dut, list(self.stream), len(self.scoreboard), clk="core_clk_o").run()
+        else:
+            line = UartLine(dut, int(dut.BAUD_P.value), rxd="uart_rxd_i", txd="uart_txd_o")
+            receiver = cocotb.start_soon(line.receive())
+            try:
+                await line.send(self.stream)
+                await self.receive(line)
+            finally:
+                receiver.cancel()
+            outputs = line.received
+        cycles = round((get_sim_time() - start) / period)
+        dut._log.info(f"{len(self.stream)} bytes in, {len(outputs)} out in {cycles} core clocks, "
+                      f"{len(self.stream) / cycles:.4f} in and {len(outputs) / cycles:.4f} out per core clock")
+        self.scoreboard.check(outputs)
+
+
+async def clock_test(dut):
+    cocotb.start_soon(Clock(dut.mclk_i, MCLK_PERIOD_PS, unit="ps").start())
+    await Timer(5 * MCLK_PERIOD_PS, unit="ps")
+
+
+async def reset_test(dut):
+    # rstn_i also resets the PLL, so the core clock only starts once it is released, and the
+    # core sees rstn_sync low for the two cycles its synchronizer takes to fill. each test
+    # starts from those flops cleared, as configuration leaves them
+    top, clk = core(dut)
+    dut.rstn_i.value = 0
+    if FAST:
+        dut.load_i.value = 0
+    else:
+        dut.uart_rxd_i.value = 1
+    top.rstn_sync_inst.sync_m.value = 0
+    top.rstn_sync_inst.sync_o.value = 0
+    await Timer(10 * MCLK_PERIOD_PS, unit="ps")
+    dut.rstn_i.value = 1
+    for _ in range(10):
+        await RisingEdge(clk)
+
+
+def random_frame(width, height, bpp, seed):
+    return np.random.default_rng(seed).integers(0, 256, (height, width * bpp), dtype=np.uint8)
+
+
+@cocotb.test()
+async def single_frame_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    bpp = ModelManager(dut).in_bpp
+    await TestManager(dut, [(random_frame(16, 8, bpp, 1), None)]).run()
+
+
+@cocotb.test()
+async def back_to_back_test(dut):
+    # frames of other widths and thresholds wait for the pipeline to empty, the rest follow
+    # straight on
+    await clock_test(dut)
+    await reset_test(dut)
+    bpp = ModelManager(dut).in_bpp
+    sizes = [(16, 6), (8, 5), (8, 4), (16, 7), (5, 6), (20, 4), (16, 5), (11, 6)]
+    levels = [40, 40, 90, 0, 0, 200, 60, 60]
+    frames = [(random_frame(width, height, bpp, seed), level)
+              for seed, ((width, height), level) in enumerate(zip(sizes, levels))]
+    await TestManager(dut, frames).run()
+
+
+@cocotb.test()
+async def image_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    img_path = Path(__file__).resolve().parents[2] / "jupyter" / "car.jpg"
+    img = cv.imread(str(img_path))
+    if img is None:
+        raise FileNotFoundError(img_path)
+    img = cv.resize(img, (160, 120) if FAST else (32, 24), interpolation=cv.INTER_AREA)
+    if ModelManager(dut).in_bpp == 1:
+        pixels = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+    else:
+        pixels = cv.cvtColor(img, cv.COLOR_BGR2RGB).reshape(img.shape[0], -1)
+    await TestManager(dut, [(np.ascontiguousarray(pixels), 64)]).run()
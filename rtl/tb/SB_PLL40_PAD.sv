@@ -0,0 +1,68 @@
+`timescale 1ns/1ps
+
+// testbench only: a behavioural SB_PLL40_PAD for simulating the sobel top, in place of the
+// blackbox in submodules/imports that synth_ice40 maps to the hard PLL. In SIMPLE feedback
+// the output runs at PACKAGEPIN * (DIVF+1) / ((DIVR+1) * 2^DIVQ), 12 MHz * 10 / 4 = 30 MHz
+// for sobel.sv, once two reference edges have set the period. RESETB low stops the output
+// and drops LOCK, BYPASS passes the reference through. Needs --timing under verilator
+module SB_PLL40_PAD (
+    input logic PACKAGEPIN,
+    output logic PLLOUTCORE,
+    output logic PLLOUTGLOBAL,
+    input logic EXTFEEDBACK,
+    input logic [7:0] DYNAMICDELAY,
+    output logic LOCK,
+    input logic BYPASS,
+    input logic RESETB,
+    input logic LATCHINPUTVALUE,
+    output logic SDO,
+    input logic SDI,
+    input logic SCLK
+);
+    parameter FEEDBACK_PATH = "SIMPLE";
+    parameter DELAY_ADJUSTMENT_MODE_FEEDBACK = "FIXED";
+    parameter DELAY_ADJUSTMENT_MODE_RELATIVE = "FIXED";
+    parameter SHIFTREG_DIV_MODE = 1'b0;
+    parameter FDA_FEEDBACK = 4'b0000;
+    parameter FDA_RELATIVE = 4'b0000;
+    parameter PLLOUT_SELECT = "GENCLK";
+    parameter DIVR = 4'b0000;
+    parameter DIVF = 7'b0000000;
+    parameter DIVQ = 3'b000;
+    parameter FILTER_RANGE = 3'b000;
+    parameter ENABLE_ICEGATE = 1'b0;
+    parameter TEST_MODE = 1'b0;
+    parameter EXTERNAL_DIVIDE_FACTOR = 1;
+
+    localparam real RATIO = (DIVR + 1.0) * (1 << DIVQ) / (DIVF + 1.0);
+
+    realtime ref_edge = 0.0;
+    realtime ref_period = 0.0;
+    logic [0:0] clk_l = 1'b0;
+    logic [0:0] lock_l = 1'b0;
+
+    always @(posedge PACKAGEPIN) begin
+        if (ref_edge != 0.0) begin
+            ref_period = $realtime - ref_edge;
+        end
+        ref_edge = $realtime;
+    end
+
+    always begin
+        if (!RESETB || (ref_period == 0.0)) begin
+            clk_l = 1'b0;
+            lock_l = 1'b0;
+            @(posedge PACKAGEPIN);
+        end else begin
+            #(ref_period * RATIO / 2.0);
+            clk_l = ~clk_l;
+            lock_l = 1'b1;
+        end
+    end
+
+    assign PLLOUTCORE = BYPASS ? PACKAGEPIN : clk_l;
+    assign PLLOUTGLOBAL = PLLOUTCORE;
+    assign LOCK = lock_l;
+    assign SDO = 1'b0;
+
+endmodule
@@ -0,0 +1,11 @@
+"""valid/ready drivers, monitors and scoreboards shared by the block testbenches, Replay,
+which runs a whole stream inside the simulator, and UartLine, the host end of a uart line."""
+
+from .driver import Driver
+from .monitor import Monitor
+from .scoreboard import Scoreboard
+from .loop import always, rate, run_until, stride
+from .replay import Replay
+from .uart import UartLine
+
+__all__ = ["Driver", "Monitor", "Replay", "Scoreboard", "UartLine", "always", "rate", "run_until", "stride"]
@@ -0,0 +1,61 @@
+import numpy as np
+
+from .loop import always
+
+
+def signals(dut, names):
+    # handles are looked up once, not every cycle
+    return [getattr(dut, name) for name in ((names,) if isinstance(names, str) else names)]
+
+
+class Driver:
+    # feeds tokens into a valid/ready input, one value per data signal in each token. without a
+    # valid the data signals carry their own enables and are zeroed on idle cycles; without a
+    # ready every token driven counts as taken
+    def __init__(self, dut, tokens, data="data_i", valid="valid_i", ready="ready_o", pattern=None,
+                 on_accept=None):
+        self.tokens = tokens.tolist() if isinstance(tokens, np.ndarray) else list(tokens)
+        self.data = signals(dut, data)
+        self.valid = getattr(dut, valid) if valid else None
+        self.ready = getattr(dut, ready) if ready else None
+        self.pattern = pattern or always
+        self.on_accept = on_accept
+        self.index = 0
+        self.driven = False
+
+    def done(self):
+        return self.index >= len(self.tokens)
+
+    def drive(self, cycle):
+        self.driven = self.index < len(self.tokens) and self.pattern(cycle)
+        if self.valid is not None:
+            self.valid.value = int(self.driven)
+        if self.driven:
+            token = self.tokens[self.index]
+            if len(self.data) == 1:
+                self.data[0].value = int(token)
+            else:
+                for signal, value in zip(self.data, token):
+                    signal.value = int(value)
+        elif self.valid is None:
+            self.zero()
+
+    def sample(self):
+        # one read of ready, after it has settled on this cycle's inputs
+        if not self.driven or (self.ready is not None and not self.ready.value):
+            return
+        token = self.tokens[self.index]
+        self.index += 1
+        if self.on_accept is not None:
+            self.on_accept(token)
+
+    def zero(self):
+        for signal in self.data:
+            signal.value = 0
+
+    def idle(self):
+        self.driven = False
+        if self.valid is not None:
+            self.valid.value = 0
+        else:
+            self.zero()
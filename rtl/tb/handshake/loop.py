@@ -0,0 +1,41 @@
+from cocotb.triggers import FallingEdge, Timer
+
+
+def always(cycle):
+    return True
+
+
+def stride(n):
+    # every nth cycle, as the testbenches' in_stride and out_stride
+    return lambda cycle: cycle % n == 0
+
+
+def rate(p, rng):
+    # each cycle with probability p, drawn from rng so a seed replays the same pattern
+    return lambda cycle: rng.random() < p
+
+
+async def run_until(clk, drivers, monitors, done, timeout=None):
+    # drive on the falling edge, then sample once ready_o and valid_o have settled; the handshakes
+    # seen there happen on the next rising edge. returns the number of cycles run
+    settle = Timer(1, unit="ns")
+    endpoints = list(drivers) + list(monitors)
+    cycle = 0
+    try:
+        while not done():
+            await FallingEdge(clk)
+            cycle += 1
+            assert timeout is None or cycle <= timeout, f"Timed out after {cycle} cycles"
+            for endpoint in endpoints:
+                endpoint.drive(cycle)
+            await settle
+            for monitor in monitors:
+                monitor.sample()
+            for driver in drivers:
+                driver.sample()
+        # let the last handshake happen on the edge it was counted for
+        await FallingEdge(clk)
+    finally:
+        for endpoint in endpoints:
+            endpoint.idle()
+    return cycle
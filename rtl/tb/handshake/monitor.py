@@ -0,0 +1,43 @@
+from .driver import signals
+from .loop import always
+
+
+class Monitor:
+    # collects what a valid/ready output hands over, a value per output or a tuple with one per
+    # data signal, None where the bits do not resolve. without a valid it collects every cycle
+    def __init__(self, dut, data="data_o", valid="valid_o", ready="ready_i", pattern=None, signed=False):
+        self.data = signals(dut, data)
+        self.valid = getattr(dut, valid) if valid else None
+        self.ready = getattr(dut, ready) if ready else None
+        self.pattern = pattern or always
+        self.signed = signed
+        self.values = []
+        self.taking = False
+
+    def __len__(self):
+        return len(self.values)
+
+    def drive(self, cycle):
+        self.taking = self.pattern(cycle)
+        if self.ready is not None:
+            self.ready.value = int(self.taking)
+
+    def read(self, signal):
+        value = signal.value
+        if not value.is_resolvable:
+            return None
+        return value.to_signed() if self.signed else int(value)
+
+    def sample(self):
+        # one read of valid and of each data signal
+        if not self.taking or (self.valid is not None and not self.valid.value):
+            return
+        if len(self.data) == 1:
+            self.values.append(self.read(self.data[0]))
+        else:
+            self.values.append(tuple(self.read(signal) for signal in self.data))
+
+    def idle(self):
+        self.taking = False
+        if self.ready is not None:
+            self.ready.value = 0
@@ -0,0 +1,93 @@
+import numpy as np
+
+from cocotb.triggers import FallingEdge, RisingEdge, with_timeout
+from cocotb.utils import get_sim_time
+
+from .loop import always
+
+# the files stream_source and stream_sink read and write, relative to the directory make runs in
+SOURCE_DATA = "sim_build/source_data.hex"
+SOURCE_PATTERN = "sim_build/source_pattern.hex"
+SINK_DATA = "sim_build/sink_data.hex"
+SINK_PATTERN = "sim_build/sink_pattern.hex"
+PATTERN_LEN = 1024
+
+
+def pack(tokens, fields):
+    # one word per token, the first field in the top bits as in an SV concatenation
+    columns = np.asarray(tokens, dtype=np.int64).reshape(-1, len(fields))
+    words = np.zeros(len(columns), dtype=np.int64)
+    for column, width in zip(columns.T, fields):
+        words = (words << width) | (column & ((1 << width) - 1))
+    return words
+
+
+def unpack(words, fields):
+    # the fields of each word, (width, signed) pairs, as a value or a tuple per output
+    columns = []
+    shift = sum(width for width, _ in fields)
+    for width, signed in fields:
+        shift -= width
+        column = (words >> shift) & ((1 << width) - 1)
+        if signed:
+            column = np.where(column >> (width - 1), column - (1 << width), column)
+        columns.append(column.tolist())
+    return columns[0] if len(columns) == 1 else list(zip(*columns))
+
+
+def write_hex(path, values):
+    with open(path, "w") as file:
+        file.write("".join(f"{int(value):x}\n" for value in values))
+
+
+def read_hex(path):
+    # $writememh output, without the address comments some simulators add
+    with open(path) as file:
+        lines = [line.split("//")[0].strip() for line in file]
+    return np.array([int(line, 16) for line in lines if line and not line.startswith("@")], dtype=np.int64)
+
+
+class Replay:
+    # runs a whole stream through a <block>_fast wrapper: the tokens and the valid/ready
+    # patterns go into stream_source and stream_sink through $readmemh, the simulator runs
+    # without python until done_o rises, and the outputs come back through $writememh.
+    # in_fields are the widths of the data signals concatenated into a source word, out_fields
+    # the (width, signed) pairs of a sink word, clk the clock source and sink run on
+    def __init__(self, dut, tokens, count, in_fields=(8,), out_fields=((8, False),), in_pattern=None,
+                 out_pattern=None, clk="clk_i"):
+        self.dut = dut
+        self.clk = getattr(dut, clk)
+        self.tokens = pack(tokens, in_fields)
+        self.count = count
+        self.out_fields = out_fields
+        self.patterns = (in_pattern or always, out_pattern or always)
+
+    async def run(self):
+        dut = self.dut
+        room = int(dut.TOKENS_P.value)
+        assert max(len(self.tokens), self.count) <= room, \
+            f"Stream of {len(self.tokens)} tokens, {self.count} outputs over TOKENS_P={room}, raise it with PARAMS"
+        in_pattern, out_pattern = self.patterns
+        # cycle n of the pattern is the nth after the load, as the nth drive of run_until
+        write_hex(SOURCE_DATA, self.tokens)
+        write_hex(SOURCE_PATTERN, (int(in_pattern(cycle)) for cycle in range(1, PATTERN_LEN + 1)))
+        write_hex(SINK_PATTERN, (int(out_pattern(cycle)) for cycle in range(1, PATTERN_LEN + 1)))
+        await FallingEdge(self.clk)
+        start = get_sim_time()
+        # the counts change under load_i, which holds valid and ready low
+        dut.load_i.value = 1
+        dut.in_count_i.value = len(self.tokens)
+        dut.out_count_i.value = self.count
+        await FallingEdge(self.clk)
+        period = int(get_sim_time() - start)
+        dut.load_i.value = 0
+        timeout = period * (100 * (len(self.tokens) + self.count) + 1000)
+        try:
+            await with_timeout(RisingEdge(dut.done_o), timeout, "step")
+        except TimeoutError:
+            raise AssertionError(f"Timed out with {int(dut.sent_o.value)} of {len(self.tokens)} tokens sent, "
+                                 f"{int(dut.received_o.value)} of {self.count} outputs received") from None
+        await FallingEdge(self.clk)
+        if not self.count:
+            return []
+        return unpack(read_hex(SINK_DATA), self.out_fields)
@@ -0,0 +1,59 @@
+import hashlib
+import os
+
+import numpy as np
+
+
+def table(values, fields=None):
+    # values as an int64 array of one row per output, with a mask of the fields that are known
+    if fields is None:
+        fields = next((len(value) for value in values if isinstance(value, tuple)), 1)
+    blank = (None,) * fields
+    rows = [blank if value is None else value if isinstance(value, tuple) else (value,) for value in values]
+    cells = np.array(rows, dtype=object).reshape(len(rows), fields)
+    known = np.not_equal(cells, None)
+    return np.where(known, cells, 0).astype(np.int64), known
+
+
+def record(name, outputs):
+    # with RECORD set, a digest of every checked stream is appended to it, so runs under two
+    # simulators can be compared (make parity)
+    path = os.environ.get("RECORD")
+    if not path:
+        return
+    got, known = table(outputs) if outputs else (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool))
+    digest = hashlib.sha1(got.tobytes() + known.tobytes()).hexdigest()[:16]
+    with open(path, "a") as file:
+        file.write(f"{name} {len(outputs)} {digest}\n")
+
+
+class Scoreboard:
+    # the expected outputs in order, None for an output or field that may hold anything. the
+    # queue is only appended to while the test runs and compared with the monitor's outputs
+    # in one pass at the end
+    def __init__(self, name="data_o", expected=()):
+        self.name = name
+        self.expected = list(expected)
+
+    def __len__(self):
+        return len(self.expected)
+
+    def expect(self, value):
+        self.expected.append(value)
+
+    def extend(self, values):
+        self.expected.extend(values)
+
+    def check(self, outputs, limit=8):
+        outputs = list(outputs)
+        record(self.name, outputs)
+        assert len(outputs) == len(self.expected), \
+            f"Mismatch {self.name} count got {len(outputs)} exp {len(self.expected)}"
+        if not outputs:
+            return
+        exp, exp_known = table(self.expected)
+        got, got_known = table(outputs, exp.shape[1])
+        bad = np.flatnonzero((exp_known & ~(got_known & (got == exp))).any(axis=1))
+        first = [(int(index), outputs[index], self.expected[index]) for index in bad[:limit]]
+        assert not bad.size, \
+            f"Mismatch {self.name} in {bad.size} of {len(outputs)} outputs, first (index, got, exp) {first}"
@@ -0,0 +1,38 @@
+from cocotb.triggers import FallingEdge, Timer
+
+
+class UartLine:
+    # the host end of a uart line, with its own bit clock: 8N1 bytes into rxd, and the bytes
+    # on txd sampled in the middle of each bit, as the bridge does
+    def __init__(self, dut, baud, rxd="rxd_i", txd="txd_o"):
+        self.rxd = getattr(dut, rxd)
+        self.txd = getattr(dut, txd)
+        self.bit_ps = round(1e12 / baud)
+        self.received = []
+
+    async def send(self, data, stop=None):
+        # stop holds the indices of bytes whose stop bit goes out low
+        bit = Timer(self.bit_ps, unit="ps")
+        for index, byte in enumerate(data):
+            level = 0 if stop and index in stop else 1
+            for value in [0] + [(byte >> i) & 1 for i in range(8)] + [level]:
+                self.rxd.value = value
+                await bit
+            if not level:
+                self.rxd.value = 1
+                await bit
+
+    async def receive(self):
+        half = Timer(self.bit_ps // 2, unit="ps")
+        bit = Timer(self.bit_ps, unit="ps")
+        while True:
+            await FallingEdge(self.txd)
+            await half
+            assert int(self.txd.value) == 0, "Start bit too short"
+            byte = 0
+            for i in range(8):
+                await bit
+                byte |= int(self.txd.value) << i
+            await bit
+            assert int(self.txd.value) == 1, f"Missing stop bit after {byte:#04x}"
+            self.received.append(byte)
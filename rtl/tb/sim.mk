@@ -0,0 +1,38 @@
+# simulator settings shared by the rtl/* Makefiles, included ahead of cocotb's Makefile.sim
+#
+# SIM=icarus (the default) or SIM=verilator. PARAMS holds NAME=value overrides of the top's
+# parameters, e.g. make SIM=verilator PARAMS=DEPTH_P=640, passed the way each simulator takes
+# them. Both write waves to $(SIM_BUILD)/$(TOPLEVEL).fst when WAVES=1.
+
+ifeq ($(SIM),verilator)
+# the datapath sums and axis_adapter's segment compares mix widths on purpose, and counter's
+# carry chain reads lower bits of its own toggle vector, which cocotb's public access keeps
+# verilator from splitting. everything else lints clean
+COMPILE_ARGS += -Wno-WIDTH -Wno-UNOPTFLAT
+COMPILE_ARGS += $(addprefix -G,$(PARAMS))
+# tracing costs verilator several times its speed on frame-sized runs, so waves are opt-in
+WAVES ?= 0
+ifeq ($(WAVES),1)
+COMPILE_ARGS += --trace-fst --trace-structs
+SIM_ARGS += --trace --trace-file $(SIM_BUILD)/$(TOPLEVEL).fst
+endif
+else
+COMPILE_ARGS += -g2012
+COMPILE_ARGS += $(addprefix -P$(TOPLEVEL).,$(PARAMS))
+WAVES ?= 1
+endif
+
+# make parity runs the suite under both simulators, each scoreboard recording a digest of the
+# outputs it checked, and fails unless the two records match line for line
+export RECORD
+ifneq ($(filter parity,$(MAKECMDGOALS)),)
+.PHONY: parity
+parity:
+	@for sim in icarus verilator; do \
+		rm -rf sim_build/$$sim && mkdir -p sim_build/$$sim && \
+		$(MAKE) SIM=$$sim WAVES=0 SIM_BUILD=sim_build/$$sim COCOTB_RESULTS_FILE=sim_build/$$sim/results.xml \
+			RECORD=$(CURDIR)/sim_build/$$sim/record.txt || exit 1; \
+	done
+	diff sim_build/icarus/record.txt sim_build/verilator/record.txt
+	@echo "icarus and verilator agree on $$(wc -l < sim_build/icarus/record.txt) scoreboards"
+endif
@@ -0,0 +1,52 @@
+`timescale 1ns/1ps
+
+// testbench only: takes a valid/ready output on every cycle the pattern file allows and, once
+// count_i outputs are in, writes them out with $writememh and raises done_o
+module stream_sink
+#(
+    parameter WIDTH_P = 8,
+    // most outputs in one stream
+    parameter DEPTH_P = 1 << 19,
+    // the pattern repeats every PATTERN_P cycles, a power of two
+    parameter PATTERN_P = 1024,
+    parameter DATA_FILE_P = "sim_build/sink_data.hex",
+    parameter PATTERN_FILE_P = "sim_build/sink_pattern.hex"
+) (
+    input logic [0:0] clk_i,
+    // reads the pattern file and rewinds, then count_i outputs are taken
+    input logic [0:0] load_i,
+    input logic [31:0] count_i,
+    input logic [0:0] valid_i,
+    output logic [0:0] ready_o,
+    input logic [WIDTH_P-1:0] data_i,
+    output logic [31:0] received_o,
+    output logic [0:0] done_o
+);
+    logic [WIDTH_P-1:0] mem [0:DEPTH_P-1];
+    logic [0:0] pattern [0:PATTERN_P-1];
+    logic [$clog2(PATTERN_P)-1:0] phase_l;
+
+    always_ff @(posedge clk_i) begin
+        if (load_i) begin
+            $readmemh(PATTERN_FILE_P, pattern);
+            phase_l <= '0;
+            received_o <= '0;
+            done_o <= 1'b0;
+        end else begin
+            phase_l <= phase_l + 1'b1;
+            if (valid_i & ready_o) begin
+                mem[received_o[$clog2(DEPTH_P)-1:0]] <= data_i;
+                received_o <= received_o + 1'b1;
+            end
+            if (~done_o & (received_o == count_i)) begin
+                if (count_i != 0) begin
+                    $writememh(DATA_FILE_P, mem, 0, count_i - 1);
+                end
+                done_o <= 1'b1;
+            end
+        end
+    end
+
+    assign ready_o = ~load_i & (received_o < count_i) & pattern[phase_l];
+
+endmodule
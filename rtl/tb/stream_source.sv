@@ -0,0 +1,46 @@
+`timescale 1ns/1ps
+
+// testbench only: plays a stream from a $readmemh file into a valid/ready input, offering the
+// next token on every cycle the pattern file allows, so a whole stream runs without the
+// testbench touching a signal
+module stream_source
+#(
+    parameter WIDTH_P = 8,
+    // most tokens in one stream
+    parameter DEPTH_P = 1 << 19,
+    // the pattern repeats every PATTERN_P cycles, a power of two
+    parameter PATTERN_P = 1024,
+    parameter DATA_FILE_P = "sim_build/source_data.hex",
+    parameter PATTERN_FILE_P = "sim_build/source_pattern.hex"
+) (
+    input logic [0:0] clk_i,
+    // reads both files and rewinds, then count_i tokens go out
+    input logic [0:0] load_i,
+    input logic [31:0] count_i,
+    output logic [0:0] valid_o,
+    input logic [0:0] ready_i,
+    output logic [WIDTH_P-1:0] data_o,
+    output logic [31:0] sent_o
+);
+    logic [WIDTH_P-1:0] mem [0:DEPTH_P-1];
+    logic [0:0] pattern [0:PATTERN_P-1];
+    logic [$clog2(PATTERN_P)-1:0] phase_l;
+
+    always_ff @(posedge clk_i) begin
+        if (load_i) begin
+            $readmemh(DATA_FILE_P, mem);
+            $readmemh(PATTERN_FILE_P, pattern);
+            phase_l <= '0;
+            sent_o <= '0;
+        end else begin
+            phase_l <= phase_l + 1'b1;
+            if (valid_o & ready_i) begin
+                sent_o <= sent_o + 1'b1;
+            end
+        end
+    end
+
+    assign valid_o = ~load_i & (sent_o < count_i) & pattern[phase_l];
+    assign data_o = mem[sent_o[$clog2(DEPTH_P)-1:0]];
+
+endmodule
@@ -0,0 +1,38 @@
+`timescale 1ns/1ps
+
+module threshold 
+#(
+    parameter WIDTH_P = 8
+) (
+    input logic [0:0] clk_i,
+    input logic [0:0] rstn_i,
+    input logic [0:0] valid_i,
+    input logic [0:0] ready_i,
+    input logic [WIDTH_P-1:0] data_i,
+    // pixels strictly above it become all ones, the rest zero
+    input logic [WIDTH_P-1:0] threshold_i,
+    output logic [0:0] valid_o,
+    output logic [0:0] ready_o,
+    output logic [WIDTH_P-1:0] data_o
+);
+
+    logic [0:0] edge_bit;
+    logic [0:0] edge_l;
+    assign edge_bit = (data_i > threshold_i);
+
+    elastic #(
+        .WIDTH_P(1)
+    ) threshold_elastic (
+        .clk_i(clk_i),
+        .rstn_i(rstn_i),
+        .data_i(edge_bit),
+        .valid_i(valid_i),
+        .ready_o(ready_o),
+        .valid_o(valid_o),
+        .data_o(edge_l),
+        .ready_i(ready_i)
+    );
+
+    assign data_o = {WIDTH_P{edge_l}};
+
+endmodule
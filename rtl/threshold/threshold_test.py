@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+
+import cocotb
+import sobel_model
+from cocotb.clock import Clock
+from cocotb.triggers import FallingEdge, Timer
+from handshake import Driver, Monitor, Replay, Scoreboard, run_until, stride
+
+CLOCK_PERIOD_NS = 10
+# 1: the top is threshold_fast and whole streams run inside the simulator,
+# 0: python drives threshold cycle by cycle
+FAST = os.environ.get("FAST", "0") == "1"
+
+
+class ModelManager:
+    def __init__(self, dut, threshold):
+        self.width = int(dut.WIDTH_P.value)
+        self.threshold = threshold
+
+    def expected(self, stream):
+        return sobel_model.threshold(stream, self.threshold, self.width).tolist()
+
+
+class TestManager:
+    def __init__(self, dut, stream, threshold, in_stride=1, out_stride=1):
+        self.dut = dut
+        self.tokens = np.asarray(stream).ravel()
+        self.scoreboard = Scoreboard("data_o", ModelManager(dut, threshold).expected(self.tokens))
+        self.threshold = threshold
+        self.patterns = (stride(in_stride), stride(out_stride))
+
+    async def run(self):
+        dut = self.dut
+        dut.threshold_i.value = self.threshold
+        in_pattern, out_pattern = self.patterns
+        if FAST:
+            width = int(dut.WIDTH_P.value)
+            outputs = await Replay(dut, self.tokens, len(self.scoreboard), in_fields=(width,),
+                                   out_fields=((width, False),), in_pattern=in_pattern, out_pattern=out_pattern).run()
+        else:
+            input = Driver(dut, self.tokens, pattern=in_pattern)
+            output = Monitor(dut, pattern=out_pattern)
+            await run_until(dut.clk_i, [input], [output], lambda: len(output) >= len(self.scoreboard))
+            outputs = output.values
+        self.scoreboard.check(outputs)
+
+
+async def clock_test(dut):
+    cocotb.start_soon(Clock(dut.clk_i, CLOCK_PERIOD_NS, unit="ns").start())
+    await Timer(5 * CLOCK_PERIOD_NS, unit="ns")
+
+
+async def reset_test(dut):
+    dut.rstn_i.value = 0
+    if FAST:
+        dut.load_i.value = 0
+    else:
+        dut.valid_i.value = 0
+        dut.ready_i.value = 0
+        dut.data_i.value = 0
+    dut.threshold_i.value = 0
+    await Timer(10 * CLOCK_PERIOD_NS, unit="ns")
+    await FallingEdge(dut.clk_i)
+    dut.rstn_i.value = 1
+    await Timer(10 * CLOCK_PERIOD_NS, unit="ns")
+    await FallingEdge(dut.clk_i)
+
+
+@cocotb.test()
+async def single_ramp_test(dut):
+    # every value against a threshold in the middle, strictly above it is an edge
+    await clock_test(dut)
+    await reset_test(dut)
+    await TestManager(dut, np.arange(256, dtype=np.uint8), 100).run()
+
+
+@cocotb.test()
+async def single_limits_test(dut):
+    # 0 passes everything but zero, the top value passes nothing
+    await clock_test(dut)
+    await reset_test(dut)
+    stream = np.array([0, 1, 254, 255] * 8, dtype=np.uint8)
+    await TestManager(dut, stream, 0).run()
+    await TestManager(dut, stream, 255).run()
+
+
+@cocotb.test()
+async def single_random_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    np.random.seed(42)
+    await TestManager(dut, np.random.randint(0, 256, size=200, dtype=np.uint8), 64).run()
+
+
+@cocotb.test()
+async def backpressure_test(dut):
+    await clock_test(dut)
+    await reset_test(dut)
+    np.random.seed(7)
+    stream = np.random.randint(0, 256, size=200, dtype=np.uint8)
+    await TestManager(dut, stream, 128, in_stride=2, out_stride=3).run()
@@ -0,0 +1,49 @@
+`timescale 1ns/1ps
+
+module uart_nco
+#(
+    parameter ACC_W_P = 16
+) (
+    input logic [0:0] clk_i,
+    input logic [0:0] rstn_i,
+    // baud * 2**ACC_W_P / clock frequency, shared by both directions
+    input logic [ACC_W_P-1:0] step_i,
+    input logic [7:0] data_i,
+    input logic [0:0] valid_i,
+    output logic [0:0] ready_o,
+    output logic [7:0] data_o,
+    output logic [0:0] valid_o,
+    input logic [0:0] ready_i,
+    output logic [0:0] overrun_o,
+    output logic [0:0] frame_error_o,
+    input logic [0:0] rxd_i,
+    output logic [0:0] txd_o
+);
+
+    uart_tx_nco #(
+        .ACC_W_P(ACC_W_P)
+    ) tx_inst (
+        .clk_i(clk_i),
+        .rstn_i(rstn_i),
+        .step_i(step_i),
+        .data_i(data_i),
+        .valid_i(valid_i),
+        .ready_o(ready_o),
+        .txd_o(txd_o)
+    );
+
+    uart_rx_nco #(
+        .ACC_W_P(ACC_W_P)
+    ) rx_inst (
+        .clk_i(clk_i),
+        .rstn_i(rstn_i),
+        .step_i(step_i),
+        .rxd_i(rxd_i),
+        .data_o(data_o),
+        .valid_o(valid_o),
+        .ready_i(ready_i),
+        .overrun_o(overrun_o),
+        .frame_error_o(frame_error_o)
+    );
+
+endmodule
@@ -0,0 +1,155 @@
+import random
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import FallingEdge, Timer
+from handshake import Driver, Monitor, Scoreboard, UartLine, run_until
+
+# the iCEBreaker core clock, 12 MHz through the PLL
+CLOCK_HZ = 30_000_000
+CLOCK_PERIOD_PS = 33_334
+# rates the FTDI bridge generates exactly or within 0.2%
+RATES = (3_000_000, 2_000_000, 1_500_000, 1_000_000, 921_600, 460_800, 230_400, 115_200)
+
+
+def step(dut, baud):
+    return round(baud * (1 << int(dut.ACC_W_P.value)) / CLOCK_HZ)
+
+
+class ModelManager:
+    def __init__(self):
+        self.sent = []
+        self.errors = []
+
+    def run(self, data, errors=()):
+        # every byte the host sends comes back once the device has echoed it, errors holds the
+        # indices among the bytes sent of those the device drops
+        self.sent.extend(data)
+        self.errors.extend(errors)
+
+
+class ErrorMonitor(Monitor):
+    # a frame error pulse, as the index among the bytes sent of the byte the device dropped
+    def __init__(self, dut, received):
+        super().__init__(dut, data="frame_error_o", valid="frame_error_o", ready=None)
+        self.received = received
+
+    def sample(self):
+        if self.valid.value:
+            self.values.append(len(self.received) + len(self.values))
+
+
+class TestManager:
+    def __init__(self, dut, baud, data, host_baud=None, stop=None):
+        # host_baud skews the host's bit clock against the device's; stop lists bytes sent with
+        # a low stop bit, which the device drops
+        self.dut = dut
+        self.baud = baud
+        self.model = ModelManager()
+        self.model.run([byte for i, byte in enumerate(data) if not stop or i not in stop], sorted(stop or ()))
+        self.data = data
+        self.stop = stop
+        self.host = UartLine(dut, host_baud or baud)
+        # the device echoes what it receives, the transmitter sends from the receiver's outputs
+        self.rx = Monitor(dut)
+        self.tx = Driver(dut, [])
+        self.tx.tokens = self.rx.values
+        self.errors = ErrorMonitor(dut, self.rx.values)
+        self.overruns = Monitor(dut, data="overrun_o", valid="overrun_o", ready=None)
+        self.sender = None
+        self.idle = 0
+
+    def done(self):
+        # done once the line has been quiet for three characters
+        busy = (not self.sender.done() or not self.tx.done() or int(self.dut.txd_o.value) == 0
+                or len(self.host.received) < len(self.rx))
+        self.idle = 0 if busy else self.idle + 1
+        return self.idle >= 30 * CLOCK_HZ // self.baud
+
+    async def run(self):
+        dut = self.dut
+        dut.step_i.value = step(dut, self.baud)
+        receiver = cocotb.start_soon(self.host.receive())
+        self.sender = cocotb.start_soon(self.host.send(self.data, self.stop))
+        try:
+            await run_until(dut.clk_i, [self.tx], [self.overruns, self.errors, self.rx], self.done)
+        finally:
+            receiver.cancel()
+        Scoreboard("overrun_o").check(self.overruns.values)
+        Scoreboard("txd_o", self.model.sent).check(self.host.received)
+        Scoreboard("frame_error_o", self.model.errors).check(self.errors.values)
+
+
+async def clock_test(dut):
+    await Timer(100, unit="ns")
+    cocotb.start_soon(Clock(dut.clk_i, CLOCK_PERIOD_PS, unit="ps").start())
+    await Timer(10, unit="ns")
+
+
+async def reset_test(dut):
+    dut.rstn_i.value = 0
+    dut.rxd_i.value = 1
+    dut.valid_i.value = 0
+    dut.data_i.value = 0
+    dut.ready_i.value = 0
+    dut.step_i.value = 0
+    await Timer(10 * CLOCK_PERIOD_PS, unit="ps")
+    await FallingEdge(dut.clk_i)
+    dut.rstn_i.value = 1
+    await Timer(10 * CLOCK_PERIOD_PS, unit="ps")
+    await FallingEdge(dut.clk_i)
+
+
+def random_bytes(count, seed):
+    rng = random.Random(seed)
+    return [rng.randrange(256) for _ in range(count)]
+
+
+@cocotb.test()
+async def loopback_test(dut):
+    # the host streams bytes back to back, the device echoes them as they come in
+    await clock_test(dut)
+    for seed, baud in enumerate(RATES):
+        await reset_test(dut)
+        dut._log.info(f"{baud} baud, step {step(dut, baud)}")
+        await TestManager(dut, baud, [0x00, 0xFF, 0x55, 0xAA, 0xA5, 0x5A] + random_bytes(48, seed)).run()
+
+
+@cocotb.test()
+async def skew_test(dut):
+    # both ends sample mid bit, so a host clock 2% off either way still gets through
+    await clock_test(dut)
+    for baud in (RATES[0], RATES[3]):
+        for skew in (0.98, 1.02):
+            await reset_test(dut)
+            await TestManager(dut, baud, random_bytes(32, baud), host_baud=baud * skew).run()
+
+
+@cocotb.test()
+async def frame_error_test(dut):
+    # a byte with a low stop bit is dropped and flagged, and the bytes after it are intact
+    await clock_test(dut)
+    await reset_test(dut)
+    await TestManager(dut, RATES[0], random_bytes(16, 1), stop={3, 9}).run()
+
+
+@cocotb.test()
+async def overrun_test(dut):
+    # bytes that arrive while data_o still waits replace it and pulse overrun_o
+    await clock_test(dut)
+    await reset_test(dut)
+    baud = RATES[0]
+    dut.step_i.value = step(dut, baud)
+    data = random_bytes(3, 2)
+    sender = cocotb.start_soon(UartLine(dut, baud).send(data))
+    overruns = 0
+    while not sender.done():
+        await FallingEdge(dut.clk_i)
+        await Timer(1, unit="ns")
+        overruns += int(dut.overrun_o.value)
+    for _ in range(30):
+        await FallingEdge(dut.clk_i)
+        await Timer(1, unit="ns")
+        overruns += int(dut.overrun_o.value)
+    assert overruns == 2, f"Mismatch overruns got {overruns} exp 2"
+    assert dut.valid_o.value and int(dut.data_o.value) == data[-1], f"Mismatch got {int(dut.data_o.value)} exp {data[-1]}"
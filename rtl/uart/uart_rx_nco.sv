@@ -0,0 +1,85 @@
+`timescale 1ns/1ps
+
+module uart_rx_nco
+#(
+    parameter ACC_W_P = 16
+) (
+    input logic [0:0] clk_i,
+    input logic [0:0] rstn_i,
+    // baud * 2**ACC_W_P / clock frequency
+    input logic [ACC_W_P-1:0] step_i,
+    input logic [0:0] rxd_i,
+    output logic [7:0] data_o,
+    output logic [0:0] valid_o,
+    input logic [0:0] ready_i,
+    // one cycle pulses: a byte arrived while data_o was still waiting, a stop bit was low
+    output logic [0:0] overrun_o,
+    output logic [0:0] frame_error_o
+);
+
+    // 8N1. The falling edge of the start bit sets the phase accumulator to half a bit, so
+    // every wrap after it lands in the middle of a bit, whatever the rate. The samples go
+    // through the same synchronizer as the edge, so its delay cancels out
+    logic [2:0] sync_l;
+    logic [ACC_W_P-1:0] acc_l;
+    logic [0:0] tick_l;
+    logic [0:0] busy_l;
+    logic [3:0] bits_l;
+    logic [7:0] shift_l;
+
+    logic [0:0] rxd;
+    logic [0:0] start;
+
+    assign rxd = sync_l[1];
+    assign start = ~busy_l & sync_l[2] & ~rxd;
+
+    always_ff @(posedge clk_i) begin
+        if (!rstn_i) begin
+            sync_l <= '1;
+            acc_l <= '0;
+            tick_l <= 1'b0;
+            busy_l <= 1'b0;
+            bits_l <= '0;
+            shift_l <= '0;
+            data_o <= '0;
+            valid_o <= 1'b0;
+            overrun_o <= 1'b0;
+            frame_error_o <= 1'b0;
+        end else begin
+            sync_l <= {sync_l[1:0], rxd_i};
+            overrun_o <= 1'b0;
+            frame_error_o <= 1'b0;
+            if (valid_o && ready_i) begin
+                valid_o <= 1'b0;
+            end
+
+            if (start) begin
+                acc_l <= {1'b1, {(ACC_W_P-1){1'b0}}};
+                tick_l <= 1'b0;
+                busy_l <= 1'b1;
+                bits_l <= '0;
+            end else begin
+                {tick_l, acc_l} <= {1'b0, acc_l} + {1'b0, step_i};
+                if (busy_l && tick_l) begin
+                    bits_l <= bits_l + 1'b1;
+                    if (bits_l == 4'd0) begin
+                        // the line is high again mid start bit, a glitch
+                        busy_l <= ~rxd;
+                    end else if (bits_l != 4'd9) begin
+                        shift_l <= {rxd, shift_l[7:1]};
+                    end else begin
+                        busy_l <= 1'b0;
+                        if (rxd) begin
+                            data_o <= shift_l;
+                            valid_o <= 1'b1;
+                            overrun_o <= valid_o & ~ready_i;
+                        end else begin
+                            frame_error_o <= 1'b1;
+                        end
+                    end
+                end
+            end
+        end
+    end
+
+endmodule
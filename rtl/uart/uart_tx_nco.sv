@@ -0,0 +1,52 @@
+`timescale 1ns/1ps
+
+module uart_tx_nco
+#(
+    parameter ACC_W_P = 16
+) (
+    input logic [0:0] clk_i,
+    input logic [0:0] rstn_i,
+    // baud * 2**ACC_W_P / clock frequency
+    input logic [ACC_W_P-1:0] step_i,
+    input logic [7:0] data_i,
+    input logic [0:0] valid_i,
+    output logic [0:0] ready_o,
+    output logic [0:0] txd_o
+);
+
+    // 8N1. A bit ends when the phase accumulator wraps, so the rate is any fraction of the
+    // clock and a bit is at most one cycle off; the wrap is registered, so the adder carry
+    // never reaches anything but its own flop. The next byte starts on the tick that ends
+    // the stop bit, so back to back bytes go out at exactly the line rate
+    logic [ACC_W_P-1:0] acc_l;
+    logic [0:0] tick_l;
+    logic [9:0] shift_l;
+    logic [3:0] bits_l;
+
+    logic [0:0] load;
+
+    assign ready_o = (bits_l == 4'd0) || (bits_l == 4'd1 && tick_l);
+    assign load = valid_i & ready_o;
+    assign txd_o = shift_l[0];
+
+    always_ff @(posedge clk_i) begin
+        if (!rstn_i) begin
+            acc_l <= '0;
+            tick_l <= 1'b0;
+            shift_l <= '1;
+            bits_l <= '0;
+        end else if (load) begin
+            acc_l <= '0;
+            tick_l <= 1'b0;
+            shift_l <= {1'b1, data_i, 1'b0};
+            bits_l <= 4'd10;
+        end else begin
+            {tick_l, acc_l} <= {1'b0, acc_l} + {1'b0, step_i};
+            if (tick_l && bits_l != 4'd0) begin
+                shift_l <= {1'b1, shift_l[9:1]};
+                bits_l <= bits_l - 1'b1;
+            end
+        end
+    end
+
+endmodule
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import tty
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "rtl" / "sobel"))
+import sobel_model
+
+BAUD, FIFO_DEPTH, LINE_W = 3000000, 2048, 640
+# edge bytes the board holds on their way to the pins: tx_fifo's four between frame_tx and
+# uart_tx, which takes a byte straight into its shift register, and the magnitude stage's
+# pixel in front of frame_tx, which goes out once per output byte it makes
+TX_SLACK = 6
+TICK = 0.001
+# frame_rx pads the rest of a frame after TIMEOUT_P idle cycles, 2**23 at 30 MHz
+TIMEOUT = (1 << 23) / 30e6
+
+
+class Loopback:
+    # board stand-in on a pty: same byte protocol, bit-exact output, UART pacing and rx_fifo overruns
+    def __init__(self, baud=BAUD, fifo_depth=FIFO_DEPTH, line_w=LINE_W, drop=0.0, seed=None, gray_out=False, gray_in=False,
+                 binary=False):
+        self.baud = baud
+        self.out_bpp = sobel_model.PACKED if binary else 1 if gray_out else 3
+        self.in_bpp = 1 if gray_in else 3
+        self.fifo_depth = fifo_depth
+        self.drop = drop
+        self.rng = random.Random(seed)
+        self.model = sobel_model.FramedDevice(line_w, self.in_bpp, self.out_bpp)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        self.fifo = bytearray()
+        self.tx = bytearray()
+        self.wire = bytearray()
+        self.stats = {"rx_bytes": 0, "tx_bytes": 0, "overruns": 0, "dropped": 0, "timeouts": 0, "fifo_peak": 0}
+        self.idle = time.perf_counter()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        chars_per_s = self.baud / 10
+        rx_credit = tx_credit = 0.0
+        last = time.perf_counter()
+        while not self.stop.is_set():
+            time.sleep(TICK)
+            now = time.perf_counter()
+            # a line that has been idle cannot burst, so credit never exceeds a tick or two
+            rx_credit = min(rx_credit + (now - last) * chars_per_s, 2 * TICK * chars_per_s + 1)
+            tx_credit = min(tx_credit + (now - last) * chars_per_s, 2 * TICK * chars_per_s + 1)
+            last = now
+
+            if int(rx_credit):
+                try:
+                    data = os.read(self.master, int(rx_credit))
+                except (BlockingIOError, OSError):
+                    data = b""
+                rx_credit -= len(data)
+                self.receive(data)
+
+            self.process(int(tx_credit))
+            self.overrun()
+            self.timeout(now)
+
+            sent = min(len(self.tx), int(tx_credit))
+            self.wire.extend(self.tx[:sent])
+            del self.tx[:sent]
+            tx_credit -= sent
+            self.stats["tx_bytes"] += sent
+
+            # bytes already on the line sit in the USB bridge until the host reads them,
+            # a slow reader never stalls the device
+            if self.wire:
+                try:
+                    del self.wire[:os.write(self.master, self.wire)]
+                except (BlockingIOError, OSError):
+                    pass
+
+    def receive(self, data):
+        self.stats["rx_bytes"] += len(data)
+        if self.drop:
+            kept = bytes(byte for byte in data if self.rng.random() >= self.drop)
+            self.stats["dropped"] += len(data) - len(kept)
+            data = kept
+        if data:
+            self.idle = time.perf_counter()
+        self.fifo.extend(data)
+
+    def overrun(self):
+        # a tick's worth of bytes arrives while the pipeline drains, so the level is only
+        # checked after process(); uart_rx loses whatever rx_fifo could not take
+        excess = len(self.fifo) - self.fifo_depth
+        if excess > 0:
+            del self.fifo[self.fifo_depth:]
+            self.stats["overruns"] += excess
+            self.model.error(sobel_model.OVERRUN)
+        self.stats["fifo_peak"] = max(self.stats["fifo_peak"], len(self.fifo))
+
+    def timeout(self, now):
+        # a frame whose bytes stopped coming is padded out and answered, as frame_rx does
+        if self.fifo or self.model.state not in ("pixels", "crc"):
+            self.idle = now
+        elif now - self.idle > TIMEOUT:
+            self.tx.extend(self.model.timeout())
+            self.stats["timeouts"] += 1
+
+    def process(self, line_bytes):
+        # the pipeline only drains rx_fifo while the tx side has room for the edge bytes,
+        # which is what the line sends this tick plus the holding registers on the way;
+        # a frame's flush and EOF come out of the last payload byte in one go, which stalls
+        # rx_fifo until they are on the line, as frame_tx does. The tokens frame_tx drops at the
+        # start of a frame make no edge bytes and go through at clock speed
+        while self.fifo:
+            room = max(0, TX_SLACK + line_bytes - len(self.tx))
+            pixels = room * 8 if self.out_bpp == sobel_model.PACKED else room // self.out_bpp
+            if not pixels:
+                return
+            take = min(len(self.fifo), pixels * self.in_bpp)
+            self.tx.extend(self.model.feed(self.fifo[:take]))
+            del self.fifo[:take]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.stop.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate the iCEBreaker sobel board on a pty")
+    parser.add_argument("--baud", type=int, default=BAUD)
+    parser.add_argument("--fifo-depth", type=int, default=FIFO_DEPTH)
+    parser.add_argument("--line-w", type=int, default=LINE_W)
+    parser.add_argument("--drop", type=float, default=0.0, help="probability of losing each received byte")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--gray-out", action="store_true", help="emulate a GRAY_OUT_P=1 bitstream")
+    parser.add_argument("--gray-in", action="store_true", help="emulate a GRAY_IN_P=1 bitstream")
+    parser.add_argument("--binary", action="store_true", help="emulate a BINARY_OUT_P=1 bitstream")
+    args = parser.parse_args()
+
+    with Loopback(args.baud, args.fifo_depth, args.line_w, args.drop, args.seed, args.gray_out, args.gray_in,
+                  args.binary) as board:
+        print(board.port, flush=True)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    print(" ".join(f"{k}={v}" for k, v in board.stats.items()))
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,1198 @@
 #!/usr/bin/env python3
 import argparse
-import time
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import struct
+import sys
 import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
+import numpy as np
 import serial
 from PIL import Image
 
-W, H, BAUD = 640, 480, 220588
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "rtl" / "sobel"))
+import sobel_model
+
+# W is LINE_W_P, the widest frame the line buffers hold; frames go out at their own size up to
+# it, and raw .rgb and .gray streams hold W x H frames
+W, H, BAUD = 640, 480, 3000000
+
+CHUNK = 2048
+# seconds without a reply byte before a board counts as stalled
+STALL = 5.0
+# FIFO_DEPTH_P of rx_fifo, and how much of it the host fills beyond what the replies prove
+# the device has taken; the rest covers the header and trailer bytes frame_tx sends between
+# frames, while the pipeline stands still
+RX_FIFO = 2048
+WINDOW = RX_FIFO - 32
+
+# upper edges of the inter-chunk gap histogram, the last bucket is open ended
+GAP_EDGES_MS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+IMAGE_SUFFIXES = {".bmp", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp"}
+VIDEO_SUFFIXES = {".avi", ".m4v", ".mkv", ".mov", ".mp4"}
+# frame containers: .npy, raw W x H streams of RGB or gray bytes, and .sbf
+FRAME_SUFFIXES = {".npy", ".rgb", ".gray", ".sbf"}
+# .sbf is this magic, then frame count, height, width and channels as little-endian
+# uint32, then the frames back to back
+SBF_MAGIC = b"SBF1"
+SBF_HEADER = 20
+CACHE_SIZE_MB = 1024
+# times a damaged row is sent again before the run gives up
+RETRIES = 3
+# magnitude a pixel has to exceed to count as an edge with --binary
+THRESHOLD = 64
+
+
+def load_frame(img, resize=True):
+    # (height, width, 3) uint8 at native size, images wider than W are scaled down to W wide;
+    # full resolution is kept for --tile
+    if isinstance(img, np.ndarray):
+        img = Image.fromarray(img)
+    elif not isinstance(img, Image.Image):
+        img = Image.open(img)
+    img = img.convert("RGB")
+    if resize and img.width > W:
+        img = img.resize((W, max(round(img.height * W / img.width), 1)), Image.BILINEAR)
+    return np.asarray(img)
+
+
+def load(pool, img, resize):
+    # with a pool the frame comes back as a future, see decode_ahead
+    return pool.submit(load_frame, img, resize) if pool else load_frame(img, resize)
+
+
+def iter_video(path, resize=True, pool=None):
+    try:
+        import cv2 as cv
+    except ImportError:
+        raise SystemExit("Video input needs opencv-python")
+
+    cap = cv.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video {path}")
+    index = 0
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            yield f"{path.stem}_{index:05d}", load(pool, cv.cvtColor(frame, cv.COLOR_BGR2RGB), resize)
+            index += 1
+    finally:
+        cap.release()
+
+
+def open_frames(path, shape=None):
+    # (count, height, width, channels) uint8 memmap of a frame container, created when a shape is given
+    suffix = path.suffix.lower()
+    mode = "r" if shape is None else "w+"
+    if suffix == ".npy":
+        if shape is not None:
+            return np.lib.format.open_memmap(path, mode, np.uint8, shape)
+        frames = np.load(path, mmap_mode="r")
+        if frames.dtype != np.uint8:
+            raise SystemExit(f"{path} holds {frames.dtype}, expected uint8 frames")
+        # one frame is (height, width) or (height, width, 1 or 3), several are (count, height, width, channels)
+        if frames.ndim == 2 or (frames.ndim == 3 and frames.shape[2] not in (1, 3)):
+            frames = frames[..., None]
+        return frames if frames.ndim == 4 else frames[None]
+    if suffix == ".sbf":
+        if shape is not None:
+            with open(path, "wb") as f:
+                f.write(SBF_MAGIC + np.array(shape, dtype="<u4").tobytes())
+            return np.memmap(path, np.uint8, "r+", SBF_HEADER, shape)
+        with open(path, "rb") as f:
+            head = f.read(SBF_HEADER)
+        if head[:4] != SBF_MAGIC:
+            raise SystemExit(f"{path} is not a frame file")
+        return np.memmap(path, np.uint8, "r", SBF_HEADER, tuple(int(n) for n in np.frombuffer(head[4:], "<u4")))
+    # raw streams carry no header, so their frames are W x H
+    channels = 3 if suffix == ".rgb" else 1
+    if shape is None:
+        count, extra = divmod(path.stat().st_size, H * W * channels)
+        if extra:
+            raise SystemExit(f"{path} is not a whole number of {W}x{H} frames")
+        shape = (count, H, W, channels)
+    elif shape[1:] != (H, W, channels):
+        raise SystemExit(f"{path.suffix} output holds {W}x{H} frames of {channels} byte(s) per pixel")
+    return np.memmap(path, np.uint8, mode, shape=shape)
+
+
+def expand(paths):
+    for path in paths:
+        if path.is_dir():
+            yield from expand(sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES | VIDEO_SUFFIXES | FRAME_SUFFIXES))
+        else:
+            yield path
+
+
+def iter_frames(paths, resize=True, pool=None):
+    # frame containers are neither decoded nor resized, their frames are slices of the mmap
+    for path in expand(paths):
+        suffix = path.suffix.lower()
+        if suffix in VIDEO_SUFFIXES:
+            yield from iter_video(path, resize, pool)
+        elif suffix in FRAME_SUFFIXES:
+            for index, frame in enumerate(open_frames(path)):
+                yield f"{path.stem}_{index:05d}", frame
+        else:
+            yield path.stem, load(pool, path, resize)
+
+
+def decode_ahead(frames, depth):
+    # frames from iter_frames with a pool; keeps depth of them decoding and yields them in order
+    pending = deque()
+    for item in frames:
+        pending.append(item)
+        if len(pending) > depth:
+            name, frame = pending.popleft()
+            yield name, frame.result() if isinstance(frame, Future) else frame
+    while pending:
+        name, frame = pending.popleft()
+        yield name, frame.result() if isinstance(frame, Future) else frame
+
+
+def prefetch(items, depth=2):
+    # produce items on a background thread so decoding and slicing overlap the transfer
+    ready = queue.Queue(maxsize=depth)
+    end = object()
+
+    def producer():
+        try:
+            for item in items:
+                ready.put(item)
+        except BaseException as exc:
+            ready.put(exc)
+        ready.put(end)
+
+    threading.Thread(target=producer, daemon=True).start()
+    while True:
+        item = ready.get()
+        if item is end:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def stripe_starts(width):
+    # left edges of W wide stripes whose interiors, all but BORDER columns on either side,
+    # cover every interior column of the image; the last stripe is right aligned, and an
+    # image up to W wide is a single stripe of its own width
+    step = W - 2 * sobel_model.BORDER
+    return list(range(0, max(width - W, 0), step)) + [max(width - W, 0)]
+
+
+class Stitcher:
+    # splits images into LINE_W_P wide stripes and puts the edge maps back together; with
+    # several boards the stripes of one image come back in any order and from any thread
+    def __init__(self, on_image):
+        self.on_image = on_image
+        self.images = {}
+        self.lock = threading.Lock()
+
+    def split(self, frames):
+        for name, pixels in frames:
+            height, width = pixels.shape[:2]
+            starts = stripe_starts(width)
+            with self.lock:
+                self.images[name] = [None, height, width, len(starts)]
+            for x0 in starts:
+                yield f"{name}@{x0}", np.ascontiguousarray(pixels[:, x0:x0 + W])
+
+    def on_frame(self, name, frame):
+        name, x0 = name.rsplit("@", 1)
+        x0 = int(x0)
+        border = sobel_model.BORDER
+        with self.lock:
+            entry = self.images[name]
+            out, height, width = entry[:3]
+            if out is None:
+                out = entry[0] = np.zeros((height, width, frame.shape[2]), dtype=np.uint8)
+            lo, hi = x0 + border, min(x0 + W - border, width)
+            out[:, lo:hi] = frame[:, lo - x0:hi - x0]
+            entry[3] -= 1
+            if entry[3]:
+                return
+            del self.images[name]
+        out[:, width - border:] = 0
+        self.on_image(name, out)
+
+
+class RowRepair:
+    # frames that came back with damaged rows wait here while only those rows, with the
+    # BORDER input rows of context either side, go out again as bands named name#a:b that
+    # patch output rows a to b; the patched edge map goes on once every band is home
+    def __init__(self, on_frame, retries=RETRIES):
+        self.on_frame = on_frame
+        self.retries = retries
+        self.images = {}
+        self.bands = queue.Queue()
+        # frames and bands handed out and not back yet, the source stays open while any are
+        self.open = 0
+        self.resent = 0
+        self.repaired = 0
+        self.retried = 0
+        self.lock = threading.Lock()
+
+    def frames(self, frames):
+        for item in frames:
+            yield from self.queued()
+            with self.lock:
+                self.open += 1
+            yield item
+        while True:
+            try:
+                item = self.bands.get(timeout=0.1)
+            except queue.Empty:
+                with self.lock:
+                    if not self.open and self.bands.empty():
+                        return
+                continue
+            with self.lock:
+                self.open += 1
+            yield item
+
+    def queued(self):
+        while not self.bands.empty():
+            item = self.bands.get()
+            with self.lock:
+                self.open += 1
+            yield item
+
+    def band(self, name):
+        base, sep, span = name.rpartition("#")
+        if sep and base in self.images:
+            return base, tuple(map(int, span.split(":")))
+        return name, None
+
+    def done(self, name, frame):
+        self.damaged(name, None, frame, ())
+
+    def rows(self, on_rows):
+        # the rows of bands sent again are patched in before the frame is done
+        def rows(name, frame, stop):
+            if self.band(name)[1] is None:
+                on_rows(name, frame, stop)
+        return rows
+
+    def damaged(self, name, pixels, frame, rows):
+        with self.lock:
+            self.open -= 1
+            name, span = self.band(name)
+            if span is None and not rows:
+                whole = frame
+            elif span is None:
+                self.images[name] = [np.array(frame), pixels, {}, 0, name]
+                self.repaired += 1
+                self.resend(name, rows)
+                return
+            else:
+                entry = self.images[name]
+                a, b = span
+                y0 = max(a - sobel_model.BORDER, 0)
+                bad = {y0 + row for row in rows} & set(range(a, b))
+                good = [row for row in range(a, b) if row not in bad]
+                entry[0][good] = frame[[row - y0 for row in good]]
+                entry[3] -= 1
+                self.resend(name, sorted(bad))
+                if entry[3]:
+                    return
+                # under the name it came in with, which may carry more than the text
+                whole, _, _, _, name = self.images.pop(name)
+        self.on_frame(name, whole)
+
+    def resend(self, name, rows):
+        # a lost byte shifts every later row of its frame, so only the first row of a run is
+        # counted against the retries; the runs behind it are repaired as long as it moves on
+        out, pixels, tries, _, _ = entry = self.images[name]
+        for a, b in row_bands(rows):
+            tries[a] = tries.get(a, 0) + 1
+            if tries[a] > self.retries:
+                raise SystemExit(f"Row {a} of {name} still damaged after {self.retries} retries")
+            y0, y1 = max(a - sobel_model.BORDER, 0), min(b + sobel_model.BORDER, len(out))
+            entry[3] += 1
+            self.retried += 1
+            self.resent += b - a
+            self.bands.put((f"{name}#{a}:{b}", pixels[y0:y1]))
+
+
+class FrameSink:
+    # edge maps of a run over frame containers, written into one output container in input order;
+    # whole frames are received straight into their slot through target()
+    def __init__(self, path, shape):
+        self.path = path
+        self.frames = open_frames(path, shape)
+        self.slots = {}
+
+    def number(self, frames):
+        # names repeat across inputs with the same stem, so they get their slot in front
+        for name, pixels in frames:
+            name = f"{len(self.slots):05d}_{name}"
+            self.slots[name] = len(self.slots)
+            yield name, pixels
+
+    def target(self, name):
+        # the bands RowRepair sends again have no slot of their own
+        slot = self.slots.get(name)
+        return None if slot is None else self.frames[slot]
+
+    def on_frame(self, name, frame):
+        out = self.frames[self.slots[name]]
+        if not np.shares_memory(out, frame):
+            out[...] = frame
+
+    def close(self):
+        self.frames.flush()
+        print(f"Wrote {len(self.slots)} frames to {self.path}")
+
+
+def bitstream_tag():
+    # the last build next to this script is taken to be what the boards run
+    path = Path(__file__).resolve().parent / "build" / "sobel.bin"
+    return hashlib.blake2b(path.read_bytes(), digest_size=8).hexdigest() if path.exists() else ""
+
+
+class CacheName(str):
+    # the name of a frame the cache missed, carrying the entry its reply goes into; frames of
+    # one name can be out together and come back in any order
+    pass
+
+
+class FrameCache:
+    # on-disk LRU of edge maps, keyed on the bytes a frame sends and everything else that
+    # shapes its reply; entries are <key>.npy files and their mtime is their last use
+    def __init__(self, directory, max_bytes, config):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.config = config.encode()
+        directory.mkdir(parents=True, exist_ok=True)
+        stats = sorted(((path.stat(), path) for path in directory.glob("*.npy")), key=lambda entry: entry[0].st_mtime)
+        self.entries = OrderedDict((path, stat.st_size) for stat, path in stats)
+        self.size = sum(self.entries.values())
+        self.hits = 0
+        self.lock = threading.Lock()
+        self.evict()
+
+    def key(self, pixels):
+        digest = hashlib.blake2b(self.config, digest_size=16)
+        digest.update(str(pixels.shape).encode())
+        digest.update(np.ascontiguousarray(pixels))
+        return digest.hexdigest()
+
+    def filter(self, frames, on_frame):
+        # frames with a cached reply go to on_frame here and never reach the device
+        for name, pixels in frames:
+            path = self.directory / f"{self.key(pixels)}.npy"
+            try:
+                frame = np.load(path)
+            except (OSError, ValueError):
+                name = CacheName(name)
+                name.path = path
+                yield name, pixels
+                continue
+            with self.lock:
+                if path in self.entries:
+                    self.entries.move_to_end(path)
+            os.utime(path)
+            self.hits += 1
+            on_frame(name, frame)
+
+    def store(self, on_frame):
+        def stored(name, frame):
+            on_frame(name, frame)
+            self.put(name.path, frame)
+        return stored
+
+    def put(self, path, frame):
+        tmp = path.with_name(f"{path.stem}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, frame)
+        os.replace(tmp, path)
+        size = path.stat().st_size
+        with self.lock:
+            self.size += size - self.entries.pop(path, 0)
+            self.entries[path] = size
+            self.evict()
+
+    def evict(self):
+        # the newest entry always stays, even when it alone is over the limit
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            path, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def open_port(port, baud=BAUD):
+    ser = serial.Serial(port, baud, timeout=0.1, rtscts=False, dsrdtr=False, xonxoff=False)
+    try:
+        ser.dtr = ser.rts = False
+    except OSError:
+        # ptys such as the loopback stand-in have no modem control lines
+        pass
+    try:
+        # the FTDI bridge holds replies back up to 16 ms by default, which slows the credit down
+        ser.set_low_latency_mode(True)
+    except (AttributeError, OSError, ValueError):
+        pass
+    time.sleep(0.2)
+    ser.reset_input_buffer()
+    ser.reset_output_buffer()
+    return ser
+
+
+class SoftwarePort:
+    # drop-in for the serial port that runs the bit-exact pipeline model on the host
+    def __init__(self, timeout=0.1, gray_out=False, gray_in=False, binary=False):
+        self.timeout = timeout
+        out_bpp = sobel_model.PACKED if binary else 1 if gray_out else 3
+        self.model = sobel_model.FramedDevice(W, 1 if gray_in else 3, out_bpp)
+        self.rx = bytearray()
+        self.ready = threading.Condition()
+
+    def write(self, data):
+        reply = self.model.feed(data)
+        with self.ready:
+            self.rx.extend(reply)
+            self.ready.notify()
+        return len(data)
+
+    def read(self, size=1):
+        with self.ready:
+            self.ready.wait_for(lambda: self.rx, self.timeout)
+            chunk = bytes(self.rx[:size])
+            del self.rx[:size]
+        return chunk
+
+    def readinto(self, buf):
+        with self.ready:
+            self.ready.wait_for(lambda: self.rx, self.timeout)
+            n = min(len(buf), len(self.rx))
+            buf[:n] = self.rx[:n]
+            del self.rx[:n]
+        return n
+
+    @property
+    def in_waiting(self):
+        return len(self.rx)
+
+    def flush(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def to_image(frame):
+    # GRAY_OUT_P=1 and BINARY_OUT_P=1 bitstreams return one byte per pixel; widen it to the usual RGB image
+    if frame.shape[2] == 3:
+        return Image.fromarray(frame, "RGB")
+    return Image.fromarray(frame[..., 0], "L").convert("RGB")
+
+
+def write_png(frame, path):
+    to_image(frame).save(path)
+    return path
+
+
+class PngRows:
+    # an RGB PNG written as its rows come in: every write() is an IDAT chunk that ends on a
+    # zlib sync point, so a file cut short anywhere still decodes down to its last full chunk
+    def __init__(self, path, width, height):
+        self.file = open(path, "wb")
+        self.deflate = zlib.compressobj()
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self.chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data)))
+
+    def write(self, rows):
+        if rows.shape[2] == 1:
+            rows = np.repeat(rows, 3, axis=2)
+        # filter type 0 in front of every row
+        raw = np.zeros((rows.shape[0], rows.shape[1] * 3 + 1), dtype=np.uint8)
+        raw[:, 1:] = rows.reshape(rows.shape[0], -1)
+        self.chunk(b"IDAT", self.deflate.compress(raw.tobytes()) + self.deflate.flush(zlib.Z_SYNC_FLUSH))
+        self.file.flush()
+
+    def close(self):
+        self.chunk(b"IDAT", self.deflate.flush())
+        self.chunk(b"IEND", b"")
+        self.file.close()
+
+
+class PngStream:
+    # one PngRows per frame, fed by stream_frames' on_rows as the reply comes in; on_frame
+    # writes whatever is left, which is all of it for a frame that never streamed, such as
+    # a cache hit, and the repaired rows for one that was damaged
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def on_rows(self, name, frame, stop):
+        with self.lock:
+            entry = self.files.get(name)
+            if entry is None:
+                entry = self.files[name] = [PngRows(self.path(name), frame.shape[1], frame.shape[0]), 0]
+        out, done = entry
+        out.write(frame[done:stop])
+        entry[1] = stop
+
+    def on_frame(self, name, frame):
+        if name not in self.files:
+            self.on_rows(name, frame, frame.shape[0])
+        with self.lock:
+            out, done = self.files.pop(name)
+        if done < frame.shape[0]:
+            out.write(frame[done:])
+        out.close()
+        print(f"Wrote {self.path(name)}")
+
+
+def to_gray(frames):
+    # a GRAY_IN_P=1 bitstream skips rgb2gray, so the host applies the same shift approximation
+    # frames from gray containers go out as they are
+    for name, pixels in frames:
+        yield name, pixels if pixels.shape[2] == 1 else sobel_model.rgb2gray(pixels)[..., None]
+
+
+class TransferLog:
+    # timestamps of every serial chunk and frame boundary, summarised by report()
+    def __init__(self):
+        self.tx = []
+        self.rx = []
+        self.frames = []
+        self.statuses = {}
+
+    def sent(self, size):
+        self.tx.append((time.perf_counter(), size))
+
+    def received(self, size):
+        self.rx.append((time.perf_counter(), size))
+
+    def frame(self, name, reply_bytes):
+        self.frames.append((name, reply_bytes, time.perf_counter()))
+
+    def status(self, name, flags, damaged):
+        self.statuses[name] = (flags, damaged)
+
+    def report(self, **config):
+        tx_t, tx_n = log_arrays(self.tx)
+        rx_t, rx_n = log_arrays(self.rx)
+        # times are relative to the first frame being handed to the writer
+        origin = self.frames[0][2] if self.frames else 0.0
+        rx_total = np.cumsum(rx_n)
+
+        def arrival(offset):
+            # time the chunk holding byte offset (0-based) came in, None if it never did
+            k = np.searchsorted(rx_total, offset + 1)
+            return float(rx_t[k] - origin) if k < len(rx_t) else None
+
+        frames = []
+        replied = 0
+        for name, reply_bytes, began in self.frames:
+            replied += reply_bytes
+            complete = arrival(replied - 1)
+            flags, damaged = self.statuses.get(name, (None, None))
+            frames.append({
+                "name": name,
+                "tx_start_s": began - origin,
+                "complete_s": complete,
+                "latency_s": None if complete is None else complete - (began - origin),
+                "flags": flags,
+                "damaged_rows": damaged,
+            })
+        return {
+            "config": config,
+            "tx": leg_report(tx_t, tx_n, config["baud"]),
+            "rx": leg_report(rx_t, rx_n, config["baud"]),
+            "time_to_first_byte_s": arrival(0),
+            "time_to_first_edge_byte_s": arrival(sobel_model.HEADER_LEN),
+            "frames": frames,
+        }
+
+
+def log_arrays(log):
+    return np.array([t for t, _ in log], dtype=np.float64), np.array([n for _, n in log], dtype=np.int64)
+
+
+def leg_report(times, sizes, baud):
+    # one direction of the link: a chunk's bytes are counted from the previous chunk on, so
+    # the span starts at the first chunk and the first chunk's bytes are left out of the rate
+    total = int(sizes.sum())
+    span = float(times[-1] - times[0]) if len(times) > 1 else 0.0
+    effective = 10 * (total - int(sizes[0])) / span if span else None
+    gaps = np.diff(times) * 1e3
+    counts = np.histogram(gaps, bins=(0, *GAP_EDGES_MS, np.inf))[0] if len(gaps) else np.zeros(len(GAP_EDGES_MS) + 1)
+    return {
+        "bytes": total,
+        "chunks": len(sizes),
+        "span_s": span,
+        "effective_baud": effective,
+        "utilization": None if effective is None else effective / baud,
+        "gap_ms": {
+            "mean": float(gaps.mean()) if len(gaps) else None,
+            "max": float(gaps.max()) if len(gaps) else None,
+            "histogram": [{"le_ms": edge, "count": int(n)} for edge, n in zip((*GAP_EDGES_MS, None), counts)],
+        },
+    }
+
+
+class DeviceStalled(Exception):
+    # raised by stream_frames with the frames that were sent but never came back
+    def __init__(self, message, pending):
+        super().__init__(message)
+        self.pending = pending
+
+
+def recv_into(ser, view, failed, log=None, stall=None, progress=None):
+    # fill view in place, calling progress(got) as bytes come in; an empty read is a timeout,
+    # which only ends the wait once the writer has failed, or after stall seconds without a byte
+    got = 0
+    last = time.perf_counter()
+    while got < len(view):
+        # pyserial waits until the whole view is filled, so ask for what is there, or one byte,
+        # and the credit comes back as the reply does
+        n = ser.readinto(view[got:got + max(ser.in_waiting, 1)])
+        if n:
+            got += n
+            last = time.perf_counter()
+            if log:
+                log.received(n)
+            if progress:
+                progress(got)
+        elif failed.is_set() or (stall and time.perf_counter() - last > stall):
+            break
+    return got
+
+
+def with_crc(pixels):
+    # the rows of a frame as they go on the wire, each followed by its CRC-16 low byte first
+    rows = np.ascontiguousarray(pixels).reshape(pixels.shape[0], -1)
+    wire = np.empty((rows.shape[0], rows.shape[1] + sobel_model.CRC_LEN), dtype=np.uint8)
+    wire[:, :-sobel_model.CRC_LEN] = rows
+    wire[:, -sobel_model.CRC_LEN:] = sobel_model.rows_crc(rows).astype("<u2").view(np.uint8).reshape(-1, sobel_model.CRC_LEN)
+    return wire
+
+
+def damaged_rows(reply):
+    # output rows that failed their CRC on the way back, or whose CRC the device inverted
+    # because an input row they depend on failed on the way in
+    crc = np.ascontiguousarray(reply[:, -sobel_model.CRC_LEN:]).view("<u2")[:, 0]
+    return np.flatnonzero(sobel_model.rows_crc(reply[:, :-sobel_model.CRC_LEN]) != crc).tolist()
+
+
+def row_bands(rows):
+    # runs of rows, merged across gaps narrower than the context a band sends again anyway
+    bands = []
+    for row in rows:
+        if bands and row - bands[-1][1] < 2 * sobel_model.BORDER:
+            bands[-1][1] = row + 1
+        else:
+            bands.append([row, row + 1])
+    return bands
+
+
+class CreditWindow:
+    # host side of the flow control. Every stage between rx_fifo and frame_tx passes one token
+    # per token, so edge pixel p of a frame can only have left once the device took input token
+    # flush_len() + p from rx_fifo; the first flush_len() tokens it takes as soon as the previous
+    # frame's flush is out. The reply therefore proves how much of the input is gone, and the
+    # host keeps at most size bytes beyond that on the line, whatever the rates of the two legs.
+    # A frame only starts once all of the previous one is taken, so a frame that lost bytes is
+    # padded out by frame_rx's timeout instead of eating into the next one. lead is the config
+    # bytes sent in front of every header
+    def __init__(self, in_bpp, out_bpp, size=WINDOW, lead=0):
+        self.in_bpp = in_bpp
+        self.out_bpp = out_bpp
+        self.size = size
+        self.lead = lead
+        self.sent = 0
+        # wire bytes of the frames whose replies are complete, and proven taken in all
+        self.base = 0
+        self.proven = 0
+        self.fence = 0
+
+    def wire_len(self, height, width):
+        return self.lead + sobel_model.HEADER_LEN + height * (width * self.in_bpp + sobel_model.CRC_LEN)
+
+    def room(self):
+        if self.proven < self.fence:
+            return 0
+        return self.proven + self.size - self.sent
+
+    def reply(self, height, width, received):
+        # received is the bytes of the reply after its header; a packed byte goes out once its
+        # eighth pixel is in
+        row = sobel_model.row_len(width, self.out_bpp) + sobel_model.CRC_LEN
+        part = min(received % row, row - sobel_model.CRC_LEN)
+        part = min(part * 8, width) if self.out_bpp == sobel_model.PACKED else part // self.out_bpp
+        pixels = received // row * width + part
+        tokens = sobel_model.flush_len(width) + pixels
+        if tokens > width * height:
+            # a flush token, so the whole frame is in
+            self.proven = self.base + self.wire_len(height, width)
+            return
+        # a row's CRC is only known to be taken once the next row has started
+        crcs = max(tokens - 1, 0) // width
+        self.proven = self.base + self.lead + sobel_model.HEADER_LEN + tokens * self.in_bpp + crcs * sobel_model.CRC_LEN
+
+    def finish(self, height, width):
+        self.base += self.wire_len(height, width)
+        self.proven = self.base
+
+
+def stream_frames(ser, frames, on_frame, chunk=CHUNK, out_bpp=3, in_bpp=3, log=None, stall=None, target=None,
+                  on_damaged=None, on_rows=None, threshold=None):
+    # frames are (name, (height, width, in_bpp) array) pairs, width up to W; each goes out as
+    # SOF, width, height and its rows with their CRCs, and comes back as SOF, the frame's
+    # width and height, the rows of the edge map with their CRCs, the device's status and EOF. Writes go out as fast as the CreditWindow allows, so
+    # frame N+1 is written while frame N is still coming back, and rx_fifo never overruns
+    # whichever leg is slower. A frame is only taken from frames once there is room to send
+    # it, so several ports can share one source.
+    # Frames of the same size are received into one preallocated (height, width, out_bpp) array,
+    # which on_frame must not keep past its return, or into target(name) when that is given
+    # and not None.
+    # A frame with damaged rows goes to on_damaged(name, pixels, frame, rows) instead, with
+    # the good rows filled in; without it a damaged frame ends the run.
+    # Rows land in the frame as they come in, and on_rows(name, frame, stop) hears whenever
+    # more of them are final: rows [0, stop) passed their CRCs, up to the first one that failed.
+    # With out_bpp PACKED each frame is preceded by the config bytes that set threshold, and its
+    # rows are unpacked into one byte per pixel, 0 or 255.
+    lead = b"" if threshold is None else sobel_model.config(threshold)
+    sent = queue.Queue()
+    error = []
+    failed = threading.Event()
+    stop = threading.Event()
+    handoff = threading.Lock()
+    window = CreditWindow(in_bpp, out_bpp, lead=len(lead))
+    credit = threading.Condition()
+    source = iter(frames)
+
+    def wait_room():
+        with credit:
+            credit.wait_for(lambda: stop.is_set() or window.room() > 0)
+            return 0 if stop.is_set() else window.room()
+
+    def writer():
+        try:
+            def send(tx):
+                i = 0
+                while i < len(tx):
+                    size = min(chunk, len(tx) - i, wait_room())
+                    if not size:
+                        return
+                    ser.write(tx[i:i + size])
+                    window.sent += size
+                    if log:
+                        log.sent(size)
+                    i += size
+
+            while True:
+                window.fence = window.sent
+                if not wait_room():
+                    break
+                # a frame is either still in frames or in sent when a stall is handled
+                with handoff:
+                    item = None if stop.is_set() else next(source, None)
+                    if item is not None and item[1].shape[1] > W:
+                        raise SystemExit(f"{item[0]} is {item[1].shape[1]} pixels wide, the device takes up to {W}")
+                    if item is not None:
+                        sent.put(item)
+                if item is None:
+                    break
+                name, pixels = item
+                height, width = pixels.shape[:2]
+                if log:
+                    log.frame(name, sobel_model.HEADER_LEN + height * (sobel_model.row_len(width, out_bpp) + sobel_model.CRC_LEN) +
+                              sobel_model.TRAILER_LEN + 1)
+                send(lead + sobel_model.header(width, height))
+                send(memoryview(with_crc(pixels)).cast("B"))
+        except BaseException as exc:
+            error.append(exc)
+            failed.set()
+        finally:
+            sent.put(None)
+
+    threading.Thread(target=writer, daemon=True).start()
+
+    channels = out_bpp or 1
+    buffer = np.empty((0, 0, channels), dtype=np.uint8)
+    reply = np.empty((0, sobel_model.CRC_LEN), dtype=np.uint8)
+    reply_head = bytearray(sobel_model.HEADER_LEN)
+    reply_end = bytearray(sobel_model.TRAILER_LEN + 1)
+    count = 0
+    start = time.perf_counter()
+
+    def receive(view, progress=None):
+        return recv_into(ser, view, failed, log, stall, progress) == len(view)
+
+    def arrived(name, frame, height, width):
+        # credit for what the reply proves the device took, and the rows it completes
+        row_len = reply.shape[1]
+        rows = 0
+        intact = True
+
+        def progress(got):
+            nonlocal rows, intact
+            with credit:
+                window.reply(height, width, got)
+                credit.notify()
+            done = min(got // row_len, height)
+            if done <= rows:
+                return
+            frame.reshape(height, -1)[rows:done] = sobel_model.unpack(reply[rows:done, :-sobel_model.CRC_LEN], width, out_bpp)
+            if on_rows and intact:
+                bad = damaged_rows(reply[rows:done])
+                intact = not bad
+                stop = rows + bad[0] if bad else done
+                if stop > rows:
+                    on_rows(name, frame, stop)
+            rows = done
+        return progress
+
+    item = sent.get()
+    while item is not None:
+        name, pixels = item
+        height, width = pixels.shape[:2]
+        head = sobel_model.header(width, height)
+        frame = target(name) if target else None
+        if frame is None:
+            if buffer.shape[:2] != (height, width):
+                buffer = np.empty((height, width, channels), dtype=np.uint8)
+            frame = buffer
+        if reply.shape != (height, sobel_model.row_len(width, out_bpp) + sobel_model.CRC_LEN):
+            reply = np.empty((height, sobel_model.row_len(width, out_bpp) + sobel_model.CRC_LEN), dtype=np.uint8)
+            view = memoryview(reply).cast("B")
+        progress = arrived(name, frame, height, width)
+        # the previous reply is home, so the device is taking this frame's first tokens
+        progress(0)
+        if not receive(memoryview(reply_head)):
+            break
+        if reply_head != head:
+            raise SystemExit(f"Bad frame header {bytes(reply_head).hex()} after {count} frames")
+        if not receive(view, progress) or not receive(memoryview(reply_end)):
+            break
+        if reply_end[-1] != sobel_model.EOF:
+            raise SystemExit(f"Missing end of frame after {count} frames")
+        with credit:
+            window.finish(height, width)
+            credit.notify()
+        flags, rows = reply_end[0], damaged_rows(reply)
+        if log:
+            log.status(name, flags, len(rows))
+        if not rows:
+            on_frame(name, frame)
+        elif on_damaged:
+            on_damaged(name, pixels, frame, rows)
+        else:
+            raise SystemExit(f"{len(rows)} damaged rows in {name}, device flags {flags:#04x}")
+        count += 1
+        item = sent.get()
+    if error:
+        raise error[0]
+    if item is not None:
+        # the writer may be stuck on a port that no longer drains, so it is not waited for;
+        # it takes no new frame once stop is set, and everything it took is in sent
+        with credit:
+            stop.set()
+            credit.notify()
+        pending = [item]
+        with handoff:
+            while not sent.empty():
+                item = sent.get()
+                if item is not None:
+                    pending.append(item)
+        raise DeviceStalled(f"Device stopped sending after {count} frames", pending)
+    return count, time.perf_counter() - start
+
+
+def run_boards(ports, frames, on_frame, open_board, stall=STALL, logs=None, **options):
+    # one worker per board pulls from a shared queue, so a free board always takes the next
+    # frame; the frames a stalled board still owed go back on the queue for the others.
+    # A session ends whenever the queue runs dry, and workers start a new one until every
+    # frame is home, in case a stalled board hands work back late
+    work = queue.Queue()
+    lock = threading.Lock()
+    state = {"queued": 0, "finished": False}
+    stats = [{"port": port, "frames": 0, "seconds": 0.0, "failed": None} for port in ports]
+    errors = []
+
+    def feeder():
+        # a source that fails, such as an input that will not decode, ends the run like a
+        # failed worker; the workers stop once the queue is marked finished
+        try:
+            for item in frames:
+                with lock:
+                    state["queued"] += 1
+                work.put(item)
+        except BaseException as exc:
+            errors.append(exc)
+        finally:
+            with lock:
+                state["finished"] = True
+
+    def source():
+        while not errors:
+            try:
+                yield work.get(timeout=0.1)
+            except queue.Empty:
+                if state["finished"]:
+                    return
+
+    def complete(name, frame):
+        on_frame(name, frame)
+        with lock:
+            state["queued"] -= 1
+
+    def damaged(*args):
+        # a damaged frame is done here, its bands come back through frames as new work
+        options["on_damaged"](*args)
+        with lock:
+            state["queued"] -= 1
+
+    def worker(index):
+        port, stat = ports[index], stats[index]
+        # a board is only opened once there is work for it, so a run answered entirely
+        # from the cache never touches the device
+        while work.empty():
+            with lock:
+                if errors or state["finished"] and not state["queued"]:
+                    return
+            time.sleep(0.1)
+        with open_board(port) as ser:
+            while True:
+                with lock:
+                    if errors or state["finished"] and not state["queued"]:
+                        return
+                try:
+                    count, elapsed = stream_frames(ser, source(), complete, stall=stall,
+                                                   log=logs and logs[index],
+                                                   **dict(options, on_damaged=options.get("on_damaged") and damaged))
+                except DeviceStalled as exc:
+                    for item in exc.pending:
+                        work.put(item)
+                    stat["failed"] = str(exc)
+                    print(f"{port}: {exc}, retrying {len(exc.pending)} frames on the other boards")
+                    return
+                stat["frames"] += count
+                if count:
+                    stat["seconds"] += elapsed
+
+    def guarded(index):
+        # any other failure, a bad header for one, ends the run once the other boards are done
+        # with the frames they have on the wire; a SystemExit would otherwise vanish with its thread
+        try:
+            worker(index)
+        except BaseException as exc:
+            errors.append(exc)
+
+    threading.Thread(target=feeder, daemon=True).start()
+    workers = [threading.Thread(target=guarded, args=(index,), daemon=True) for index in range(len(ports))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    if errors:
+        raise errors[0]
+    if state["queued"] or not state["finished"]:
+        raise SystemExit("Every board stalled before all frames were processed")
+    return stats
+
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("port")
-    parser.add_argument("image", nargs="?", type=Path)
+    parser.add_argument("port", help="serial port, 'software' to run the bit-exact model on the host, "
+                        "or a comma separated list of either to share the frames between boards")
+    parser.add_argument("images", nargs="*", type=Path, help="images, directories of images, video files or "
+                        ".npy, .sbf, .rgb and .gray frame containers")
+    parser.add_argument("--out-dir", type=Path, help="write <name>_out.png per frame instead of sobel_out.png")
+    parser.add_argument("--out", type=Path, help="write every edge map into this .npy, .sbf, .rgb or .gray "
+                        "container instead, the inputs have to be containers of equally sized frames")
+    parser.add_argument("--chunk", type=int, default=CHUNK, help="bytes per serial write")
+    parser.add_argument("--baud", type=int, default=BAUD, help="line rate the bitstream was built with (make synth BAUD=...)")
+    parser.add_argument("--gray-out", action="store_true", help="bitstream built with GRAY_OUT_P=1, one byte per edge pixel")
+    parser.add_argument("--gray-in", action="store_true", help="bitstream built with GRAY_IN_P=1, send one gray byte per pixel")
+    parser.add_argument("--binary", action="store_true",
+                        help="bitstream built with BINARY_OUT_P=1, edge maps come back as one bit per pixel")
+    parser.add_argument("--threshold", type=int, default=THRESHOLD,
+                        help="with --binary, magnitude a pixel has to exceed to be an edge, 0 to 255")
+    parser.add_argument("--tile", action="store_true", help="keep full resolution and stream W wide column stripes")
+    parser.add_argument("--stall", type=float, default=STALL, help="seconds without a reply before a board's frames are retried elsewhere")
+    parser.add_argument("--report", help="timestamp every serial chunk and write a JSON transfer report here, '-' for stdout")
+    parser.add_argument("--cache", type=Path, help="keep edge maps in this directory and answer repeated frames from it")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE_MB, help="MB the cache may take before the least recently used entries go")
+    parser.add_argument("--cache-tag", help="bitstream version in the cache key, by default a hash of build/sobel.bin")
+    parser.add_argument("--retries", type=int, default=RETRIES,
+                        help="times damaged rows are sent again before the run gives up, 0 to give up on the first")
+    parser.add_argument("--stream", action="store_true",
+                        help="write each PNG row by row as the edge map comes in instead of once it is complete")
+    parser.add_argument("--jobs", type=int, default=min(4, os.cpu_count() or 1),
+                        help="processes that decode inputs and encode PNGs in batch mode, 0 to do it inline")
     args = parser.parse_args()
 
-    img_path = args.image or Path(__file__).parents[2] / "jupyter" / "mountain.jpg"
-    if not img_path.exists():
-        raise SystemExit("Image not found")
+    inputs = args.images or [Path(__file__).parents[2] / "jupyter" / "mountain.jpg"]
+    for path in inputs:
+        if not path.exists():
+            raise SystemExit(f"Image not found: {path}")
 
-    tx = Image.open(img_path).convert("RGB").resize((W, H), Image.BILINEAR).tobytes()
-    rx_buf = bytearray()
-    stop = threading.Event()
+    single = len(inputs) == 1 and inputs[0].is_file() and inputs[0].suffix.lower() not in VIDEO_SUFFIXES | FRAME_SUFFIXES
+    out_bpp = sobel_model.PACKED if args.binary else 1 if args.gray_out else 3
+    in_bpp = 1 if args.gray_in else 3
+    if not 0 <= args.threshold <= 255:
+        raise SystemExit("--threshold takes 0 to 255")
+    threshold = args.threshold if args.binary else None
 
-    def reader():
-        while not stop.is_set() and len(rx_buf) < len(tx):
-            chunk = ser.read(min(4096, len(tx) - len(rx_buf)))
-            if chunk:
-                rx_buf.extend(chunk)
-            else:
-                time.sleep(0.002)
+    paths = list(expand(inputs))
+    containers = [(path, open_frames(path)) for path in paths if path.suffix.lower() in FRAME_SUFFIXES]
+    for path, frames in containers:
+        if frames.shape[3] == 1 and not args.gray_in:
+            raise SystemExit(f"{path} holds gray frames, which need a GRAY_IN_P=1 bitstream and --gray-in")
+        if frames.shape[2] > W and not args.tile:
+            raise SystemExit(f"{path} holds {frames.shape[2]} pixel wide frames, the device takes up to {W} or --tile")
+    sink = None
+    if args.out is not None:
+        shapes = {frames.shape[1:3] for path, frames in containers}
+        if len(containers) != len(paths) or len(shapes) != 1:
+            raise SystemExit("--out needs frame containers of equally sized frames as inputs")
+        (height, width), = shapes
+        sink = FrameSink(args.out, (sum(len(frames) for path, frames in containers), height, width, out_bpp or 1))
 
-    with serial.Serial(args.port, BAUD, timeout=0.1, rtscts=False, dsrdtr=False, xonxoff=False) as ser:
-        ser.dtr = ser.rts = False
-        time.sleep(0.2)
-        ser.reset_input_buffer()
-        ser.reset_output_buffer()
+    out_dir = args.out_dir
+    if out_dir is None and not single and sink is None:
+        out_dir = Path("sobel_out")
+    if out_dir is not None:
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+    # in batch mode decoding and PNG encoding run in a process pool, so the serial stage
+    # never waits on them; spawn, because the pool grows while the transfer threads run
+    if args.stream and (args.tile or sink is not None):
+        raise SystemExit("--stream writes PNGs; --out containers fill row by row anyway and --tile stitches whole stripes")
+    pool = None
+    if args.jobs and not single and sink is None:
+        pool = ProcessPoolExecutor(args.jobs, mp_context=multiprocessing.get_context("spawn"))
+    # encodes still in the pool; a full pool holds the reader back instead of piling up frames
+    encoding = threading.Semaphore(2 * args.jobs)
+    written = []
+
+    def wrote(future):
+        encoding.release()
+        if not future.exception():
+            print(f"Wrote {future.result()}")
+
+    def out_path(name):
+        return out_dir / f"{name}_out.png" if out_dir is not None else Path("sobel_out.png")
+
+    def save(name, frame):
+        out = out_path(name)
+        if pool is None:
+            print(f"Wrote {write_png(frame, out)}")
+            return
+        encoding.acquire()
+        # the receive buffer is reused for the next frame, so the pool gets a copy
+        future = pool.submit(write_png, np.array(frame), out)
+        future.add_done_callback(wrote)
+        written.append(future)
+
+    frames = iter_frames(inputs, not args.tile, pool)
+    if pool:
+        frames = decode_ahead(frames, args.jobs)
+    on_frame, on_rows = save, None
+    if args.stream:
+        png = PngStream(out_path)
+        on_frame, on_rows = png.on_frame, png.on_rows
+    if sink:
+        frames, on_frame = sink.number(frames), sink.on_frame
+    if args.gray_in:
+        frames = to_gray(frames)
+    if args.tile:
+        stitcher = Stitcher(on_frame)
+        frames, on_frame = stitcher.split(frames), stitcher.on_frame
+    cache = None
+    if args.cache:
+        tag = bitstream_tag() if args.cache_tag is None else args.cache_tag
+        cache = FrameCache(args.cache, args.cache_size << 20, f"{W} {in_bpp} {out_bpp} {threshold} {tag}")
+        frames, on_frame = cache.filter(frames, on_frame), cache.store(on_frame)
+    # pixels of the frames the boards get, for the rate limit at the end
+    pixels_sent = [0]
+
+    def counted(frames):
+        for name, pixels in frames:
+            pixels_sent[0] += pixels.shape[0] * pixels.shape[1]
+            yield name, pixels
+
+    frames = counted(frames)
+    repair = None
+    if args.retries:
+        repair = RowRepair(on_frame, args.retries)
+        frames, on_frame = repair.frames(frames), repair.done
+        on_rows = on_rows and repair.rows(on_rows)
+    frames = prefetch(frames)
+    ports = args.port.split(",")
+
+    def open_board(port):
+        if port == "software":
+            return SoftwarePort(gray_out=args.gray_out, gray_in=args.gray_in, binary=args.binary)
+        return open_port(port, args.baud)
+
+    logs = [TransferLog() for port in ports] if args.report else None
+    start = time.perf_counter()
+    stats = run_boards(ports, frames, on_frame, open_board, args.stall, logs,
+                       chunk=args.chunk, out_bpp=out_bpp, in_bpp=in_bpp, threshold=threshold,
+                       target=sink.target if sink and not args.tile else None,
+                       on_damaged=repair and repair.damaged, on_rows=on_rows)
+    for future in written:
+        future.result()
+    if pool:
+        pool.shutdown()
+    if sink:
+        sink.close()
+    if cache:
+        print(f"{cache.hits} frames answered from {args.cache}")
+    if repair and repair.repaired:
+        print(f"Resent {repair.resent} damaged rows of {repair.repaired} frames")
+    elapsed = time.perf_counter() - start
+    # bands sent again are not frames of their own
+    count = sum(stat["frames"] for stat in stats) - (repair.retried if repair else 0)
 
-        threading.Thread(target=reader, daemon=True).start()
-        
-        for i in range(0, len(tx), 2048):
-            ser.write(tx[i:i+2048])
-            ser.flush()
+    if logs:
+        reports = [log.report(baud=args.baud, chunk=args.chunk, max_width=W, tile=args.tile,
+                              in_bpp=in_bpp, out_bpp=out_bpp, threshold=threshold, **stat)
+                   for log, stat in zip(logs, stats)]
+        report = reports[0] if len(ports) == 1 else {"devices": reports}
+        if args.report == "-":
+            print(json.dumps(report, indent=2))
+        else:
+            Path(args.report).write_text(json.dumps(report, indent=2) + "\n")
 
-        while len(rx_buf) < len(tx):
-            time.sleep(0.01)
-        stop.set()
+    if len(ports) > 1:
+        for stat in stats:
+            rate = stat["frames"] / stat["seconds"] if stat["seconds"] else 0.0
+            note = f", stalled: {stat['failed']}" if stat["failed"] else ""
+            print(f"{stat['port']}: {stat['frames']} frames in {stat['seconds']:.1f} s, {rate:.4f} frames/s{note}")
 
-    warmup = (2 * W + 2) * 3
-    Image.frombytes("RGB", (W, H), bytes(rx_buf[warmup:]) + b"\x00" * warmup).save("sobel_out.png")
-    print("Wrote sobel_out.png")
+    if count and not single and not args.tile and "software" not in ports:
+        # tx and rx overlap, so each frame costs the busier leg's bytes as 10-bit UART characters
+        limit = len(ports) * args.baud / 10 / (pixels_sent[0] / count * max(in_bpp, out_bpp or 1 / 8))
+        fps = count / elapsed
+        print(f"{count} frames in {elapsed:.1f} s: {fps:.4f} frames/s sustained, "
+              f"limit {limit:.4f} frames/s at {args.baud} baud on {len(ports)} board(s) ({100 * fps / limit:.1f}%)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
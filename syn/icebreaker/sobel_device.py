@@ -0,0 +1,233 @@
+"""Asyncio client for the framed sobel bitstream.
+
+    async with SobelDevice("/dev/ttyUSB1") as device:
+        edges = await device.process(rgb)          # (h, w, 3) -> (h, w), w <= 640
+        async for edges in device.stream(frames):  # in order, several in flight
+            ...
+
+The serial port is driven through non-blocking pipe transports on its file
+descriptor, so no thread is tied up per request. ``"software"`` as the port
+runs the bit-exact model in process instead. Rows that come back damaged are
+sent again as bands, as sobel.RowRepair does, before ``process`` returns.
+With ``binary`` the board is a BINARY_OUT_P=1 build and edge maps come back
+as 0 or 255 for magnitudes up to or above ``threshold``.
+"""
+
+import asyncio
+import os
+from collections import deque
+
+import numpy as np
+
+import sobel
+import sobel_model
+
+
+class SoftwareLink:
+    # stands in for the serial transports: replies land in the reader as soon as bytes are written
+    def __init__(self, reader, in_bpp, out_bpp):
+        self.reader = reader
+        self.model = sobel_model.FramedDevice(sobel.W, in_bpp, out_bpp)
+
+    def write(self, data):
+        reply = self.model.feed(data)
+        if reply:
+            self.reader.feed_data(reply)
+
+    async def drain(self):
+        await asyncio.sleep(0)
+
+    def close(self):
+        self.reader.feed_eof()
+
+
+class SobelDevice:
+    """One board, or the software model, behind an asyncio API.
+
+    ``process`` queues a frame and resolves to its edge map; up to
+    ``max_queued`` frames wait in the client. Frames go out at their own
+    size, up to ``width``, the LINE_W_P the bitstream was built with. Writes are held to the same
+    ``sobel.CreditWindow`` as ``sobel.stream_frames``, so frames follow each
+    other back to back and rx_fifo never overruns. After ``stall`` seconds
+    without a reply byte every frame still owed fails with ConnectionError.
+    """
+
+    def __init__(self, port, width=sobel.W, gray_in=False, gray_out=False, chunk=sobel.CHUNK, max_queued=4,
+                 retries=sobel.RETRIES, baud=sobel.BAUD, binary=False, threshold=sobel.THRESHOLD,
+                 stall=sobel.STALL):
+        self.port = port
+        self.baud = baud
+        self.width = width
+        self.gray_in = gray_in
+        self.in_bpp = 1 if gray_in else 3
+        self.out_bpp = sobel_model.PACKED if binary else 1 if gray_out else 3
+        # the threshold goes out in front of every header
+        self.lead = sobel_model.config(threshold) if binary else b""
+        self.chunk = chunk
+        self.retries = retries
+        self.stall = stall
+        self.queue = asyncio.Queue(maxsize=max_queued)
+        self.window = sobel.CreditWindow(self.in_bpp, self.out_bpp, lead=len(self.lead))
+        self.credit = asyncio.Condition()
+        self.replies = asyncio.Queue()
+        self.error = None
+        self.ser = None
+        self.tasks = []
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.reader = asyncio.StreamReader()
+        if self.port == "software":
+            self.writer = SoftwareLink(self.reader, self.in_bpp, self.out_bpp)
+        else:
+            # pyserial sets up the line, the transports do the I/O on duplicates of its descriptor
+            self.ser = sobel.open_port(self.port, self.baud)
+            rx = os.fdopen(os.dup(self.ser.fileno()), "rb", buffering=0)
+            tx = os.fdopen(os.dup(self.ser.fileno()), "wb", buffering=0)
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(self.reader), rx)
+            transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, tx)
+            self.writer = asyncio.StreamWriter(transport, protocol, None, loop)
+        self.tasks = [asyncio.create_task(self.send_loop()), asyncio.create_task(self.recv_loop())]
+        return self
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.fail(ConnectionError("SobelDevice closed"))
+        self.writer.close()
+        if self.ser is not None:
+            self.ser.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def process(self, frame):
+        """Edge map of one (h, w, 3) RGB frame, or (h, w) gray frame with gray_in, w up to width."""
+        if self.error:
+            raise self.error
+        frame = np.asarray(frame, dtype=np.uint8)
+        if frame.ndim == 3 and self.gray_in:
+            frame = sobel_model.rgb2gray(frame)
+        channels = () if self.gray_in else (3,)
+        if frame.ndim != 2 + len(channels) or frame.shape[2:] != channels or frame.shape[1] > self.width:
+            raise ValueError(f"Expected a (h, w{', 3' * len(channels)}) frame with w up to {self.width}, got {frame.shape}")
+        edges, rows = await self.send(frame)
+        tries = {}
+        while rows:
+            # the damaged rows go out again with BORDER rows of context, see sobel.RowRepair
+            bands = []
+            for a, b in sobel.row_bands(rows):
+                tries[a] = tries.get(a, 0) + 1
+                if tries[a] > self.retries:
+                    raise ConnectionError(f"Row {a} still damaged after {self.retries} retries")
+                bands.append((a, b, max(a - sobel_model.BORDER, 0)))
+            replies = await asyncio.gather(*(self.send(frame[y0:b + sobel_model.BORDER]) for a, b, y0 in bands))
+            rows = []
+            for (a, b, y0), (band, bad) in zip(bands, replies):
+                bad = {y0 + row for row in bad} & set(range(a, b))
+                good = [row for row in range(a, b) if row not in bad]
+                edges[good] = band[[row - y0 for row in good]]
+                rows.extend(sorted(bad))
+        return edges
+
+    async def send(self, frame):
+        # edge map and damaged rows of one pass over the wire
+        done = asyncio.get_running_loop().create_future()
+        await self.queue.put((np.ascontiguousarray(frame), done))
+        return await done
+
+    async def stream(self, frames, depth=2):
+        """Edge maps of a sync or async iterable of frames, in order, with depth frames queued."""
+        pending = deque()
+        if hasattr(frames, "__aiter__"):
+            async for frame in frames:
+                pending.append(asyncio.ensure_future(self.process(frame)))
+                if len(pending) > depth:
+                    yield await pending.popleft()
+        else:
+            for frame in frames:
+                pending.append(asyncio.ensure_future(self.process(frame)))
+                if len(pending) > depth:
+                    yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+
+    async def send_loop(self):
+        try:
+            while True:
+                frame, done = await self.queue.get()
+                if done.cancelled():
+                    continue
+                self.replies.put_nowait((frame.shape[:2], done))
+                self.window.fence = self.window.sent
+                tx = self.lead + sobel_model.header(frame.shape[1], frame.shape[0]) + sobel.with_crc(frame).tobytes()
+                i = 0
+                while i < len(tx):
+                    async with self.credit:
+                        await self.credit.wait_for(lambda: self.window.room() > 0)
+                        size = min(self.chunk, len(tx) - i, self.window.room())
+                    self.writer.write(tx[i:i + size])
+                    self.window.sent += size
+                    i += size
+                    await self.writer.drain()
+        except Exception as exc:
+            self.fail(exc)
+
+    async def proven(self, height, width, received):
+        async with self.credit:
+            self.window.reply(height, width, received)
+            self.credit.notify()
+
+    async def read(self, read):
+        # a read of the reply, given up after stall seconds without a byte
+        try:
+            return await asyncio.wait_for(read, self.stall or None)
+        except asyncio.TimeoutError as exc:
+            raise ConnectionError(f"No reply from {self.port} for {self.stall} s") from exc
+
+    async def recv_loop(self):
+        try:
+            while True:
+                (height, width), done = await self.replies.get()
+                size = height * (sobel_model.row_len(width, self.out_bpp) + sobel_model.CRC_LEN)
+                # the previous reply is home, so the device is taking this frame's first tokens
+                await self.proven(height, width, 0)
+                head = await self.read(self.reader.readexactly(sobel_model.HEADER_LEN))
+                if head != sobel_model.header(width, height):
+                    raise ConnectionError(f"Bad frame header {head.hex()}")
+                body = bytearray()
+                while len(body) < size:
+                    data = await self.read(self.reader.read(size - len(body)))
+                    if not data:
+                        raise asyncio.IncompleteReadError(bytes(body), size)
+                    body += data
+                    await self.proven(height, width, len(body))
+                if (await self.read(self.reader.readexactly(sobel_model.TRAILER_LEN + 1)))[-1] != sobel_model.EOF:
+                    raise ConnectionError("Missing end of frame")
+                async with self.credit:
+                    self.window.finish(height, width)
+                    self.credit.notify()
+                reply = np.frombuffer(body, dtype=np.uint8).reshape(height, -1)
+                if self.out_bpp == sobel_model.PACKED:
+                    edges = sobel_model.unpack(reply[:, :-sobel_model.CRC_LEN], width, self.out_bpp)
+                else:
+                    edges = reply[:, :-sobel_model.CRC_LEN:self.out_bpp].copy()
+                if not done.done():
+                    done.set_result((edges, sobel.damaged_rows(reply)))
+        except Exception as exc:
+            if not done.done():
+                done.set_exception(exc)
+            self.fail(exc)
+
+    def fail(self, exc):
+        # every frame still queued or on the wire gets the error, and so does any later process()
+        self.error = self.error or exc
+        for queue in (self.replies, self.queue):
+            while not queue.empty():
+                done = queue.get_nowait()[1]
+                if not done.done():
+                    done.set_exception(exc)
@@ -0,0 +1,212 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+import sobel
+import sobel_model
+from loopback import Loopback
+from sobel_device import SobelDevice
+
+
+def random_frame(height, width, seed):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def run_software(frames, ports=("software",)):
+    # every edge map run_boards hands back, by name, on the software model
+    done = {}
+    lock = threading.Lock()
+
+    def on_frame(name, frame):
+        with lock:
+            done.setdefault(name, []).append(frame.copy())
+
+    sobel.run_boards(list(ports), frames, on_frame, lambda port: sobel.SoftwarePort())
+    return done
+
+
+@pytest.mark.parametrize("ports", [("software",), ("software", "software")])
+def test_failing_source(ports):
+    # a frame source that raises ends the run with its error instead of leaving the boards waiting
+    def frames():
+        yield "good", random_frame(6, 8, 1)
+        raise ValueError("cannot decode")
+
+    # run on a thread of its own, so a regression fails here instead of hanging the suite
+    raised = []
+
+    def run():
+        try:
+            run_software(frames(), ports)
+        except BaseException as exc:
+            raised.append(exc)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive(), "run_boards still waiting on a source that failed"
+    assert len(raised) == 1 and isinstance(raised[0], ValueError), raised
+
+
+def test_cache_repeated_names(tmp_path):
+    # the same image twice and another of the same name on a cold cache, then again answered
+    # from it; every frame comes back as the device sent it, and each is stored under its own key
+    frames = [("a", random_frame(6, 8, 1)), ("b", random_frame(5, 7, 2)), ("a", random_frame(6, 8, 1)),
+              ("a", random_frame(7, 9, 3))]
+    expected = run_software(iter(frames))
+    for hits in (0, len(frames)):
+        cache = sobel.FrameCache(tmp_path, 1 << 20, "test")
+        done = {}
+
+        def keep(name, frame):
+            done.setdefault(name, []).append(frame.copy())
+
+        sobel.run_boards(["software"], cache.filter(iter(frames), keep), cache.store(keep),
+                         lambda port: sobel.SoftwarePort())
+        assert cache.hits == hits
+        assert len(list(tmp_path.glob("*.npy"))) == 3
+        for name, frames_back in expected.items():
+            assert len(done[name]) == len(frames_back)
+            for got, exp in zip(done[name], frames_back):
+                np.testing.assert_array_equal(got, exp)
+
+
+DEVICE_FRAMES = [random_frame(6, 8, 1), random_frame(5, 7, 2), random_frame(9, 16, 3), random_frame(6, 8, 4)]
+
+
+def run_device(body, **options):
+    async def run():
+        async with SobelDevice("software", **options) as device:
+            return await asyncio.wait_for(body(device), 30)
+
+    return asyncio.run(run())
+
+
+def test_device_process():
+    async def body(device):
+        return [await device.process(frame) for frame in DEVICE_FRAMES]
+
+    for got, frame in zip(run_device(body), DEVICE_FRAMES):
+        np.testing.assert_array_equal(got, sobel_model.frame(frame))
+
+
+@pytest.mark.parametrize("source", ["sync", "async"])
+def test_device_stream(source):
+    async def frames():
+        for frame in DEVICE_FRAMES:
+            await asyncio.sleep(0)
+            yield frame
+
+    async def body(device):
+        return [edges async for edges in device.stream(iter(DEVICE_FRAMES) if source == "sync" else frames())]
+
+    got = run_device(body)
+    assert len(got) == len(DEVICE_FRAMES)
+    for edges, frame in zip(got, DEVICE_FRAMES):
+        np.testing.assert_array_equal(edges, sobel_model.frame(frame))
+
+
+def test_device_binary():
+    async def body(device):
+        return [edges async for edges in device.stream(DEVICE_FRAMES)]
+
+    for got, frame in zip(run_device(body, binary=True, threshold=40), DEVICE_FRAMES):
+        np.testing.assert_array_equal(got, sobel_model.threshold(sobel_model.frame(frame), 40))
+
+
+def test_device_gray_in():
+    # RGB frames are made gray on the host, the way rgb2gray does it on the board
+    async def body(device):
+        return [edges async for edges in device.stream(DEVICE_FRAMES)]
+
+    for got, frame in zip(run_device(body, gray_in=True), DEVICE_FRAMES):
+        np.testing.assert_array_equal(got, sobel_model.frame(frame))
+
+
+def test_device_stall():
+    # a device that stops answering fails the frames it owes, and every later one, instead of hanging
+    async def run():
+        async with SobelDevice("software", stall=0.2) as device:
+            device.writer.write = lambda data: None
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(device.process(random_frame(6, 8, 1)), 30)
+            with pytest.raises(ConnectionError):
+                await device.process(random_frame(6, 8, 2))
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("drop", [0.0, 0.001])
+def test_loopback(drop):
+    # the stand-in paces the line and overruns rx_fifo the way the board does, so the credit window
+    # has to hold; with bytes lost on the way in, RowRepair sends the damaged rows again until the
+    # edge maps are whole
+    frames = [(f"f{index}", random_frame(height, width, index))
+              for index, (height, width) in enumerate([(24, 32), (20, 17), (24, 32), (31, 40), (12, 9)])]
+    done = {}
+
+    def keep(name, frame):
+        done[name] = frame.copy()
+
+    repair = sobel.RowRepair(keep)
+    with Loopback(drop=drop, seed=5) as lb:
+        sobel.run_boards([lb.port], repair.frames(iter(frames)), repair.done, sobel.open_port,
+                         on_damaged=repair.damaged)
+    assert lb.stats["overruns"] == 0, lb.stats
+    assert bool(lb.stats["dropped"]) == bool(drop) and bool(repair.repaired) == bool(drop), lb.stats
+    assert sorted(done) == sorted(name for name, _ in frames)
+    for name, frame in frames:
+        # the board sends each edge pixel three times, as R, G and B
+        np.testing.assert_array_equal(done[name], np.repeat(sobel_model.frame(frame)[..., None], 3, axis=2))
+
+
+def window_replies(height, width, in_bpp, out_bpp, lead=b""):
+    # (reply bytes after the header, wire bytes the device has taken by then) for every length of
+    # the reply. Nothing but the reply holds the pipeline up, so a byte is taken at the latest once
+    # all the reply the bytes before it make has left
+    shape = (height, width, 3) if in_bpp == 3 else (height, width)
+    frame = np.random.default_rng(width).integers(0, 256, shape, dtype=np.uint8)
+    tx = lead + sobel_model.header(width, height) + sobel.with_crc(frame).tobytes()
+    device = sobel_model.FramedDevice(sobel.W, in_bpp, out_bpp)
+    before = [0]
+    for i in range(len(tx) - 1):
+        before.append(before[-1] + len(device.feed(tx[i:i + 1])))
+    body = height * (sobel_model.row_len(width, out_bpp) + sobel_model.CRC_LEN)
+    for received in range(body + 1):
+        yield received, max(n + 1 for n, out in enumerate(before) if out <= sobel_model.HEADER_LEN + received)
+
+
+def check_window(height, width, in_bpp, out_bpp, lead=b""):
+    window = sobel.CreditWindow(in_bpp, out_bpp, lead=len(lead))
+    for received, taken in window_replies(height, width, in_bpp, out_bpp, lead):
+        window.reply(height, width, received)
+        assert window.proven <= taken, (received, window.proven, taken)
+    # the whole reply proves the whole frame
+    assert window.proven == window.wire_len(height, width) == taken
+    return window
+
+
+@pytest.mark.parametrize("height, width", [(1, 8), (2, 4), (2, 17)])
+def test_window_short_frame(height, width):
+    # fewer pixels than flush_len(), so frame_tx drops every token without a byte of reply
+    assert height * width < sobel_model.flush_len(width)
+    window = sobel.CreditWindow(3, 3)
+    window.reply(height, width, 0)
+    assert window.proven == window.wire_len(height, width)
+    check_window(height, width, 3, 3)
+
+
+@pytest.mark.parametrize("in_bpp, out_bpp", [(3, 3), (3, 1), (1, 3), (1, 1)])
+@pytest.mark.parametrize("height, width", [(6, 8), (9, 5)])
+def test_window_rows(height, width, in_bpp, out_bpp):
+    # every length of the reply, so received lands on each byte of every row's CRC
+    check_window(height, width, in_bpp, out_bpp)
+
+
+@pytest.mark.parametrize("in_bpp", [3, 1])
+@pytest.mark.parametrize("height, width", [(6, 8), (7, 13), (5, 20)])
+def test_window_packed(height, width, in_bpp):
+    # one reply byte covers eight pixels, or what is left of the row
+    check_window(height, width, in_bpp, sobel_model.PACKED, sobel_model.config(40))